@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from domain.models import Product
+from domain.services import AsyncWarehouseService, WarehouseService
+from infrastructure.async_repositories import (AsyncSqlAlchemyOrderRepository,
+                                               AsyncSqlAlchemyProductRepository)
+from infrastructure.database import create_async_warehouse_engine, create_warehouse_engine
+from infrastructure.migrations import migrate
+from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from infrastructure.unit_of_work import AsyncSqlAlchemyUnitOfWork, SqlAlchemyUnitOfWork
+
+
+def _plan_requests(count: int, write_ratio: float, products: int, random_seed: int = 0):
+    rng = random.Random(random_seed)
+    return [
+        ("write" if rng.random() < write_ratio else "read",
+         rng.sample(range(1, products + 1), 3))
+        for _ in range(count)
+    ]
+
+
+def seed(path: Path, products: int, orders: int) -> None:
+    engine = create_warehouse_engine(f"sqlite:///{path}")
+    migrate(engine)
+    session = sessionmaker(bind=engine)()
+    service = WarehouseService(SqlAlchemyProductRepository(session),
+                               SqlAlchemyOrderRepository(session),
+                               SqlAlchemyUnitOfWork(session))
+    service.import_products(Product(id=None, name=f"Product {i}", quantity=1000, price=1.0)
+                            for i in range(products))
+    for i in range(orders):
+        service.create_order([i % products + 1], f"Address {i}")
+    session.close()
+    engine.dispose()
+
+
+def run_sync(path: Path, requests, concurrency: int) -> float:
+    engine = create_warehouse_engine(f"sqlite:///{path}", pool_size=concurrency)
+    session_factory = sessionmaker(bind=engine)
+
+    def handle(request):
+        kind, product_ids = request
+        with session_factory() as session:
+            service = WarehouseService(SqlAlchemyProductRepository(session),
+                                       SqlAlchemyOrderRepository(session),
+                                       SqlAlchemyUnitOfWork(session))
+            if kind == "write":
+                service.create_order(product_ids, "Load test")
+            else:
+                service.get_order(product_ids[0])
+                service.list_products_page(after_id=product_ids[1], limit=20)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(handle, requests))
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return len(requests) / elapsed
+
+
+async def run_async(path: Path, requests, concurrency: int) -> float:
+    engine = create_async_warehouse_engine(f"sqlite+aiosqlite:///{path}", pool_size=concurrency)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handle(request):
+        kind, product_ids = request
+        async with semaphore, session_factory() as session:
+            service = AsyncWarehouseService(AsyncSqlAlchemyProductRepository(session),
+                                            AsyncSqlAlchemyOrderRepository(session),
+                                            AsyncSqlAlchemyUnitOfWork(session))
+            if kind == "write":
+                await service.create_order(product_ids, "Load test")
+            else:
+                await service.get_order(product_ids[0])
+                await service.list_products_page(after_id=product_ids[1], limit=20)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(request) for request in requests))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return len(requests) / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare concurrent request throughput of the sync and async stacks")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--products", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    requests = _plan_requests(args.requests, args.write_ratio, args.products)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "warehouse.db"
+        seed(path, args.products, orders=args.products)
+        sync_rate = run_sync(path, requests, args.concurrency)
+        async_rate = asyncio.run(run_async(path, requests, args.concurrency))
+
+    print(f" sync: {sync_rate:10.0f} requests/sec")
+    print(f"async: {async_rate:10.0f} requests/sec")
+    print(f"ratio: {async_rate / sync_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
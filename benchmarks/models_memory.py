@@ -0,0 +1,59 @@
+import argparse
+import gc
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+from domain.models import Product, ProductBatch
+
+
+@dataclass
+class DictProduct:
+    # The pre-slots Product layout, kept here as the baseline.
+    id: int
+    name: str
+    quantity: int
+    price: float
+    is_active: bool = field(default=True)
+
+
+def _measure(build, rows: int):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(rows)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def build_dict_products(rows: int):
+    return [DictProduct(i, "Product", i, 1.5) for i in range(rows)]
+
+
+def build_slotted_products(rows: int):
+    return [Product(i, "Product", i, 1.5) for i in range(rows)]
+
+
+def build_product_batch(rows: int):
+    return ProductBatch.from_rows((i, i, 1.5) for i in range(rows))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare memory and build time of the product representations")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    for label, build in (("dataclass", build_dict_products),
+                         ("slotted dataclass", build_slotted_products),
+                         ("ProductBatch", build_product_batch)):
+        elapsed, peak = _measure(build, args.rows)
+        print(f"{label:>18}: {peak / 1024 / 1024:8.1f} MiB, {elapsed:6.2f}s "
+              f"for {args.rows} rows")
+
+
+if __name__ == "__main__":
+    main()
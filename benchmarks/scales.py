@@ -0,0 +1,17 @@
+import argparse
+
+# Kept apart from the suite so that the command line can offer these without importing
+# SQLAlchemy. name: (products, orders)
+SCALES = {
+    "small": (1_000, 10_000),
+    "medium": (100_000, 1_000_000),
+    "large": (1_000_000, 1_000_000),
+}
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--scale", choices=list(SCALES), action="append",
+                        help="dataset size to benchmark, may be repeated (default: small)")
+    parser.add_argument("--runs", type=int, default=100,
+                        help="repetitions of each single-row operation")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
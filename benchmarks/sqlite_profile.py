@@ -0,0 +1,48 @@
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy.orm import sessionmaker
+
+from domain.services import WarehouseService
+from infrastructure.database import SQLITE_PROFILES, create_warehouse_engine
+from infrastructure.migrations import migrate
+from infrastructure.repositories import SqlAlchemyProductRepository, SqlAlchemyOrderRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+
+def measure_write_throughput(profile: str, transactions: int, directory: Path) -> float:
+    engine = create_warehouse_engine(f"sqlite:///{directory / f'{profile}.db'}", profile)
+    migrate(engine)
+    session = sessionmaker(bind=engine)()
+    service = WarehouseService(SqlAlchemyProductRepository(session),
+                               SqlAlchemyOrderRepository(session),
+                               SqlAlchemyUnitOfWork(session))
+    started = time.perf_counter()
+    for i in range(transactions):
+        service.create_product(f"Product {i}", quantity=i, price=1.0)
+    elapsed = time.perf_counter() - started
+    session.close()
+    engine.dispose()
+    return transactions / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare committed write throughput of the SQLite engine profiles")
+    parser.add_argument("--transactions", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            profile: measure_write_throughput(profile, args.transactions, Path(directory))
+            for profile in SQLITE_PROFILES
+        }
+    for profile, rate in results.items():
+        print(f"{profile:>10}: {rate:10.0f} commits/sec")
+    print(f"speedup: {results['production'] / results['default']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
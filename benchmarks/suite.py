@@ -0,0 +1,157 @@
+import argparse
+import json
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import sqlalchemy
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from domain.services import WarehouseService
+from infrastructure.batching import chunked
+from infrastructure.database import create_warehouse_engine
+from infrastructure.migrations import migrate
+from infrastructure.orm import OrderORM, ProductORM, order_product_associations
+from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+from benchmarks.scales import SCALES, add_arguments
+
+SEED_CHUNK_SIZE = 10_000
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    runs: int
+    total_seconds: float
+    mean_ms: float
+    queries_per_run: float
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *_args):
+        self.count += 1
+
+
+def seed(engine, products: int, orders: int) -> None:
+    # Core executemany straight into the tables, seeding through the service would
+    # take longer than the benchmark itself at the larger scales.
+    with engine.begin() as connection:
+        for chunk in chunked(range(1, products + 1), SEED_CHUNK_SIZE):
+            connection.execute(insert(ProductORM.__table__), [
+                {"id": i, "name": f"Product {i}", "quantity": 1_000_000, "price": 1.0 + i % 100,
+                 "is_active": True}
+                for i in chunk
+            ])
+        for chunk in chunked(range(1, orders + 1), SEED_CHUNK_SIZE):
+            connection.execute(insert(OrderORM.__table__), [
+                {"id": i, "address": f"Address {i % 1000}", "is_deleted": False} for i in chunk
+            ])
+            connection.execute(insert(order_product_associations), [
+                {"order_id": i, "product_id": i % products + 1, "quantity": 1,
+                 "unit_price": 1.0 + (i % products + 1) % 100}
+                for i in chunk
+            ])
+
+
+def _measure(session: Session, counter: QueryCounter, name: str,
+             operation: Callable[[int], object], runs: int) -> BenchmarkResult:
+    elapsed = 0.0
+    queries = 0
+    for i in range(runs):
+        # Each run starts from an empty transaction so that reads hit the database.
+        session.rollback()
+        before = counter.count
+        started = time.perf_counter()
+        operation(i)
+        elapsed += time.perf_counter() - started
+        queries += counter.count - before
+    session.rollback()
+    return BenchmarkResult(name=name, runs=runs, total_seconds=round(elapsed, 6),
+                           mean_ms=round(elapsed / runs * 1000, 4),
+                           queries_per_run=queries / runs)
+
+
+def run_scale(directory: Path, scale: str, runs: int) -> Dict:
+    products, orders = SCALES[scale]
+    engine = create_warehouse_engine(f"sqlite:///{directory / f'{scale}.db'}")
+    migrate(engine)
+    started = time.perf_counter()
+    seed(engine, products, orders)
+    seed_seconds = time.perf_counter() - started
+
+    counter = QueryCounter(engine)
+    session = sessionmaker(bind=engine)()
+    service = WarehouseService(SqlAlchemyProductRepository(session),
+                               SqlAlchemyOrderRepository(session),
+                               SqlAlchemyUnitOfWork(session))
+
+    def product_ids(i: int) -> List[int]:
+        return [(i * 7 + offset) % products + 1 for offset in range(3)]
+
+    benchmarks = [
+        ("create_product", lambda i: service.create_product(f"Bench {i}", 10, 1.0), runs),
+        ("get_product", lambda i: service.get_product(product_ids(i)[0]), runs),
+        ("create_order", lambda i: service.create_order(product_ids(i), "Bench"), runs),
+        ("get_order", lambda i: service.get_order(i % orders + 1), runs),
+        ("add_product_to_order",
+         lambda i: service.add_product_to_order(i % orders + 1, product_ids(i)[1]), runs),
+        ("list_orders_page",
+         lambda i: service.list_orders_page(after_id=i * 100 % orders, limit=100), runs),
+        ("list_orders", lambda i: service.list_orders(), 1),
+        ("iter_products", lambda i: sum(1 for _ in service.iter_products()), 1),
+        ("iter_product_batches",
+         lambda i: sum(len(batch) for batch in service.product_repo.iter_batches()), 1),
+    ]
+    results = [_measure(session, counter, name, operation, count)
+               for name, operation, count in benchmarks]
+    session.close()
+    engine.dispose()
+    return {
+        "scale": scale,
+        "products": products,
+        "orders": orders,
+        "seed_seconds": round(seed_seconds, 3),
+        "results": [asdict(result) for result in results],
+    }
+
+
+def run_suite(scales: List[str], runs: int = 100) -> Dict:
+    with tempfile.TemporaryDirectory() as directory:
+        scale_results = [run_scale(Path(directory), scale, runs) for scale in scales]
+    return {
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "scales": scale_results,
+    }
+
+
+def run(args: argparse.Namespace) -> None:
+    report = run_suite(args.scale or ["small"], args.runs)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Time repository and service operations on seeded SQLite databases")
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
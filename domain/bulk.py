@@ -0,0 +1,73 @@
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+import numpy as np
+
+from .models import ProductAdjustment, ProductBatch
+
+
+class AdjustmentPreview(NamedTuple):
+    # Parallel columns, one entry per selected product, of what a bulk adjustment would write.
+    ids: np.ndarray
+    quantities: np.ndarray
+    prices: np.ndarray
+    new_quantities: np.ndarray
+    new_prices: np.ndarray
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    def units_before(self) -> int:
+        return int(self.quantities.sum())
+
+    def units_after(self) -> int:
+        return int(self.new_quantities.sum())
+
+    def value_before(self) -> float:
+        return float(np.dot(self.quantities, self.prices))
+
+    def value_after(self) -> float:
+        return float(np.dot(self.new_quantities, self.new_prices))
+
+
+def _columns(batches: Iterable[ProductBatch]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # The batches already hold typed arrays, NumPy only puts a view over their buffers.
+    ids, quantities, prices = [np.zeros(0, np.int64)], [np.zeros(0, np.int64)], [np.zeros(0)]
+    for batch in batches:
+        ids.append(np.frombuffer(batch.ids, dtype=np.int64))
+        quantities.append(np.frombuffer(batch.quantities, dtype=np.int64))
+        prices.append(np.frombuffer(batch.prices, dtype=np.float64))
+    return np.concatenate(ids), np.concatenate(quantities), np.concatenate(prices)
+
+
+def _apply(columns, factors, amounts, deltas) -> AdjustmentPreview:
+    # Same arithmetic, in the same order, as the UPDATE statements, so the values match.
+    ids, quantities, prices = columns
+    return AdjustmentPreview(ids, quantities, prices,
+                             np.maximum(quantities + deltas, 0),
+                             np.maximum(prices * factors + amounts, 0.0))
+
+
+def preview_adjustment(batches: Iterable[ProductBatch],
+                       adjustment: ProductAdjustment) -> AdjustmentPreview:
+    return _apply(_columns(batches), adjustment.price_factor, adjustment.price_amount,
+                  adjustment.quantity_delta)
+
+
+def preview_adjustments(batches: Iterable[ProductBatch],
+                        adjustments: Dict[int, ProductAdjustment]) -> AdjustmentPreview:
+    columns = _columns(batches)
+    count = len(adjustments)
+    keys = np.fromiter(adjustments, dtype=np.int64, count=count)
+    order = np.argsort(keys)
+    # Position of each selected product's adjustment in the mapping.
+    positions = order[np.searchsorted(keys, columns[0], sorter=order)]
+
+    def column(values, dtype):
+        return np.fromiter(values, dtype=dtype, count=count)[positions]
+
+    values = adjustments.values()
+    return _apply(columns,
+                  column((a.price_factor for a in values), np.float64),
+                  column((a.price_amount for a in values), np.float64),
+                  column((a.quantity_delta for a in values), np.int64))
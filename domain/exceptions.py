@@ -0,0 +1,13 @@
+from typing import Iterable
+
+
+class ProductNotFoundError(ValueError):
+    def __init__(self, product_ids: Iterable[int]):
+        self.product_ids = sorted(set(product_ids))
+        super().__init__(f"Products with ids {self.product_ids} not found")
+
+
+class OutOfStockError(ValueError):
+    def __init__(self, product_ids: Iterable[int]):
+        self.product_ids = sorted(set(product_ids))
+        super().__init__(f"Not enough stock for products with ids {self.product_ids}")
@@ -1,8 +1,9 @@
 import datetime
-from dataclasses import dataclass, field
-from typing import List
+from array import array
+from dataclasses import InitVar, dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
-@dataclass
+@dataclass(slots=True)
 class Product:
     id: int
     name: str
@@ -10,13 +11,189 @@ class Product:
     price: float
     is_active: bool = field(default=True)
 
-@dataclass
+@dataclass(slots=True)
+class OrderLine:
+    product: Product
+    quantity: int
+    unit_price: float
+
+    @property
+    def product_id(self) -> int:
+        return self.product.id
+
+
+@dataclass(slots=True)
 class Order:
     id: int
     address : str
-    create_datetime : datetime = field(default_factory=datetime.datetime.now)
-    update_datetime : datetime = field(default_factory=datetime.datetime.now)
-    products: List[Product] = field(default_factory=list)
+    create_datetime : Optional[datetime.datetime] = None
+    update_datetime : Optional[datetime.datetime] = None
+    products: InitVar[Optional[List[Product]]] = None
+    lines: Dict[int, OrderLine] = field(default_factory=dict)
+
+    def __post_init__(self, products):
+        # Repositories always pass the stored timestamps, only new orders need a clock read.
+        if self.create_datetime is None or self.update_datetime is None:
+            now = datetime.datetime.now()
+            self.create_datetime = self.create_datetime or now
+            self.update_datetime = self.update_datetime or now
+        for product in products or ():
+            self.add_product(product)
+
+    @property
+    def total_amount(self) -> float:
+        return sum(line.quantity * line.unit_price for line in self.lines.values())
+
+    @property
+    def line_count(self) -> int:
+        return len(self.lines)
+
+    def add_product(self, product: Product, quantity: int = 1) -> OrderLine:
+        line = self.lines.get(product.id)
+        if line is None:
+            line = self.lines[product.id] = OrderLine(product=product, quantity=0,
+                                                      unit_price=product.price)
+        line.quantity += quantity
+        return line
+
+    def remove_product(self, product_id: int, quantity: Optional[int] = None) -> None:
+        line = self.lines.get(product_id)
+        if line is None:
+            raise ValueError(f"Product {product_id} not found in order # {self.id}")
+        if quantity is None or quantity >= line.quantity:
+            del self.lines[product_id]
+        else:
+            line.quantity -= quantity
+
+
+def _order_products(order: Order) -> List[Product]:
+    return [line.product for line in order.lines.values()]
+
+
+def _set_order_products(order: Order, products: List[Product]) -> None:
+    # Products that stay on the order keep their line and the price they were ordered at,
+    # only products new to the order are priced now.
+    kept = order.lines
+    order.lines = {}
+    for product in products:
+        if product.id not in order.lines and product.id in kept:
+            line = order.lines[product.id] = kept[product.id]
+            line.quantity = 0
+        order.add_product(product)
+
+
+# Attached after the dataclass is built so that the "products" init argument keeps its
+# None default: every distinct product of the order, repeated products become quantities.
+Order.products = property(_order_products, _set_order_products)
+
+
+@dataclass(slots=True)
+class ProductBatch:
+    # Columnar block of products for bulk reads: parallel arrays instead of one object
+    # per product, 24 bytes per row.
+    ids: array = field(default_factory=lambda: array("q"))
+    quantities: array = field(default_factory=lambda: array("q"))
+    prices: array = field(default_factory=lambda: array("d"))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, int, float]]) -> "ProductBatch":
+        batch = cls()
+        for product_id, quantity, price in rows:
+            batch.append(product_id, quantity, price)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, product_id: int, quantity: int, price: float) -> None:
+        self.ids.append(product_id)
+        self.quantities.append(quantity)
+        self.prices.append(price)
+
+    def units(self) -> int:
+        return sum(self.quantities)
+
+    def value(self) -> float:
+        return sum(quantity * price for quantity, price in zip(self.quantities, self.prices))
+
+
+@dataclass(slots=True)
+class ProductSelection:
+    # Products a bulk operation applies to, every criterion that is set must match.
+    ids: Optional[List[int]] = None
+    name_prefix: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    include_inactive: bool = False
+
+
+class ProductAdjustment(NamedTuple):
+    # New price: price * (1 + price_percent / 100) + price_amount, new stock: quantity +
+    # quantity_delta. Neither goes below zero.
+    price_percent: float = 0.0
+    price_amount: float = 0.0
+    quantity_delta: int = 0
+
+    @property
+    def price_factor(self) -> float:
+        return 1 + self.price_percent / 100
+
+    @property
+    def changes_price(self) -> bool:
+        return self.price_factor != 1 or self.price_amount != 0
+
+
+class InventoryTotals(NamedTuple):
+    products_count: int
+    units: int
+    value: float
+
+
+class StockRow(NamedTuple):
+    product_id: int
+    name: str
+    quantity: int
+    value: float
+
+
+class AddressOrderValueRow(NamedTuple):
+    address: str
+    orders_count: int
+    value: float
+
+
+class OrderSummary(NamedTuple):
+    # An order without its lines, the totals are kept on the order row itself.
+    id: int
+    address: str
+    create_datetime: datetime.datetime
+    update_datetime: datetime.datetime
+    total_amount: float
+    line_count: int
+
+
+class ChangeWatermark(NamedTuple):
+    # Feeds are ordered by (update_datetime, id), the watermark is the last pair consumed.
+    changed_at: Optional[datetime.datetime] = None
+    id: int = 0
+
+
+class ProductChange(NamedTuple):
+    product: Product
+    changed_at: datetime.datetime
+
+    @property
+    def watermark(self) -> ChangeWatermark:
+        return ChangeWatermark(self.changed_at, self.product.id)
+
+
+class OrderChange(NamedTuple):
+    order_id: int
+    changed_at: datetime.datetime
+    is_deleted: bool
+    # None for deleted orders, which are only reported as tombstones.
+    order: Optional[Order]
 
-    def add_product(self, product: Product):
-        self.products.append(product)
+    @property
+    def watermark(self) -> ChangeWatermark:
+        return ChangeWatermark(self.changed_at, self.order_id)
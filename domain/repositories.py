@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from .models import Product, Order
+from typing import Dict, Iterable, Iterator, List, Optional
+from .models import (AddressOrderValueRow, ChangeWatermark, InventoryTotals, Order, OrderChange,
+                     OrderSummary, Product, ProductAdjustment, ProductBatch, ProductChange,
+                     ProductSelection, StockRow)
 
 
 class ProductRepository(ABC):
@@ -8,18 +10,65 @@ class ProductRepository(ABC):
     def add(self, product: Product) -> None:
         pass
 
+    @abstractmethod
+    def add_many(self, products: Iterable[Product], batch_size: int = 1000,
+                 upsert_by_name: bool = False) -> int:
+        pass
+
     @abstractmethod
     def get(self, product_id: int) -> Optional[Product]:
         pass
 
+    @abstractmethod
+    def get_many(self, product_ids: List[int]) -> List[Product]:
+        pass
+
     @abstractmethod
     def list(self) -> List[Product]:
         pass
 
+    @abstractmethod
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Product]:
+        pass
+
+    @abstractmethod
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Product]:
+        pass
+
+    @abstractmethod
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> List[Product]:
+        pass
+
+    @abstractmethod
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[ProductChange]]:
+        pass
+
+    @abstractmethod
+    def iter_batches(self, batch_size: int = 10000,
+                     selection: Optional[ProductSelection] = None) -> Iterator[ProductBatch]:
+        pass
+
+    @abstractmethod
+    def adjust_many(self, selection: ProductSelection, adjustment: ProductAdjustment) -> int:
+        pass
+
+    @abstractmethod
+    def adjust_each(self, adjustments: Dict[int, ProductAdjustment]) -> int:
+        pass
+
     @abstractmethod
     def update(self, product: Product) -> None:
         pass
 
+    @abstractmethod
+    def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        pass
+
+    @abstractmethod
+    def release_stock(self, quantities: Dict[int, int]) -> None:
+        pass
+
     @abstractmethod
     def delete(self, product_id: int) -> None:
         pass
@@ -37,6 +86,24 @@ class OrderRepository(ABC):
     def list(self) -> List[Order]:
         pass
 
+    @abstractmethod
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        pass
+
+    @abstractmethod
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Order]:
+        pass
+
+    @abstractmethod
+    def list_summaries(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[OrderSummary]:
+        pass
+
+    @abstractmethod
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[OrderChange]]:
+        pass
+
     @abstractmethod
     def update(self, order: Order) -> None:
         pass
@@ -52,3 +119,93 @@ class OrderRepository(ABC):
     @abstractmethod
     def delete_product(self, order: Order, product: Product) -> Order:
         pass
+
+
+class ReportRepository(ABC):
+    @abstractmethod
+    def inventory_totals(self) -> InventoryTotals:
+        pass
+
+    @abstractmethod
+    def stock_on_hand(self) -> Iterator[StockRow]:
+        pass
+
+    @abstractmethod
+    def order_value_by_address(self) -> List[AddressOrderValueRow]:
+        pass
+
+
+class ArchivedOrderRepository(ABC):
+    @abstractmethod
+    def get(self, order_id: int) -> Optional[Order]:
+        pass
+
+    @abstractmethod
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        pass
+
+
+class WatermarkRepository(ABC):
+    @abstractmethod
+    def get(self, consumer: str, feed: str) -> ChangeWatermark:
+        pass
+
+    @abstractmethod
+    def save(self, consumer: str, feed: str, watermark: ChangeWatermark) -> None:
+        pass
+
+
+class AsyncProductRepository(ABC):
+    @abstractmethod
+    async def add(self, product: Product) -> None:
+        pass
+
+    @abstractmethod
+    async def get(self, product_id: int) -> Optional[Product]:
+        pass
+
+    @abstractmethod
+    async def get_many(self, product_ids: List[int]) -> List[Product]:
+        pass
+
+    @abstractmethod
+    async def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Product]:
+        pass
+
+    @abstractmethod
+    async def update(self, product: Product) -> None:
+        pass
+
+    @abstractmethod
+    async def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        pass
+
+    @abstractmethod
+    async def release_stock(self, quantities: Dict[int, int]) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, product_id: int) -> None:
+        pass
+
+
+class AsyncOrderRepository(ABC):
+    @abstractmethod
+    async def add(self, order: Order) -> None:
+        pass
+
+    @abstractmethod
+    async def get(self, order_id: int) -> Optional[Order]:
+        pass
+
+    @abstractmethod
+    async def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        pass
+
+    @abstractmethod
+    async def update(self, order: Order) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, order_id: int) -> None:
+        pass
@@ -1,15 +1,47 @@
-from typing import List, Optional
-from .models import Product, Order
-from .repositories import ProductRepository, OrderRepository
-from .unit_of_work import UnitOfWork
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .exceptions import OutOfStockError
+from .models import (AddressOrderValueRow, InventoryTotals, Order, OrderSummary, Product,
+                     ProductAdjustment, ProductSelection, StockRow)
+from .repositories import (ArchivedOrderRepository, AsyncOrderRepository,
+                           AsyncProductRepository, OrderRepository, ProductRepository,
+                           ReportRepository, WatermarkRepository)
+from .unit_of_work import AsyncUnitOfWork, UnitOfWork
 
+if TYPE_CHECKING:
+    from .bulk import AdjustmentPreview
 
-class WarehouseService:
-    def __init__(self, product_repo: ProductRepository, order_repo: OrderRepository,
-                 uow: UnitOfWork):
+
+def _line_quantities(order: Order) -> Dict[int, int]:
+    return {product_id: line.quantity for product_id, line in order.lines.items()}
+
+
+def _stock_difference(before: Dict[int, int], after: Dict[int, int]) \
+        -> Tuple[Dict[int, int], Dict[int, int]]:
+    """Units an order edit takes from stock and units it gives back, by product id."""
+    to_reserve = {product_id: quantity - before.get(product_id, 0)
+                  for product_id, quantity in after.items()
+                  if quantity > before.get(product_id, 0)}
+    to_release = {product_id: quantity - after.get(product_id, 0)
+                  for product_id, quantity in before.items()
+                  if quantity > after.get(product_id, 0)}
+    return to_reserve, to_release
+
+
+class WarehouseService:  # pylint: disable=too-many-public-methods
+    # Pure reads go to the optional readers (e.g. read-only repositories on their own
+    # connections), everything that leads to a write uses the repositories of the unit of work.
+    # Archived orders are read-only and only looked at when a read asks for them.
+    def __init__(self, product_repo: ProductRepository,  # pylint: disable=too-many-arguments
+                 order_repo: OrderRepository, uow: UnitOfWork, *,
+                 product_reader: Optional[ProductRepository] = None,
+                 order_reader: Optional[OrderRepository] = None,
+                 order_archive: Optional[ArchivedOrderRepository] = None):
         self.product_repo = product_repo
         self.order_repo = order_repo
         self.uow = uow
+        self.product_reader = product_reader or product_repo
+        self.order_reader = order_reader or order_repo
+        self.order_archive = order_archive
 
     def create_product(self, name: str, quantity: int, price: float, is_active: bool = True) \
             -> Product:
@@ -18,11 +50,31 @@ class WarehouseService:
         self.uow.commit()
         return product
 
+    def import_products(self, products: Iterable[Product], batch_size: int = 1000,
+                        upsert_by_name: bool = False) -> int:
+        count = self.product_repo.add_many(products, batch_size, upsert_by_name)
+        self.uow.commit()
+        return count
+
     def get_product(self, product_id: int) -> Optional[Product]:
-        return self.product_repo.get(product_id)
+        return self.product_reader.get(product_id)
+
+    def get_products(self, product_ids: List[int]) -> List[Product]:
+        # Raises ProductNotFoundError for ids that do not exist.
+        return self.product_reader.get_many(product_ids)
 
     def _list_products(self) -> List[Product]:
-        return self.product_repo.list()
+        return self.product_reader.list()
+
+    def list_products_page(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[Product]:
+        return self.product_reader.list_page(after_id, limit)
+
+    def iter_products(self, batch_size: int = 1000) -> Iterator[Product]:
+        return self.product_reader.iter_all(batch_size)
+
+    def search_products(self, query: str, offset: int = 0, limit: int = 20) -> List[Product]:
+        return self.product_reader.search(query, offset, limit)
 
     def update_product(self, product_id: int, name: str = None,
                        quantity: int = None, price: float = None) -> Product:
@@ -43,50 +95,97 @@ class WarehouseService:
 
     def delete_product(self, product_id: int) -> None:
         self.product_repo.delete(product_id)
+        self.uow.commit()
 
-    def create_order(self, product_ids: List[int], address: str) -> Order:
-        products = []
-        for product_id in product_ids:
-            product = self.product_repo.get(product_id)
-            if not product:
-                raise ValueError(f"Product with id {product_id} not found")
-            products.append(product)
+    def adjust_products(self, selection: ProductSelection, adjustment: ProductAdjustment) -> int:
+        count = self.product_repo.adjust_many(selection, adjustment)
+        self.uow.commit()
+        return count
+
+    def adjust_products_by_id(self, adjustments: Dict[int, ProductAdjustment]) -> int:
+        count = self.product_repo.adjust_each(adjustments)
+        self.uow.commit()
+        return count
+
+    # Dry runs: the selected products are read column by column and the new values are
+    # computed with NumPy, nothing is written. NumPy is only imported for them.
+
+    def preview_product_adjustment(self, selection: ProductSelection,
+                                   adjustment: ProductAdjustment) -> "AdjustmentPreview":
+        from .bulk import preview_adjustment  # pylint: disable=import-outside-toplevel
 
+        return preview_adjustment(self.product_reader.iter_batches(selection=selection),
+                                  adjustment)
+
+    def preview_product_adjustments_by_id(self, adjustments: Dict[int, ProductAdjustment]) \
+            -> "AdjustmentPreview":
+        from .bulk import preview_adjustments  # pylint: disable=import-outside-toplevel
+
+        selection = ProductSelection(ids=list(adjustments), include_inactive=True)
+        return preview_adjustments(self.product_reader.iter_batches(selection=selection),
+                                   adjustments)
+
+    def create_order(self, product_ids: List[int], address: str) -> Order:
         order = Order(
             id=None,
-            products=products,
+            products=self.product_repo.get_many(product_ids),
             address=address
         )
+        try:
+            self.product_repo.reserve_stock(_line_quantities(order))
+        except OutOfStockError:
+            self.uow.rollback()
+            raise
+
         self.order_repo.add(order)
         self.uow.commit()
         return order
 
-    def get_order(self, order_id: int) -> Optional[Order]:
-        return self.order_repo.get(order_id)
+    def get_order(self, order_id: int, include_archived: bool = False) -> Optional[Order]:
+        order = self.order_reader.get(order_id)
+        if order is None and include_archived and self.order_archive is not None:
+            order = self.order_archive.get(order_id)
+        return order
 
     def list_orders(self) -> List[Order]:
-        return self.order_repo.list()
+        return self.order_reader.list()
+
+    def list_orders_page(self, after_id: Optional[int] = None, limit: int = 100,
+                         include_archived: bool = False) -> List[Order]:
+        orders = self.order_reader.list_page(after_id, limit)
+        if not include_archived or self.order_archive is None:
+            return orders
+        # Both pages are ordered by id, the first "limit" ids of the two make the merged page.
+        # An order caught halfway through archiving is in both, the live copy wins.
+        merged = {order.id: order for order in self.order_archive.list_page(after_id, limit)}
+        merged.update((order.id, order) for order in orders)
+        return [merged[order_id] for order_id in sorted(merged)[:limit]]
+
+    def iter_orders(self, batch_size: int = 1000) -> Iterator[Order]:
+        return self.order_reader.iter_all(batch_size)
+
+    def list_order_summaries(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[OrderSummary]:
+        return self.order_reader.list_summaries(after_id, limit)
 
     def update_order(self, order_id: int, product_ids: List[int]) -> Order:
         order = self.order_repo.get(order_id)
         if not order:
             raise ValueError(f"Order with id {order_id} not found")
 
-        products = []
-        for product_id in product_ids:
-            product = self.product_repo.get(product_id)
-            if not product:
-                raise ValueError(f"Product with id {product_id} not found")
-            products.append(product)
-
-        order.products = products
-        self.order_repo.update(order)
+        before = _line_quantities(order)
+        order.products = self.product_repo.get_many(product_ids)
+        self._save_order_edit(order, before)
         return order
 
     def delete_order(self, order_id: int) -> None:
+        order = self.order_repo.get(order_id)
+        if order:
+            self.product_repo.release_stock(_line_quantities(order))
         self.order_repo.delete(order_id)
+        self.uow.commit()
 
-    def add_product_to_order(self, order_id: int, product_id: int) -> Order:
+    def add_product_to_order(self, order_id: int, product_id: int, quantity: int = 1) -> Order:
         order = self.order_repo.get(order_id)
         if not order:
             raise ValueError(f"Order with id {order_id} not found")
@@ -95,21 +194,195 @@ class WarehouseService:
         if not product:
             raise ValueError(f"Product with id {product_id} not found")
 
-        if product not in order.products:
-            order.products.append(product)
-            self.order_repo.update(order)
-
+        before = _line_quantities(order)
+        order.add_product(product, quantity)
+        self._save_order_edit(order, before)
         return order
 
-    def remove_product_from_order(self, order_id: int, product_id: int) -> Order:
+    def remove_product_from_order(self, order_id: int, product_id: int,
+                                  quantity: Optional[int] = None) -> Order:
         order = self.order_repo.get(order_id)
         if not order:
             raise ValueError(f"Order with id {order_id} not found")
 
-        product = self.product_repo.get(product_id)
+        before = _line_quantities(order)
+        order.remove_product(product_id, quantity)
+        self._save_order_edit(order, before)
+        return order
+
+    def _save_order_edit(self, order: Order, before: Dict[int, int]) -> None:
+        # Stock follows the lines: added units are reserved like in create_order, removed
+        # units go back, all in the unit of work that saves the order.
+        to_reserve, to_release = _stock_difference(before, _line_quantities(order))
+        try:
+            if to_reserve:
+                self.product_repo.reserve_stock(to_reserve)
+        except OutOfStockError:
+            self.uow.rollback()
+            raise
+        if to_release:
+            self.product_repo.release_stock(to_release)
+        self.order_repo.update(order)
+        self.uow.commit()
+
+
+class ReportingService:
+    def __init__(self, report_repo: ReportRepository):
+        self.report_repo = report_repo
+
+    def inventory_totals(self) -> InventoryTotals:
+        return self.report_repo.inventory_totals()
+
+    def stock_on_hand(self) -> Iterator[StockRow]:
+        return self.report_repo.stock_on_hand()
+
+    def order_value_by_address(self) -> List[AddressOrderValueRow]:
+        return self.report_repo.order_value_by_address()
+
+
+class ChangeFeedService:
+    FEEDS = ("products", "orders")
+
+    def __init__(self, product_repo: ProductRepository, order_repo: OrderRepository,
+                 watermark_repo: WatermarkRepository, uow: UnitOfWork):
+        self.product_repo = product_repo
+        self.order_repo = order_repo
+        self.watermark_repo = watermark_repo
+        self.uow = uow
+
+    def sync(self, consumer: str, feed: str, handle: Callable[[List], None],
+             batch_size: int = 1000) -> int:
+        if feed not in self.FEEDS:
+            raise ValueError(f"Unknown change feed: {feed}")
+        repository = self.product_repo if feed == "products" else self.order_repo
+        count = 0
+        for batch in repository.changes_since(self.watermark_repo.get(consumer, feed),
+                                              batch_size):
+            handle(batch)
+            # The watermark only moves once the consumer has handled the batch.
+            self.watermark_repo.save(consumer, feed, batch[-1].watermark)
+            self.uow.commit()
+            count += len(batch)
+        return count
+
+
+class AsyncWarehouseService:
+    def __init__(self, product_repo: AsyncProductRepository, order_repo: AsyncOrderRepository,
+                 uow: AsyncUnitOfWork):
+        self.product_repo = product_repo
+        self.order_repo = order_repo
+        self.uow = uow
+
+    async def create_product(self, name: str, quantity: int, price: float,
+                             is_active: bool = True) -> Product:
+        product = Product(id=None, name=name, quantity=quantity, price=price, is_active=is_active)
+        await self.product_repo.add(product)
+        await self.uow.commit()
+        return product
+
+    async def get_product(self, product_id: int) -> Optional[Product]:
+        return await self.product_repo.get(product_id)
+
+    async def list_products_page(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[Product]:
+        return await self.product_repo.list_page(after_id, limit)
+
+    async def update_product(self, product_id: int, name: str = None,
+                             quantity: int = None, price: float = None) -> Product:
+        product = await self.product_repo.get(product_id)
         if not product:
             raise ValueError(f"Product with id {product_id} not found")
 
-        order.products = [p for p in order.products if p.id != product_id]
-        self.order_repo.update(order)
+        if name is not None:
+            product.name = name
+        if quantity is not None:
+            product.quantity = quantity
+        if price is not None:
+            product.price = price
+
+        await self.product_repo.update(product)
+        await self.uow.commit()
+        return product
+
+    async def delete_product(self, product_id: int) -> None:
+        await self.product_repo.delete(product_id)
+        await self.uow.commit()
+
+    async def create_order(self, product_ids: List[int], address: str) -> Order:
+        order = Order(
+            id=None,
+            products=await self.product_repo.get_many(product_ids),
+            address=address
+        )
+        try:
+            await self.product_repo.reserve_stock(_line_quantities(order))
+        except OutOfStockError:
+            await self.uow.rollback()
+            raise
+
+        await self.order_repo.add(order)
+        await self.uow.commit()
         return order
+
+    async def get_order(self, order_id: int) -> Optional[Order]:
+        return await self.order_repo.get(order_id)
+
+    async def list_orders_page(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[Order]:
+        return await self.order_repo.list_page(after_id, limit)
+
+    async def update_order(self, order_id: int, product_ids: List[int]) -> Order:
+        order = await self.order_repo.get(order_id)
+        if not order:
+            raise ValueError(f"Order with id {order_id} not found")
+
+        before = _line_quantities(order)
+        order.products = await self.product_repo.get_many(product_ids)
+        await self._save_order_edit(order, before)
+        return order
+
+    async def delete_order(self, order_id: int) -> None:
+        order = await self.order_repo.get(order_id)
+        if order:
+            await self.product_repo.release_stock(_line_quantities(order))
+        await self.order_repo.delete(order_id)
+        await self.uow.commit()
+
+    async def add_product_to_order(self, order_id: int, product_id: int,
+                                   quantity: int = 1) -> Order:
+        order = await self.order_repo.get(order_id)
+        if not order:
+            raise ValueError(f"Order with id {order_id} not found")
+
+        product = await self.product_repo.get(product_id)
+        if not product:
+            raise ValueError(f"Product with id {product_id} not found")
+
+        before = _line_quantities(order)
+        order.add_product(product, quantity)
+        await self._save_order_edit(order, before)
+        return order
+
+    async def remove_product_from_order(self, order_id: int, product_id: int,
+                                        quantity: Optional[int] = None) -> Order:
+        order = await self.order_repo.get(order_id)
+        if not order:
+            raise ValueError(f"Order with id {order_id} not found")
+
+        before = _line_quantities(order)
+        order.remove_product(product_id, quantity)
+        await self._save_order_edit(order, before)
+        return order
+
+    async def _save_order_edit(self, order: Order, before: Dict[int, int]) -> None:
+        to_reserve, to_release = _stock_difference(before, _line_quantities(order))
+        try:
+            if to_reserve:
+                await self.product_repo.reserve_stock(to_reserve)
+        except OutOfStockError:
+            await self.uow.rollback()
+            raise
+        if to_release:
+            await self.product_repo.release_stock(to_release)
+        await self.order_repo.update(order)
+        await self.uow.commit()
@@ -16,3 +16,21 @@ class UnitOfWork(ABC):
     @abstractmethod
     def rollback(self):
         pass
+
+
+class AsyncUnitOfWork(ABC):
+    @abstractmethod
+    async def __aenter__(self):
+        pass
+
+    @abstractmethod
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        pass
+
+    @abstractmethod
+    async def commit(self):
+        pass
+
+    @abstractmethod
+    async def rollback(self):
+        pass
@@ -0,0 +1,183 @@
+import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import (Boolean, Column, Float, Integer, MetaData, String, Table, and_, delete,
+                        event, func, insert, or_, select)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from domain.models import Order, OrderLine, Product
+from domain.repositories import ArchivedOrderRepository
+from .batching import IN_CLAUSE_CHUNK_SIZE, chunked
+from .database import immediate_transaction
+from .orm import OrderORM, ProductORM, Timestamp, order_product_associations
+
+# Cold orders live in a second SQLite file attached to every connection under this schema
+# name. The live tables only keep the orders that are still being worked on, so their size,
+# and the latency of order queries, stops growing with the history.
+ARCHIVE_SCHEMA = "archive"
+
+archive_metadata = MetaData(schema=ARCHIVE_SCHEMA)
+
+# No foreign keys: products are deleted for good while the archived lines stay.
+archived_orders = Table(
+    "orders", archive_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("create_datetime", Timestamp),
+    Column("update_datetime", Timestamp),
+    Column("is_deleted", Boolean, nullable=False),
+    Column("address", String),
+    Column("archived_at", Timestamp, server_default=func.now()),
+)
+
+archived_order_lines = Table(
+    "order_product_associations", archive_metadata,
+    Column("order_id", Integer, primary_key=True),
+    Column("product_id", Integer, primary_key=True),
+    Column("quantity", Integer, nullable=False),
+    Column("unit_price", Float),
+)
+
+ORDER_COLUMNS = ("id", "create_datetime", "update_datetime", "is_deleted", "address")
+LINE_COLUMNS = ("order_id", "product_id", "quantity", "unit_price")
+
+
+def attach_archive(engine: Engine, path: str, create: bool = True) -> None:
+    # Must be called before the engine hands out its first connection.
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+        cursor.close()
+
+    if create:
+        archive_metadata.create_all(engine)
+
+
+def _archivable_ids(deleted_before: Optional[datetime.datetime],
+                    inactive_before: Optional[datetime.datetime], batch_size: int):
+    orders = OrderORM.__table__
+    conditions = []
+    if deleted_before is not None:
+        conditions.append(and_(orders.c.is_deleted.is_(True),
+                               orders.c.update_datetime < deleted_before))
+    if inactive_before is not None:
+        conditions.append(orders.c.update_datetime < inactive_before)
+    return (
+        select(orders.c.id)
+        .where(or_(*conditions))
+        # The newest order always stays: without AUTOINCREMENT SQLite hands out max(id) + 1,
+        # which would reuse the id of an archived order.
+        .where(orders.c.id < select(func.max(orders.c.id)).scalar_subquery())
+        .order_by(orders.c.id)
+        .limit(batch_size)
+    )
+
+
+def _copy_to_archive(connection: Connection, order_ids: List[int]) -> None:
+    orders = OrderORM.__table__
+    lines = order_product_associations
+    connection.execute(
+        insert(archived_orders).prefix_with("OR REPLACE").from_select(
+            ORDER_COLUMNS,
+            select(*(orders.c[name] for name in ORDER_COLUMNS)).where(orders.c.id.in_(order_ids)))
+    )
+    connection.execute(
+        insert(archived_order_lines).prefix_with("OR REPLACE").from_select(
+            LINE_COLUMNS,
+            select(*(lines.c[name] for name in LINE_COLUMNS))
+            .where(lines.c.order_id.in_(order_ids)))
+    )
+
+
+def _delete_archived(connection: Connection, order_ids: List[int]) -> int:
+    orders = OrderORM.__table__
+    lines = order_product_associations
+    # Only orders whose archived copy is still current: one changed since the copy stays live
+    # and is archived again by a later batch.
+    copy = archived_orders.alias("copy")
+    archived = (
+        select(copy.c.id)
+        .where(copy.c.id == orders.c.id,
+               copy.c.update_datetime.is_not_distinct_from(orders.c.update_datetime))
+    )
+    # Orders first, so that the totals triggers on the lines find no order to update.
+    count = connection.execute(
+        delete(orders).where(orders.c.id.in_(order_ids), archived.exists())).rowcount
+    connection.execute(
+        delete(lines).where(lines.c.order_id.in_(order_ids),
+                            lines.c.order_id.not_in(select(orders.c.id)
+                                                    .where(orders.c.id.in_(order_ids)))))
+    return count
+
+
+def archive_orders(engine: Engine, deleted_before: Optional[datetime.datetime] = None,
+                   inactive_before: Optional[datetime.datetime] = None,
+                   batch_size: int = 1000) -> int:
+    """Move deleted orders and orders not updated since a cutoff into the archive.
+
+    Under WAL a transaction spanning two files is only atomic per file, so every batch takes
+    two: the copy into the archive is committed first, then the live rows are deleted, and
+    only those whose archived copy is current. An interrupted run leaves orders both in the
+    archive and live, never in neither; the next run copies them again and deletes them."""
+    if deleted_before is None and inactive_before is None:
+        raise ValueError("Nothing to archive: give a cutoff for deleted or inactive orders")
+    candidates = _archivable_ids(deleted_before, inactive_before, batch_size)
+    moved = 0
+    while True:
+        with immediate_transaction(engine) as connection:
+            order_ids = list(connection.scalars(candidates))
+            for chunk in chunked(order_ids, IN_CLAUSE_CHUNK_SIZE):
+                _copy_to_archive(connection, chunk)
+        with immediate_transaction(engine) as connection:
+            for chunk in chunked(order_ids, IN_CLAUSE_CHUNK_SIZE):
+                moved += _delete_archived(connection, chunk)
+        if len(order_ids) < batch_size:
+            return moved
+
+
+class SqlAlchemyArchivedOrderRepository(ArchivedOrderRepository):
+    # Archived orders are read-only, deleted ones are kept for the record but never returned.
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get(self, order_id: int) -> Optional[Order]:
+        orders = self._load(select(archived_orders)
+                            .where(archived_orders.c.id == order_id,
+                                   archived_orders.c.is_deleted.is_(False)))
+        return orders[0] if orders else None
+
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        query = select(archived_orders).where(archived_orders.c.is_deleted.is_(False))
+        if after_id is not None:
+            query = query.where(archived_orders.c.id > after_id)
+        return self._load(query.order_by(archived_orders.c.id).limit(limit))
+
+    def _load(self, query) -> List[Order]:
+        orders: Dict[int, Order] = {
+            row.id: Order(id=row.id, address=row.address, create_datetime=row.create_datetime,
+                          update_datetime=row.update_datetime)
+            for row in self.session.execute(query)
+        }
+        products = ProductORM.__table__
+        for chunk in chunked(orders, IN_CLAUSE_CHUNK_SIZE):
+            rows = self.session.execute(
+                select(archived_order_lines, products.c.id.label("live_product_id"),
+                       products.c.name, products.c.quantity.label("stock"), products.c.price,
+                       products.c.is_active)
+                .outerjoin(products, products.c.id == archived_order_lines.c.product_id)
+                .where(archived_order_lines.c.order_id.in_(chunk))
+            )
+            for row in rows:
+                if row.live_product_id is None:
+                    # The product has been deleted since, only the line itself is known.
+                    product = Product(id=row.product_id, name=None, quantity=0,
+                                      price=row.unit_price, is_active=False)
+                else:
+                    product = Product(id=row.product_id, name=row.name, quantity=row.stock,
+                                      price=row.price, is_active=row.is_active)
+                unit_price = product.price if row.unit_price is None else row.unit_price
+                orders[row.order_id].lines[product.id] = OrderLine(
+                    product=product, quantity=row.quantity, unit_price=unit_price)
+        return list(orders.values())
@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from domain.exceptions import OutOfStockError
+from domain.models import Order, Product
+from domain.repositories import AsyncOrderRepository, AsyncProductRepository
+from .orm import OrderORM, ProductORM
+from .orm_mapping import (lines_option, load_product_orms, new_product_ids, order_to_domain,
+                          release_stock_statements, reserve_stock_statements, sync_lines)
+
+
+class AsyncSqlAlchemyProductRepository(AsyncProductRepository):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add(self, product: Product) -> None:
+        product_orm = ProductORM(
+            name=product.name,
+            quantity=product.quantity,
+            price=product.price,
+            is_active=product.is_active
+        )
+        self.session.add(product_orm)
+        await self.session.flush()
+        product.id = product_orm.id
+
+    async def get(self, product_id: int) -> Optional[Product]:
+        product_orm = await self.session.get(ProductORM, product_id)
+        if product_orm is None:
+            return None
+        return Product(
+            id=product_orm.id,
+            name=product_orm.name,
+            quantity=product_orm.quantity,
+            price=product_orm.price,
+            is_active=product_orm.is_active
+        )
+
+    async def get_many(self, product_ids: List[int]) -> List[Product]:
+        products_orm = await self.session.run_sync(load_product_orms, product_ids)
+        return [
+            Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price,
+                    is_active=p.is_active)
+            for p in (products_orm[product_id] for product_id in product_ids)
+        ]
+
+    async def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Product]:
+        query = select(ProductORM).filter_by(is_active=True)
+        if after_id is not None:
+            query = query.where(ProductORM.id > after_id)
+        products_orm = await self.session.scalars(query.order_by(ProductORM.id).limit(limit))
+        return [
+            Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price)
+            for p in products_orm
+        ]
+
+    async def update(self, product: Product) -> None:
+        product_orm = await self.session.get(ProductORM, product.id)
+        if product_orm:
+            product_orm.name = product.name
+            product_orm.quantity = product.quantity
+            product_orm.price = product.price
+            product_orm.is_active = product.is_active
+
+    async def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        reserved = set()
+        for statement in reserve_stock_statements(quantities):
+            reserved.update(await self.session.scalars(statement))
+        if len(reserved) < len(quantities):
+            raise OutOfStockError(set(quantities) - reserved)
+
+    async def release_stock(self, quantities: Dict[int, int]) -> None:
+        for statement in release_stock_statements(quantities):
+            await self.session.execute(statement)
+
+    async def delete(self, product_id: int) -> None:
+        product_orm = await self.session.get(ProductORM, product_id)
+        if product_orm:
+            await self.session.delete(product_orm)
+
+
+class AsyncSqlAlchemyOrderRepository(AsyncOrderRepository):
+    # Lazy loading is not available under asyncio, so order lines are always loaded eagerly.
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add(self, order: Order) -> None:
+        order_orm = OrderORM(
+            address=order.address
+        )
+        products_orm = await self.session.run_sync(load_product_orms, list(order.lines))
+        sync_lines(order_orm, order, products_orm)
+        self.session.add(order_orm)
+        await self.session.flush()
+        order.id = order_orm.id
+        order.create_datetime = order_orm.create_datetime
+        order.update_datetime = order_orm.update_datetime
+
+    async def get(self, order_id: int) -> Optional[Order]:
+        order_orm = await self.session.get(OrderORM, order_id,
+                                           options=[lines_option(selectinload)])
+        if order_orm is None or order_orm.is_deleted:
+            return None
+        return order_to_domain(order_orm)
+
+    async def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        query = select(OrderORM).filter_by(is_deleted=False)
+        if after_id is not None:
+            query = query.where(OrderORM.id > after_id)
+        orders_orm = await self.session.scalars(
+            query
+            .order_by(OrderORM.id)
+            .limit(limit)
+            .options(lines_option(selectinload))
+        )
+        return [order_to_domain(order_orm) for order_orm in orders_orm]
+
+    async def update(self, order: Order) -> None:
+        order_orm = await self.session.get(OrderORM, order.id,
+                                           options=[selectinload(OrderORM.lines)])
+        if order_orm:
+            products_orm = await self.session.run_sync(load_product_orms,
+                                                       new_product_ids(order_orm, order))
+            sync_lines(order_orm, order, products_orm)
+
+    async def delete(self, order_id: int) -> None:
+        order_orm = await self.session.get(OrderORM, order_id)
+        if order_orm:
+            order_orm.is_deleted = True
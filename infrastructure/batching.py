@@ -0,0 +1,11 @@
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+# SQLite builds before 3.32 allow at most 999 bound parameters per statement.
+IN_CLAUSE_CHUNK_SIZE = 500
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
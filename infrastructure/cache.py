@@ -0,0 +1,131 @@
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from domain.models import (ChangeWatermark, Product, ProductAdjustment, ProductBatch,
+                           ProductChange, ProductSelection)
+from domain.repositories import ProductRepository
+
+
+class CachedProductRepository(ProductRepository):
+    # Read-through LRU cache around another ProductRepository. Cached products are
+    # copied on the way in and out because services mutate the objects they receive.
+
+    def __init__(self, repository: ProductRepository, max_size: int = 1024,
+                 ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.repository = repository
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _lookup(self, product_id: int) -> Optional[Product]:
+        entry = self._entries.get(product_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, product = entry
+        if expires_at <= self.clock():
+            del self._entries[product_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(product_id)
+        self.hits += 1
+        return replace(product)
+
+    def _store(self, product: Product) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[product.id] = (self.clock() + self.ttl, replace(product))
+        self._entries.move_to_end(product.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, product_id: Optional[int] = None) -> None:
+        if product_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(product_id, None)
+
+    def add(self, product: Product) -> None:
+        self.repository.add(product)
+        self._store(product)
+
+    def add_many(self, products: Iterable[Product], batch_size: int = 1000,
+                 upsert_by_name: bool = False) -> int:
+        if upsert_by_name:
+            self.invalidate()
+        return self.repository.add_many(products, batch_size, upsert_by_name)
+
+    def get(self, product_id: int) -> Optional[Product]:
+        product = self._lookup(product_id)
+        if product is None:
+            product = self.repository.get(product_id)
+            if product is not None:
+                self._store(product)
+        return product
+
+    def get_many(self, product_ids: List[int]) -> List[Product]:
+        found = {}
+        for product_id in dict.fromkeys(product_ids):
+            product = self._lookup(product_id)
+            if product is not None:
+                found[product_id] = product
+
+        missing = [product_id for product_id in dict.fromkeys(product_ids)
+                   if product_id not in found]
+        if missing:
+            for product in self.repository.get_many(missing):
+                self._store(product)
+                found[product.id] = product
+        return [replace(found[product_id]) for product_id in product_ids]
+
+    def list(self) -> List[Product]:
+        return self.repository.list()
+
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Product]:
+        return self.repository.list_page(after_id, limit)
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Product]:
+        return self.repository.iter_all(batch_size)
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> List[Product]:
+        return self.repository.search(query, offset, limit)
+
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[ProductChange]]:
+        return self.repository.changes_since(watermark, batch_size)
+
+    def iter_batches(self, batch_size: int = 10000,
+                     selection: Optional[ProductSelection] = None) -> Iterator[ProductBatch]:
+        return self.repository.iter_batches(batch_size, selection)
+
+    def adjust_many(self, selection: ProductSelection, adjustment: ProductAdjustment) -> int:
+        self.invalidate()
+        return self.repository.adjust_many(selection, adjustment)
+
+    def adjust_each(self, adjustments: Dict[int, ProductAdjustment]) -> int:
+        for product_id in adjustments:
+            self.invalidate(product_id)
+        return self.repository.adjust_each(adjustments)
+
+    def update(self, product: Product) -> None:
+        self.invalidate(product.id)
+        self.repository.update(product)
+
+    def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        for product_id in quantities:
+            self.invalidate(product_id)
+        self.repository.reserve_stock(quantities)
+
+    def release_stock(self, quantities: Dict[int, int]) -> None:
+        for product_id in quantities:
+            self.invalidate(product_id)
+        self.repository.release_stock(quantities)
+
+    def delete(self, product_id: int) -> None:
+        self.invalidate(product_id)
+        self.repository.delete(product_id)
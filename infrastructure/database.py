@@ -1 +1,102 @@
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool, StaticPool
+
 DATABASE_URL= 'sqlite:///warehouse.db'
+ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///warehouse.db'
+
+SQLITE_PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # A negative cache_size is measured in KiB rather than pages.
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+SQLITE_PROFILES = {
+    "default": {},
+    "production": SQLITE_PRODUCTION_PRAGMAS,
+}
+
+
+def _is_memory_database(url) -> bool:
+    return url.database in (None, "", ":memory:")
+
+
+def _set_pragmas_on_connect(engine: Engine, pragmas: dict) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def create_warehouse_engine(url: str = DATABASE_URL, profile: str = "production",
+                            **engine_kwargs) -> Engine:
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, **engine_kwargs)
+
+    pragmas = SQLITE_PROFILES[profile]
+    if _is_memory_database(url):
+        # Every connection to ":memory:" is a separate database, so share a single one.
+        engine_kwargs.setdefault("poolclass", StaticPool)
+        engine_kwargs.setdefault("connect_args", {"check_same_thread": False})
+    elif pragmas:
+        # WAL lets readers run next to the writer, so keep a pool of open connections
+        # instead of reopening the file (and re-running the pragmas) for each session.
+        engine_kwargs.setdefault("poolclass", QueuePool)
+        engine_kwargs.setdefault("pool_size", 5)
+        engine_kwargs.setdefault("max_overflow", 10)
+    engine = create_engine(url, **engine_kwargs)
+
+    if pragmas:
+        _set_pragmas_on_connect(engine, pragmas)
+    return engine
+
+
+def create_async_warehouse_engine(url: str = ASYNC_DATABASE_URL, profile: str = "production",
+                                  **engine_kwargs) -> AsyncEngine:
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and _is_memory_database(url):
+        engine_kwargs.setdefault("poolclass", StaticPool)
+    engine = create_async_engine(url, **engine_kwargs)
+
+    pragmas = SQLITE_PROFILES[profile] if url.get_backend_name() == "sqlite" else {}
+    if pragmas:
+        _set_pragmas_on_connect(engine.sync_engine, pragmas)
+    return engine
+
+
+@contextmanager
+def immediate_transaction(engine: Engine) -> Iterator[Connection]:
+    # pysqlite does not open a transaction before DDL statements on its own, so work that
+    # must be applied completely or not at all runs in an explicit one. IMMEDIATE takes the
+    # write lock up front instead of failing halfway when another writer holds it.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except Exception:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+        connection.exec_driver_sql("COMMIT")
+
+
+@contextmanager
+def snapshot_transaction(engine: Engine) -> Iterator[Connection]:
+    # Long reads that span several queries: under WAL every query in the transaction sees
+    # the database as of its first read, however much is committed meanwhile.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("BEGIN")
+        try:
+            yield connection
+        finally:
+            connection.exec_driver_sql("ROLLBACK")
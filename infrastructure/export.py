@@ -0,0 +1,335 @@
+import datetime
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, func, select, tuple_
+from sqlalchemy.engine import Connection, Engine
+
+from domain.models import ChangeWatermark
+from .database import snapshot_transaction
+from .orm import OrderORM, ProductORM, Timestamp, order_product_associations
+from .repositories import CHANGE_FEED_SETTLE_SECONDS
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # Optional: without it exports use the NumPy layout, which needs nothing else.
+    pyarrow = None
+
+# Analytics exports. Tables are streamed in batches of Core rows straight into columnar
+# files, no domain objects in between. Every run adds one part per table under
+# <directory>/<table>/, and the manifest records where the next incremental run starts:
+# products and orders by (update_datetime, id), like the change feeds, and the lines of
+# every exported order along with it. A row changed again shows up in a later part too,
+# the last part it is in holds its current state.
+
+MANIFEST_FILE = "manifest.json"
+FORMATS = ("parquet", "arrow", "npy")
+DEFAULT_FORMAT = "parquet" if pyarrow is not None else "npy"
+TABLES = ("products", "orders", "order_lines")
+# Lines have no update_datetime, they are exported with their orders.
+WATERMARKED_TABLES = ("products", "orders")
+
+_products = ProductORM.__table__
+_orders = OrderORM.__table__
+_lines = order_product_associations
+
+
+class ExportColumn(NamedTuple):
+    name: str
+    # "int", "float", "bool", "datetime" or "str"
+    kind: str
+    expression: object
+
+
+class TableExport(NamedTuple):
+    table: str
+    rows: int
+    seconds: float
+    # The part written by this run, None when there was nothing new.
+    path: Optional[str]
+
+
+COLUMNS: Dict[str, List[ExportColumn]] = {
+    "products": [
+        ExportColumn("id", "int", _products.c.id),
+        ExportColumn("name", "str", _products.c.name),
+        ExportColumn("quantity", "int", func.coalesce(_products.c.quantity, 0)),
+        ExportColumn("price", "float", _products.c.price),
+        ExportColumn("is_active", "bool", func.coalesce(_products.c.is_active, True)),
+        ExportColumn("update_datetime", "datetime", _products.c.update_datetime),
+    ],
+    "orders": [
+        ExportColumn("id", "int", _orders.c.id),
+        ExportColumn("create_datetime", "datetime", _orders.c.create_datetime),
+        ExportColumn("update_datetime", "datetime", _orders.c.update_datetime),
+        ExportColumn("is_deleted", "bool", func.coalesce(_orders.c.is_deleted, False)),
+        ExportColumn("address", "str", _orders.c.address),
+        ExportColumn("total_amount", "float", _orders.c.total_amount),
+        ExportColumn("line_count", "int", _orders.c.line_count),
+    ],
+    "order_lines": [
+        ExportColumn("order_id", "int", _lines.c.order_id),
+        ExportColumn("product_id", "int", _lines.c.product_id),
+        ExportColumn("quantity", "int", _lines.c.quantity),
+        ExportColumn("unit_price", "float", _lines.c.unit_price),
+    ],
+}
+
+NUMPY_TYPES = {"int": np.int64, "float": np.float64, "bool": np.bool_,
+               "datetime": "datetime64[s]"}
+
+
+def _arrow_type(kind: str):
+    return {"int": pyarrow.int64(), "float": pyarrow.float64(), "bool": pyarrow.bool_(),
+            "datetime": pyarrow.timestamp("s"), "str": pyarrow.string()}[kind]
+
+
+class _ArrowPart:
+    def __init__(self, path: Path, columns: List[ExportColumn], file_format: str):
+        self.path = path.with_suffix(f".{file_format}")
+        self.schema = pyarrow.schema([(c.name, _arrow_type(c.kind)) for c in columns])
+        if file_format == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(self.path, self.schema)
+
+    def write(self, values: Sequence[Sequence]) -> None:
+        arrays = [pyarrow.array(column, type=field.type)
+                  for column, field in zip(values, self.schema)]
+        self._writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+class _NpyFile:
+    # A 1-d .npy file written in appends: the header is rewritten with the final length on
+    # close, NumPy leaves room in it for the shape to grow.
+
+    def __init__(self, path: Path, dtype):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._file = open(path, "wb")  # pylint: disable=consider-using-with
+        self._write_header()
+
+    def _write_header(self) -> None:
+        self._file.seek(0)
+        np.lib.format.write_array_header_1_0(
+            self._file, {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                         "fortran_order": False, "shape": (self.count,)})
+
+    def append(self, values) -> None:
+        self._file.write(np.ascontiguousarray(values, self.dtype).tobytes())
+        self.count += len(values)
+
+    def close(self) -> None:
+        self._write_header()
+        self._file.close()
+
+
+class _NpyStrings:
+    # Arrow style: the UTF-8 bytes of all strings one after the other, and where each ends.
+
+    def __init__(self, path: Path, name: str):
+        self.offsets = _NpyFile(path / f"{name}.offsets.npy", np.int64)
+        self.data = _NpyFile(path / f"{name}.utf8.npy", np.uint8)
+        self.offsets.append(np.zeros(1, np.int64))
+        self.end = 0
+
+    def append(self, values) -> None:
+        encoded = [(value or "").encode() for value in values]
+        ends = self.end + np.cumsum(np.fromiter(map(len, encoded), np.int64, len(encoded)))
+        self.offsets.append(ends)
+        self.end = int(ends[-1])
+        self.data.append(np.frombuffer(b"".join(encoded), np.uint8))
+
+    def close(self) -> None:
+        self.offsets.close()
+        self.data.close()
+
+
+class _NpyPart:
+    # One directory per part and one .npy file per column, to be opened with
+    # np.load(mmap_mode="r"), strings in two (see _NpyStrings). NULL strings come out
+    # empty, NULL floats as NaN and NULL datetimes as NaT.
+
+    def __init__(self, path: Path, columns: List[ExportColumn]):
+        self.path = path
+        # Left behind by a run that failed, its files are all rewritten.
+        path.mkdir(exist_ok=True)
+        self._columns = [
+            _NpyStrings(path, column.name) if column.kind == "str"
+            else _NpyFile(path / f"{column.name}.npy", NUMPY_TYPES[column.kind])
+            for column in columns
+        ]
+
+    def write(self, values: Sequence[Sequence]) -> None:
+        for column, column_values in zip(self._columns, values):
+            column.append(column_values)
+
+    def close(self) -> None:
+        for column in self._columns:
+            column.close()
+
+
+def read_npy_part(path) -> Dict[str, np.ndarray]:
+    """Columns of a part in the NumPy layout: numbers memory-mapped, strings decoded."""
+    path = Path(path)
+    columns = {}
+    for file in sorted(path.glob("*.npy")):
+        name, _, suffix = file.stem.partition(".")
+        if suffix == "utf8":
+            continue
+        if suffix == "offsets":
+            offsets = np.load(file)
+            data = np.load(path / f"{name}.utf8.npy").tobytes()
+            columns[name] = np.array([data[start:end].decode()
+                                      for start, end in zip(offsets[:-1], offsets[1:])],
+                                     dtype=object)
+        else:
+            columns[name] = np.load(file, mmap_mode="r")
+    return columns
+
+
+def _changed(table, watermark: ChangeWatermark, settled):
+    # Same window as the change feeds: after the watermark, before the current second.
+    conditions = [table.c.update_datetime < settled]
+    if watermark.changed_at is not None:
+        conditions.append(tuple_(table.c.update_datetime, table.c.id) >
+                          tuple_(watermark.changed_at, watermark.id, types=[Timestamp, Integer]))
+    return conditions
+
+
+def _watermark(state: dict) -> ChangeWatermark:
+    if state.get("changed_at") is None:
+        return ChangeWatermark()
+    return ChangeWatermark(datetime.datetime.fromisoformat(state["changed_at"]),
+                           state["last_id"])
+
+
+def _queries(connection: Connection, states: Dict[str, dict]) -> Dict:
+    settled = connection.scalar(select(
+        func.datetime("now", f"-{CHANGE_FEED_SETTLE_SECONDS} seconds", type_=Timestamp)))
+    watermarks = {table: _watermark(states[table]) for table in TABLES}
+
+    def columns(table):
+        return [column.expression.label(column.name) for column in COLUMNS[table]]
+
+    return {
+        "products": select(*columns("products"))
+        .where(*_changed(_products, watermarks["products"], settled))
+        .order_by(_products.c.update_datetime, _products.c.id),
+        "orders": select(*columns("orders"))
+        .where(*_changed(_orders, watermarks["orders"], settled))
+        .order_by(_orders.c.update_datetime, _orders.c.id),
+        "order_lines": select(*columns("order_lines"))
+        .join(_orders, _orders.c.id == _lines.c.order_id)
+        .where(*_changed(_orders, watermarks["orders"], settled))
+        .order_by(_lines.c.order_id, _lines.c.product_id),
+    }
+
+
+def _read_manifest(directory: Path) -> Optional[dict]:
+    path = directory / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _write_manifest(directory: Path, manifest: dict) -> None:
+    # Replaced in one step: a run that fails halfway leaves the previous manifest, and the
+    # next run writes over its partial parts.
+    temporary = directory / f"{MANIFEST_FILE}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary, directory / MANIFEST_FILE)
+
+
+def _export_table(connection: Connection, query, part, batch_size: int, state: dict) -> int:
+    rows_written = 0
+    result = connection.execution_options(yield_per=batch_size).execute(query)
+    for rows in result.partitions():
+        part.write(list(zip(*rows)))
+        rows_written += len(rows)
+        if "last_id" in state:
+            state["changed_at"] = rows[-1].update_datetime.isoformat(sep=" ")
+            state["last_id"] = rows[-1].id
+    return rows_written
+
+
+def _start_manifest(directory: Path, file_format: Optional[str], incremental: bool) -> dict:
+    manifest = _read_manifest(directory)
+    if manifest is not None and not incremental:
+        raise ValueError(f"{directory} already holds an export, "
+                         f"continue it incrementally or use another directory")
+    if manifest is not None:
+        if file_format not in (None, manifest["format"]):
+            raise ValueError(f"{directory} holds a {manifest['format']} export")
+        file_format = manifest["format"]
+    file_format = file_format or DEFAULT_FORMAT
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}")
+    if file_format != "npy" and pyarrow is None:
+        raise ValueError(f"The {file_format} format needs pyarrow, use npy instead")
+    if manifest is None:
+        manifest = {"format": file_format,
+                    "tables": {table: {"parts": 0, "rows": 0} for table in TABLES}}
+        for table in WATERMARKED_TABLES:
+            manifest["tables"][table].update(changed_at=None, last_id=0)
+    return manifest
+
+
+def _new_part(directory: Path, table: str, state: dict, file_format: str):
+    (directory / table).mkdir(parents=True, exist_ok=True)
+    path = directory / table / f"part-{state['parts'] + 1:05d}"
+    if file_format == "npy":
+        return _NpyPart(path, COLUMNS[table])
+    return _ArrowPart(path, COLUMNS[table], file_format)
+
+
+def export_tables(engine: Engine, directory, file_format: Optional[str] = None,
+                  incremental: bool = False,
+                  batch_size: int = 10000) -> Tuple[str, List[TableExport]]:
+    """Write products, orders and order lines to columnar files under directory.
+
+    Memory stays bounded by batch_size rows. All tables are read in one snapshot, so the
+    lines always match the exported orders. Returns the format used and what was written."""
+    directory = Path(directory)
+    manifest = _start_manifest(directory, file_format, incremental)
+    states = manifest["tables"]
+    exports = []
+    with snapshot_transaction(engine) as connection:
+        for table, query in _queries(connection, states).items():
+            started = time.perf_counter()
+            state = states[table]
+            part = _new_part(directory, table, state, manifest["format"])
+            try:
+                rows = _export_table(connection, query, part, batch_size, state)
+            finally:
+                part.close()
+            if rows:
+                state["parts"] += 1
+                state["rows"] += rows
+            else:
+                _remove_part(part.path)
+            exports.append(TableExport(table, rows, time.perf_counter() - started,
+                                       str(part.path) if rows else None))
+    _write_manifest(directory, manifest)
+    return manifest["format"], exports
+
+
+def _remove_part(path: Path) -> None:
+    if path.is_dir():
+        for file in path.iterdir():
+            file.unlink()
+        path.rmdir()
+    else:
+        path.unlink()
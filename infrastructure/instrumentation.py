@@ -0,0 +1,151 @@
+import functools
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+
+_OUTSIDE_OPERATIONS = "<no operation>"
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    total_seconds: float = 0.0
+
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    total_seconds: float = 0.0
+    statements: int = 0
+    # Identical SQL repeated inside a single call, the usual sign of an N+1 loop.
+    repeated: Counter = field(default_factory=Counter)
+
+
+class QueryProfiler:
+    # Opt-in: nothing is hooked until attach() is called, so a disabled profiler costs nothing.
+
+    def __init__(self, slow_ms: float = 100.0, repeat_threshold: int = 10):
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.statements: Dict[str, StatementStats] = defaultdict(StatementStats)
+        self.operations: Dict[str, OperationStats] = defaultdict(OperationStats)
+        self._current: ContextVar[Optional[Counter]] = ContextVar("current_operation",
+                                                                  default=None)
+
+    def attach(self, engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def detach(self, engine) -> None:
+        event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, connection, _cursor, _statement, _parameters, _context,
+                               _executemany):
+        connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, connection, _cursor, statement, _parameters, _context,
+                              _executemany):
+        elapsed = time.perf_counter() - connection.info["query_started"].pop()
+        stats = self.statements[statement]
+        stats.count += 1
+        stats.total_seconds += elapsed
+        executed = self._current.get()
+        if executed is not None:
+            executed[statement] += 1
+        else:
+            self.operations[_OUTSIDE_OPERATIONS].statements += 1
+
+    @contextmanager
+    def operation(self, name: str, count_call: bool = True) -> Iterator[None]:
+        if self._current.get() is not None:
+            # Nested service calls are attributed to the outermost one.
+            yield
+            return
+        executed = Counter()
+        token = self._current.set(executed)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._current.reset(token)
+            self._record(name, elapsed, executed, count_call)
+
+    def _record(self, name: str, elapsed: float, executed: Counter, count_call: bool) -> None:
+        stats = self.operations[name]
+        stats.calls += count_call
+        stats.total_seconds += elapsed
+        stats.statements += sum(executed.values())
+        for statement, count in executed.items():
+            if count >= self.repeat_threshold:
+                stats.repeated[statement] = max(stats.repeated[statement], count)
+        if elapsed * 1000 >= self.slow_ms:
+            logging.warning(f"Slow operation {name}: {elapsed * 1000:.1f} ms, "
+                            f"{sum(executed.values())} statements")
+
+    def summary(self, top: int = 10) -> str:
+        lines = ["=== SQL profile ===", "Operations:"]
+        for name, stats in sorted(self.operations.items(),
+                                  key=lambda item: item[1].total_seconds, reverse=True):
+            lines.append(f"  {name}: {stats.calls} calls, {stats.total_seconds * 1000:.1f} ms, "
+                         f"{stats.statements} statements")
+        lines.append(f"Top {top} statements by total time:")
+        for statement, stats in self.top_statements(top):
+            lines.append(f"  {stats.total_seconds * 1000:9.1f} ms {stats.count:6} x  "
+                         f"{_one_line(statement)}")
+        suspects = self.repeated_statements()
+        if suspects:
+            lines.append("Possible N+1 queries:")
+            for name, statement, count in suspects:
+                lines.append(f"  {name}: {count} x {_one_line(statement)}")
+        return "\n".join(lines)
+
+    def top_statements(self, top: int = 10) -> List:
+        return sorted(self.statements.items(), key=lambda item: item[1].total_seconds,
+                      reverse=True)[:top]
+
+    def repeated_statements(self) -> List:
+        return [(name, statement, count)
+                for name, stats in self.operations.items()
+                for statement, count in stats.repeated.most_common()]
+
+
+def _one_line(statement: str, width: int = 120) -> str:
+    text = " ".join(statement.split())
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+class ProfiledService:
+    # Wraps a service so that every public method call runs inside a profiler operation.
+    # Returned iterators are wrapped too, their queries run while they are consumed.
+
+    def __init__(self, service, profiler: QueryProfiler, prefix: Optional[str] = None):
+        self._service = service
+        self._profiler = profiler
+        self._prefix = prefix or type(service).__name__
+
+    def __getattr__(self, name):
+        attribute = getattr(self._service, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        operation_name = f"{self._prefix}.{name}"
+
+        @functools.wraps(attribute)
+        def profiled(*args, **kwargs):
+            with self._profiler.operation(operation_name):
+                result = attribute(*args, **kwargs)
+            if isinstance(result, Iterator):
+                return self._iterate(operation_name, result)
+            return result
+        return profiled
+
+    def _iterate(self, operation_name: str, iterator: Iterator) -> Iterator:
+        with self._profiler.operation(operation_name, count_call=False):
+            yield from iterator
@@ -0,0 +1,702 @@
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_right, insort
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from domain.exceptions import OutOfStockError, ProductNotFoundError
+from domain.models import (ChangeWatermark, Order, OrderChange, OrderLine, OrderSummary, Product,
+                           ProductAdjustment, ProductBatch, ProductChange, ProductSelection)
+from domain.repositories import OrderRepository, ProductRepository
+from domain.unit_of_work import UnitOfWork
+from .batching import chunked
+from .repositories import CHANGE_FEED_SETTLE_SECONDS
+
+# Everything lives in dicts of immutable records. A transaction never touches them: its
+# writes go to a private overlay of new records that commit swaps in under the store lock,
+# and rollback simply drops. Only one transaction writes at a time, like with SQLite.
+
+SNAPSHOT_FILE = "snapshot.jsonl"
+JOURNAL_FILE = "journal.jsonl"
+WRITER_TIMEOUT_SECONDS = 5.0
+
+
+class MemoryStoreBusyError(RuntimeError):
+    pass
+
+
+class _StoredProduct(NamedTuple):
+    id: int
+    name: str
+    quantity: int
+    price: float
+    is_active: bool
+    update_datetime: Optional[datetime.datetime]
+
+
+class _StoredOrder(NamedTuple):
+    id: int
+    address: str
+    create_datetime: datetime.datetime
+    update_datetime: Optional[datetime.datetime]
+    is_deleted: bool
+    # (product_id, quantity, unit_price) per line
+    lines: Tuple[Tuple[int, int, float], ...]
+
+
+def _utc_now() -> datetime.datetime:
+    # Same resolution and time zone as SQLite's CURRENT_TIMESTAMP.
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+class _SortedIndex:
+    # Sorted keys with lazy removal: removed keys are only remembered and skipped, the list
+    # is rebuilt once they make up half of it. New keys mostly sort last (ids, timestamps),
+    # so inserting them is a bisect and an append.
+
+    def __init__(self):
+        self._keys = []
+        self._removed = set()
+
+    def add(self, key) -> None:
+        if key in self._removed:
+            self._removed.discard(key)
+        else:
+            insort(self._keys, key)
+
+    def remove(self, key) -> None:
+        self._removed.add(key)
+        if len(self._removed) * 2 > len(self._keys):
+            self._keys = [k for k in self._keys if k not in self._removed]
+            self._removed.clear()
+
+    def after(self, key=None, limit: Optional[int] = None) -> List:
+        start = 0 if key is None else bisect_right(self._keys, key)
+        found = []
+        for k in islice(self._keys, start, None):
+            if k not in self._removed:
+                found.append(k)
+                if len(found) == limit:
+                    break
+        return found
+
+
+def _name_words(name: Optional[str]) -> Tuple[str, ...]:
+    # Folded like the FTS5 unicode61 tokenizer with remove_diacritics.
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return tuple(re.findall(r"\w+", folded))
+
+
+def _product_to_domain(record: _StoredProduct) -> Product:
+    return Product(id=record.id, name=record.name, quantity=record.quantity, price=record.price,
+                   is_active=record.is_active)
+
+
+def _product_record(product: Product) -> _StoredProduct:
+    return _StoredProduct(product.id, product.name, product.quantity, product.price,
+                          product.is_active, None)
+
+
+def _order_record(order: Order, is_deleted: bool = False) -> _StoredOrder:
+    lines = tuple((product_id, line.quantity, line.unit_price)
+                  for product_id, line in order.lines.items())
+    return _StoredOrder(order.id, order.address, order.create_datetime, None, is_deleted, lines)
+
+
+def _encode_datetime(value: Optional[datetime.datetime]) -> Optional[str]:
+    return None if value is None else value.isoformat(sep=" ")
+
+
+def _decode_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+    return None if value is None else datetime.datetime.fromisoformat(value)
+
+
+def _encode_product(record: _StoredProduct) -> list:
+    return [*record[:5], _encode_datetime(record.update_datetime)]
+
+
+def _decode_product(row: list) -> _StoredProduct:
+    return _StoredProduct(*row[:5], _decode_datetime(row[5]))
+
+
+def _encode_order(record: _StoredOrder) -> list:
+    return [record.id, record.address, _encode_datetime(record.create_datetime),
+            _encode_datetime(record.update_datetime), record.is_deleted,
+            [list(line) for line in record.lines]]
+
+
+def _decode_order(row: list) -> _StoredOrder:
+    return _StoredOrder(row[0], row[1], _decode_datetime(row[2]), _decode_datetime(row[3]),
+                        row[4], tuple(tuple(line) for line in row[5]))
+
+
+class MemoryStore:  # pylint: disable=too-many-instance-attributes
+    """Committed state shared by all sessions, with optional persistence to a directory.
+
+    Every commit is appended to a journal before it is applied. Every "snapshot_every"
+    commits the whole state is written to a snapshot and the journal starts over. Journal
+    entries hold complete records, so replaying one that is already in the snapshot is
+    harmless. The journal is flushed but not fsynced, like SQLite with synchronous=NORMAL."""
+
+    def __init__(self, directory: Optional[str] = None, snapshot_every: int = 10_000,
+                 clock: Callable[[], datetime.datetime] = _utc_now):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.clock = clock
+        self.products: Dict[int, _StoredProduct] = {}
+        self.orders: Dict[int, _StoredOrder] = {}
+        self.active_product_ids = _SortedIndex()
+        self.live_order_ids = _SortedIndex()
+        self.products_by_update = _SortedIndex()
+        self.orders_by_update = _SortedIndex()
+        self.order_ids_by_product: Dict[int, Set[int]] = {}
+        self.product_words: Dict[int, Tuple[str, ...]] = {}
+        self.next_product_id = 1
+        self.next_order_id = 1
+        # Held while a commit is applied and by reads that combine several records.
+        self.lock = threading.RLock()
+        # Held by the one transaction that writes, from its first write to its end.
+        self.writer = threading.Lock()
+        self._journal = None
+        self._commits_since_snapshot = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+            self._journal = self._open_journal("a")
+
+    def _open_journal(self, mode: str):
+        # Stays open for the life of the store, one line is appended per commit.
+        path = os.path.join(self.directory, JOURNAL_FILE)
+        return open(path, mode, encoding="utf-8")  # pylint: disable=consider-using-with
+
+    def session(self) -> "MemorySession":
+        return MemorySession(self)
+
+    def apply(self, products: Iterable[_StoredProduct], deleted_product_ids: Iterable[int],
+              orders: Iterable[_StoredOrder]) -> None:
+        for record in products:
+            self._put_product(record)
+        for product_id in deleted_product_ids:
+            self._remove_product(product_id)
+        for record in orders:
+            self._put_order(record)
+
+    def _remove_product(self, product_id: int) -> None:
+        old = self.products.pop(product_id, None)
+        if old is None:
+            return
+        if old.is_active:
+            self.active_product_ids.remove(product_id)
+        self.products_by_update.remove((old.update_datetime, product_id))
+        del self.product_words[product_id]
+
+    def _put_product(self, record: _StoredProduct) -> None:
+        self._remove_product(record.id)
+        self.products[record.id] = record
+        if record.is_active:
+            self.active_product_ids.add(record.id)
+        self.products_by_update.add((record.update_datetime, record.id))
+        self.product_words[record.id] = _name_words(record.name)
+
+    def _put_order(self, record: _StoredOrder) -> None:
+        old = self.orders.get(record.id)
+        if old is not None:
+            if not old.is_deleted:
+                self.live_order_ids.remove(record.id)
+            self.orders_by_update.remove((old.update_datetime, record.id))
+            for product_id, _, _ in old.lines:
+                self.order_ids_by_product[product_id].discard(record.id)
+        self.orders[record.id] = record
+        if not record.is_deleted:
+            self.live_order_ids.add(record.id)
+        self.orders_by_update.add((record.update_datetime, record.id))
+        for product_id, _, _ in record.lines:
+            self.order_ids_by_product.setdefault(product_id, set()).add(record.id)
+
+    def commit(self, products: List[_StoredProduct], deleted_product_ids: List[int],
+               orders: List[_StoredOrder]) -> None:
+        with self.lock:
+            now = self.clock()
+            products = [record._replace(update_datetime=now) for record in products]
+            orders = [record._replace(update_datetime=now) for record in orders]
+            if self._journal is not None:
+                self._journal.write(json.dumps({
+                    "products": [_encode_product(record) for record in products],
+                    "deleted_products": deleted_product_ids,
+                    "orders": [_encode_order(record) for record in orders],
+                    "next_ids": [self.next_product_id, self.next_order_id],
+                }) + "\n")
+                self._journal.flush()
+            self.apply(products, deleted_product_ids, orders)
+            self._commits_since_snapshot += 1
+            if self._journal is not None and self._commits_since_snapshot >= self.snapshot_every:
+                self.snapshot()
+
+    def snapshot(self) -> None:
+        with self.lock:
+            path = os.path.join(self.directory, SNAPSHOT_FILE)
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                file.write(json.dumps({"next_ids": [self.next_product_id,
+                                                    self.next_order_id]}) + "\n")
+                for record in self.products.values():
+                    file.write(json.dumps(["product", _encode_product(record)]) + "\n")
+                for record in self.orders.values():
+                    file.write(json.dumps(["order", _encode_order(record)]) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + ".tmp", path)
+            # The snapshot now holds everything in the journal.
+            self._journal.close()
+            self._journal = self._open_journal("w")
+            self._commits_since_snapshot = 0
+
+    def _load(self) -> None:
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as file:
+                self.next_product_id, self.next_order_id = json.loads(file.readline())["next_ids"]
+                for line in file:
+                    kind, row = json.loads(line)
+                    if kind == "product":
+                        self._put_product(_decode_product(row))
+                    else:
+                        self._put_order(_decode_order(row))
+        journal_path = os.path.join(self.directory, JOURNAL_FILE)
+        if not os.path.exists(journal_path):
+            return
+        complete = 0
+        with open(journal_path, "rb") as file:
+            for number, line in enumerate(file, 1):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("No line end")
+                    entry = json.loads(line)
+                except ValueError:
+                    # A commit cut short by a crash, it was never acknowledged.
+                    logging.warning(f"Ignoring incomplete journal entry {number}")
+                    break
+                self.apply([_decode_product(row) for row in entry["products"]],
+                           entry["deleted_products"],
+                           [_decode_order(row) for row in entry["orders"]])
+                self.next_product_id, self.next_order_id = entry["next_ids"]
+                complete += len(line)
+        # New commits are appended after the last complete entry, not after the torn one.
+        if complete < os.path.getsize(journal_path):
+            os.truncate(journal_path, complete)
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self.snapshot()
+            self._journal.close()
+            self._journal = None
+
+
+class MemorySession:
+    # One transaction at a time over a MemoryStore, shared by the repositories of a unit of
+    # work like a SQLAlchemy Session. Reads see the committed state plus the own overlay.
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+        # None marks a deleted product.
+        self.products: Dict[int, Optional[_StoredProduct]] = {}
+        self.orders: Dict[int, _StoredOrder] = {}
+        self._writing = False
+        self._next_ids = None
+
+    def begin_write(self) -> None:
+        if self._writing:
+            return
+        if not self.store.writer.acquire(timeout=WRITER_TIMEOUT_SECONDS):
+            raise MemoryStoreBusyError("Another transaction is writing to the memory store")
+        self._writing = True
+        self._next_ids = (self.store.next_product_id, self.store.next_order_id)
+
+    def new_product_id(self) -> int:
+        self.begin_write()
+        product_id = self.store.next_product_id
+        self.store.next_product_id += 1
+        return product_id
+
+    def new_order_id(self) -> int:
+        self.begin_write()
+        order_id = self.store.next_order_id
+        self.store.next_order_id += 1
+        return order_id
+
+    def put_product(self, record: _StoredProduct) -> None:
+        self.begin_write()
+        self.products[record.id] = record
+
+    def delete_product(self, product_id: int) -> None:
+        self.begin_write()
+        self.products[product_id] = None
+
+    def put_order(self, record: _StoredOrder) -> None:
+        self.begin_write()
+        self.orders[record.id] = record
+
+    def product(self, product_id: int) -> Optional[_StoredProduct]:
+        if product_id in self.products:
+            return self.products[product_id]
+        return self.store.products.get(product_id)
+
+    def order(self, order_id: int) -> Optional[_StoredOrder]:
+        record = self.orders.get(order_id)
+        return record if record is not None else self.store.orders.get(order_id)
+
+    def active_product_ids(self, after_id: Optional[int], limit: Optional[int]) -> List[int]:
+        with self.store.lock:
+            fetch = None if limit is None else limit + len(self.products)
+            ids = [product_id for product_id in self.store.active_product_ids.after(after_id, fetch)
+                   if product_id not in self.products]
+        ids.extend(product_id for product_id, record in self.products.items()
+                   if record is not None and record.is_active
+                   and (after_id is None or product_id > after_id))
+        return sorted(ids)[:limit]
+
+    def live_order_ids(self, after_id: Optional[int], limit: Optional[int]) -> List[int]:
+        with self.store.lock:
+            fetch = None if limit is None else limit + len(self.orders)
+            ids = [order_id for order_id in self.store.live_order_ids.after(after_id, fetch)
+                   if order_id not in self.orders]
+        ids.extend(order_id for order_id, record in self.orders.items()
+                   if not record.is_deleted and (after_id is None or order_id > after_id))
+        return sorted(ids)[:limit]
+
+    def commit(self) -> None:
+        if not self._writing:
+            return
+        products = [record for record in self.products.values() if record is not None]
+        deleted = [product_id for product_id, record in self.products.items() if record is None]
+        try:
+            self.store.commit(products, deleted, list(self.orders.values()))
+        except Exception:
+            self.rollback()
+            raise
+        self._end()
+
+    def rollback(self) -> None:
+        if self._writing:
+            # Ids handed out by this transaction are free again, as in SQLite.
+            self.store.next_product_id, self.store.next_order_id = self._next_ids
+            self._end()
+
+    def _end(self) -> None:
+        self.products = {}
+        self.orders = {}
+        self._writing = False
+        self.store.writer.release()
+
+
+def _changes(session: MemorySession, index: _SortedIndex, records: Dict,
+             watermark: ChangeWatermark, batch_size: int) -> Iterator[List]:
+    settled = session.store.clock() - datetime.timedelta(seconds=CHANGE_FEED_SETTLE_SECONDS)
+    key = None if watermark.changed_at is None else tuple(watermark)
+    while True:
+        with session.store.lock:
+            keys = [k for k in index.after(key, batch_size) if k[0] < settled]
+            rows = [records[record_id] for _, record_id in keys]
+        if not rows:
+            return
+        key = keys[-1]
+        yield rows
+        if len(rows) < batch_size:
+            return
+
+
+class MemoryProductRepository(ProductRepository):
+    def __init__(self, session: MemorySession):
+        self.session = session
+
+    def add(self, product: Product) -> None:
+        product.id = self.session.new_product_id()
+        self.session.put_product(_product_record(product))
+
+    def add_many(self, products: Iterable[Product], batch_size: int = 1000,
+                 upsert_by_name: bool = False) -> int:
+        ids_by_name: Dict[str, List[int]] = {}
+        if upsert_by_name:
+            with self.session.store.lock:
+                for record in [*self.session.store.products.values(),
+                               *self.session.products.values()]:
+                    if record is not None:
+                        ids_by_name.setdefault(record.name, []).append(record.id)
+        count = 0
+        for batch in chunked(products, batch_size):
+            count += len(batch)
+            if upsert_by_name:
+                batch = list({product.name: product for product in batch}.values())
+            for product in batch:
+                existing = [product_id
+                            for product_id in dict.fromkeys(ids_by_name.get(product.name, []))
+                            if self.session.product(product_id) is not None]
+                for product_id in existing:
+                    self.session.put_product(self.session.product(product_id)._replace(
+                        quantity=product.quantity, price=product.price,
+                        is_active=product.is_active))
+                if not existing:
+                    new_product = Product(id=None, name=product.name, quantity=product.quantity,
+                                          price=product.price, is_active=product.is_active)
+                    self.add(new_product)
+                    ids_by_name.setdefault(product.name, []).append(new_product.id)
+        return count
+
+    def get(self, product_id: int) -> Optional[Product]:
+        record = self.session.product(product_id)
+        return None if record is None else _product_to_domain(record)
+
+    def get_many(self, product_ids: List[int]) -> List[Product]:
+        records = {product_id: self.session.product(product_id)
+                   for product_id in dict.fromkeys(product_ids)}
+        missing = [product_id for product_id, record in records.items() if record is None]
+        if missing:
+            raise ProductNotFoundError(missing)
+        return [_product_to_domain(records[product_id]) for product_id in product_ids]
+
+    def list(self) -> List[Product]:
+        return self.list_page(limit=None)
+
+    def list_page(self, after_id: Optional[int] = None, limit: Optional[int] = 100) \
+            -> List[Product]:
+        with self.session.store.lock:
+            return [_product_to_domain(self.session.product(product_id))
+                    for product_id in self.session.active_product_ids(after_id, limit)]
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Product]:
+        after_id = None
+        while products := self.list_page(after_id, batch_size):
+            yield from products
+            after_id = products[-1].id
+
+    def _selected(self, selection: Optional[ProductSelection]) -> List[_StoredProduct]:
+        selection = selection or ProductSelection()
+        with self.session.store.lock:
+            if selection.ids is not None:
+                ids = sorted(set(selection.ids))
+            elif selection.include_inactive:
+                ids = sorted(self.session.store.products.keys() | self.session.products.keys())
+            else:
+                ids = self.session.active_product_ids(None, None)
+            records = [self.session.product(product_id) for product_id in ids]
+        # LIKE in SQLite, which the SQL selection uses, ignores case too.
+        prefix = None if selection.name_prefix is None else selection.name_prefix.casefold()
+        return [record for record in records
+                if record is not None
+                and (selection.include_inactive or record.is_active)
+                and (prefix is None or (record.name or "").casefold().startswith(prefix))
+                and (selection.min_price is None or record.price >= selection.min_price)
+                and (selection.max_price is None or record.price <= selection.max_price)]
+
+    def iter_batches(self, batch_size: int = 10000,
+                     selection: Optional[ProductSelection] = None) -> Iterator[ProductBatch]:
+        for records in chunked(self._selected(selection), batch_size):
+            yield ProductBatch.from_rows((record.id, record.quantity or 0, record.price or 0.0)
+                                         for record in records)
+
+    def _adjust(self, record: _StoredProduct, adjustment: ProductAdjustment) -> None:
+        price = record.price
+        if adjustment.changes_price:
+            price = max(price * adjustment.price_factor + adjustment.price_amount, 0.0)
+        self.session.put_product(record._replace(
+            price=price, quantity=max(record.quantity + adjustment.quantity_delta, 0)))
+
+    def adjust_many(self, selection: ProductSelection, adjustment: ProductAdjustment) -> int:
+        if not adjustment.changes_price and not adjustment.quantity_delta:
+            return 0
+        records = self._selected(selection)
+        for record in records:
+            self._adjust(record, adjustment)
+        return len(records)
+
+    def adjust_each(self, adjustments: Dict[int, ProductAdjustment]) -> int:
+        count = 0
+        for product_id, adjustment in adjustments.items():
+            record = self.session.product(product_id)
+            if record is not None:
+                self._adjust(record, adjustment)
+                count += 1
+        return count
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> List[Product]:
+        # Every query word must start a word of the name. Like the FTS5 search, all active
+        # matches are ranked; shorter names rank first, as bm25 scores them for a single match.
+        terms = _name_words(query)
+        if not terms:
+            return []
+        candidates = []
+        with self.session.store.lock:
+            for product_id in self.session.active_product_ids(None, None):
+                record = self.session.product(product_id)
+                words = _name_words(record.name) if product_id in self.session.products \
+                    else self.session.store.product_words[product_id]
+                if all(any(word.startswith(term) for word in words) for term in terms):
+                    candidates.append((len(words), product_id, record))
+        candidates.sort(key=lambda candidate: candidate[:2])
+        return [_product_to_domain(record)
+                for _, _, record in candidates[offset:offset + limit]]
+
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[ProductChange]]:
+        store = self.session.store
+        for rows in _changes(self.session, store.products_by_update, store.products, watermark,
+                             batch_size):
+            yield [ProductChange(_product_to_domain(row), row.update_datetime) for row in rows]
+
+    def update(self, product: Product) -> None:
+        self.session.put_product(_product_record(product))
+
+    def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        # The writer lock keeps other transactions from taking the same units meanwhile.
+        self.session.begin_write()
+        records = {product_id: self.session.product(product_id) for product_id in quantities}
+        short = [product_id for product_id, record in records.items()
+                 if record is None or record.quantity < quantities[product_id]]
+        if short:
+            raise OutOfStockError(short)
+        for product_id, record in records.items():
+            self.session.put_product(
+                record._replace(quantity=record.quantity - quantities[product_id]))
+
+    def release_stock(self, quantities: Dict[int, int]) -> None:
+        self.session.begin_write()
+        for product_id, quantity in quantities.items():
+            record = self.session.product(product_id)
+            # Products deleted since have nothing to give the units back to.
+            if record is not None:
+                self.session.put_product(record._replace(quantity=record.quantity + quantity))
+
+    def delete(self, product_id: int) -> None:
+        self.session.delete_product(product_id)
+
+
+class MemoryOrderRepository(OrderRepository):
+    def __init__(self, session: MemorySession):
+        self.session = session
+
+    def _to_domain(self, record: _StoredOrder) -> Order:
+        order = Order(id=record.id, address=record.address,
+                      create_datetime=record.create_datetime,
+                      update_datetime=record.update_datetime)
+        for product_id, quantity, unit_price in record.lines:
+            product_record = self.session.product(product_id)
+            if product_record is None:
+                # Products are deleted for good, the line still knows its price.
+                product = Product(id=product_id, name=None, quantity=0, price=unit_price,
+                                  is_active=False)
+            else:
+                product = _product_to_domain(product_record)
+            order.lines[product_id] = OrderLine(
+                product=product, quantity=quantity,
+                unit_price=product.price if unit_price is None else unit_price)
+        return order
+
+    def add(self, order: Order) -> None:
+        order.id = self.session.new_order_id()
+        order.create_datetime = order.update_datetime = self.session.store.clock()
+        self.session.put_order(_order_record(order))
+
+    def get(self, order_id: int) -> Optional[Order]:
+        record = self.session.order(order_id)
+        if record is None or record.is_deleted:
+            return None
+        return self._to_domain(record)
+
+    def list(self) -> List[Order]:
+        return self.list_page(limit=None)
+
+    def list_page(self, after_id: Optional[int] = None, limit: Optional[int] = 100) \
+            -> List[Order]:
+        with self.session.store.lock:
+            return [self._to_domain(self.session.order(order_id))
+                    for order_id in self.session.live_order_ids(after_id, limit)]
+
+    def list_by_product(self, product_id: int) -> List[Order]:
+        with self.session.store.lock:
+            order_ids = set(self.session.store.order_ids_by_product.get(product_id, ()))
+            order_ids.difference_update(self.session.orders)
+            order_ids.update(record.id for record in self.session.orders.values()
+                             if any(line[0] == product_id for line in record.lines))
+            records = [self.session.order(order_id) for order_id in sorted(order_ids)]
+            return [self._to_domain(record) for record in records if not record.is_deleted]
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Order]:
+        after_id = None
+        while orders := self.list_page(after_id, batch_size):
+            yield from orders
+            after_id = orders[-1].id
+
+    def list_summaries(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[OrderSummary]:
+        # The lines are in the record already, summing them is as cheap as storing the sum.
+        with self.session.store.lock:
+            records = [self.session.order(order_id)
+                       for order_id in self.session.live_order_ids(after_id, limit)]
+            return [OrderSummary(record.id, record.address, record.create_datetime,
+                                 record.update_datetime,
+                                 sum(quantity * self._unit_price(product_id, unit_price)
+                                     for product_id, quantity, unit_price in record.lines),
+                                 len(record.lines))
+                    for record in records]
+
+    def _unit_price(self, product_id: int, unit_price: Optional[float]) -> float:
+        if unit_price is not None:
+            return unit_price
+        product = self.session.product(product_id)
+        return 0.0 if product is None else product.price
+
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[OrderChange]]:
+        store = self.session.store
+        for rows in _changes(self.session, store.orders_by_update, store.orders, watermark,
+                             batch_size):
+            yield [OrderChange(order_id=row.id, changed_at=row.update_datetime,
+                               is_deleted=row.is_deleted,
+                               order=None if row.is_deleted else self._to_domain(row))
+                   for row in rows]
+
+    def update(self, order: Order) -> None:
+        self.session.put_order(_order_record(order))
+
+    def delete(self, order_id: int) -> None:
+        record = self.session.order(order_id)
+        if record is not None:
+            self.session.put_order(record._replace(is_deleted=True))
+
+    def delete_product(self, order: Order, product: Product) -> Order:
+        order.remove_product(product.id)
+        self.update(order)
+        return order
+
+    def delete_one_quantity_product(self, order: Order, product: Product) -> Order:
+        order.remove_product(product.id, quantity=1)
+        self.update(order)
+        return order
+
+
+class MemoryUnitOfWork(UnitOfWork):
+
+    def __init__(self, session: MemorySession):
+        self.session = session
+        self.committed = False
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is not None:
+            self.rollback()
+        else:
+            self.commit()
+
+    def commit(self):
+        self.session.commit()
+        self.committed = True
+
+    def rollback(self):
+        self.session.rollback()
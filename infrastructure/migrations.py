@@ -0,0 +1,116 @@
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from .database import immediate_transaction
+from .order_totals import rebuild_order_totals
+from .orm import ORDER_TOTALS_DDL, PRODUCT_SEARCH_DDL, Base, SyncWatermarkORM
+
+# Schema versions are tracked in SQLite's PRAGMA user_version. A brand new database is
+# created straight from the ORM metadata and stamped with the latest version, while an
+# existing one is upgraded by running every migration newer than its stored version.
+
+
+def _add_indexes_and_association_key(connection: Connection) -> None:
+    connection.execute(text("UPDATE orders SET is_deleted = 0 WHERE is_deleted IS NULL"))
+    connection.execute(text("ALTER TABLE order_product_associations "
+                            "RENAME TO order_product_associations_old"))
+    # Repeated rows used to be repeated units: they become the quantity of a single line.
+    connection.execute(text(
+        "CREATE TABLE order_product_associations ("
+        "order_id INTEGER NOT NULL REFERENCES orders (id), "
+        "product_id INTEGER NOT NULL REFERENCES products (id), "
+        "quantity INTEGER NOT NULL DEFAULT 1, "
+        "PRIMARY KEY (order_id, product_id))"
+    ))
+    connection.execute(text(
+        "INSERT INTO order_product_associations (order_id, product_id, quantity) "
+        "SELECT order_id, product_id, COUNT(*) FROM order_product_associations_old "
+        "WHERE order_id IS NOT NULL AND product_id IS NOT NULL "
+        "GROUP BY order_id, product_id"
+    ))
+    connection.execute(text("DROP TABLE order_product_associations_old"))
+    connection.execute(text("CREATE INDEX ix_order_product_associations_product_id "
+                            "ON order_product_associations (product_id)"))
+    connection.execute(text("CREATE INDEX ix_products_active_id "
+                            "ON products (id) WHERE is_active = 1"))
+    connection.execute(text("CREATE INDEX ix_orders_live_id "
+                            "ON orders (id) WHERE is_deleted = 0"))
+
+
+def _add_order_line_quantities(connection: Connection) -> None:
+    # Databases upgraded to version 1 before it kept the quantities have no column yet.
+    columns = {column["name"]
+               for column in inspect(connection).get_columns("order_product_associations")}
+    if "quantity" not in columns:
+        connection.execute(text("ALTER TABLE order_product_associations "
+                                "ADD COLUMN quantity INTEGER NOT NULL DEFAULT 1"))
+    connection.execute(text("ALTER TABLE order_product_associations ADD COLUMN unit_price FLOAT"))
+    connection.execute(text(
+        "UPDATE order_product_associations SET unit_price = "
+        "(SELECT price FROM products WHERE products.id = order_product_associations.product_id)"
+    ))
+
+
+def _add_product_search(connection: Connection) -> None:
+    for statement in PRODUCT_SEARCH_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO products_fts (products_fts) VALUES ('rebuild')"))
+
+
+def _add_change_feed(connection: Connection) -> None:
+    for table in ("products", "orders"):
+        connection.execute(text(f"UPDATE {table} SET update_datetime = CURRENT_TIMESTAMP "
+                                f"WHERE update_datetime IS NULL"))
+        connection.execute(text(f"CREATE INDEX ix_{table}_update_datetime_id "
+                                f"ON {table} (update_datetime, id)"))
+    SyncWatermarkORM.__table__.create(connection)
+
+
+def _add_order_totals(connection: Connection) -> None:
+    connection.execute(text("ALTER TABLE orders "
+                            "ADD COLUMN total_amount FLOAT NOT NULL DEFAULT 0"))
+    connection.execute(text("ALTER TABLE orders ADD COLUMN line_count INTEGER NOT NULL DEFAULT 0"))
+    for statement in ORDER_TOTALS_DDL:
+        connection.execute(text(statement))
+    rebuild_order_totals(connection)
+
+
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (1, _add_indexes_and_association_key),
+    (2, _add_order_line_quantities),
+    (3, _add_product_search),
+    (4, _add_change_feed),
+    (5, _add_order_totals),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection: Connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def _set_version(connection: Connection, version: int) -> None:
+    connection.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def migrate(engine: Engine) -> int:
+    with immediate_transaction(engine) as connection:
+        version = get_version(connection)
+        if version == 0 and not inspect(connection).has_table("products"):
+            Base.metadata.create_all(connection)
+            _set_version(connection, LATEST_VERSION)
+            version = LATEST_VERSION
+
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with immediate_transaction(engine) as connection:
+            logging.info(f"Migrating database schema to version {migration_version}")
+            migration(connection)
+            _set_version(connection, migration_version)
+        version = migration_version
+    return version
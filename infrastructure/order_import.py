@@ -0,0 +1,53 @@
+import csv
+import json
+from pathlib import Path
+from typing import Iterator, List, NamedTuple
+
+ORDER_FILE_SUFFIXES = (".csv", ".jsonl", ".ndjson")
+
+
+class OrderRecord(NamedTuple):
+    address: str
+    product_ids: List[int]
+
+
+def _to_order(record: dict, line_number: int) -> OrderRecord:
+    try:
+        product_ids = record["product_ids"]
+        if isinstance(product_ids, str):
+            # CSV cells list the ids separated by spaces or semicolons, repeats add quantity.
+            product_ids = product_ids.replace(";", " ").split()
+        product_ids = [int(product_id) for product_id in product_ids]
+        if not product_ids:
+            raise ValueError("no product ids")
+        return OrderRecord(address=str(record["address"]), product_ids=product_ids)
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"Invalid order record on line {line_number}: {error}") from error
+
+
+def read_csv_orders(path: Path) -> Iterator[OrderRecord]:
+    with open(path, newline="", encoding="utf-8") as file:
+        for line_number, record in enumerate(csv.DictReader(file), start=2):
+            yield _to_order(record, line_number)
+
+
+def read_jsonl_orders(path: Path) -> Iterator[OrderRecord]:
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                yield _to_order(json.loads(line), line_number)
+
+
+def read_orders(path) -> Iterator[OrderRecord]:
+    path = Path(path)
+    if path.is_dir():
+        # A spool directory: every order file in it, oldest name first.
+        return (order
+                for file in sorted(path.iterdir())
+                if file.suffix.lower() in ORDER_FILE_SUFFIXES
+                for order in read_orders(file))
+    if path.suffix.lower() == ".csv":
+        return read_csv_orders(path)
+    if path.suffix.lower() in (".jsonl", ".ndjson"):
+        return read_jsonl_orders(path)
+    raise ValueError(f"Unsupported order file format: {path.suffix}")
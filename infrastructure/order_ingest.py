@@ -0,0 +1,115 @@
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from domain.exceptions import OutOfStockError, ProductNotFoundError
+from domain.services import WarehouseService
+from infrastructure.batching import chunked
+from infrastructure.database import create_warehouse_engine
+from infrastructure.order_import import OrderRecord
+from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+MAX_BUSY_RETRIES = 8
+BUSY_BACKOFF_SECONDS = 0.01
+
+
+@dataclass
+class WorkerStats:
+    worker: int
+    orders: int = 0
+    failures: int = 0
+    busy_retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def orders_per_second(self) -> float:
+        return self.orders / self.seconds if self.seconds else 0.0
+
+    def merge(self, other: "WorkerStats") -> None:
+        self.orders += other.orders
+        self.failures += other.failures
+        self.busy_retries += other.busy_retries
+        self.seconds += other.seconds
+
+
+def _is_busy(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+# One service per worker process, built by the pool initializer.
+_worker_service: Optional[WarehouseService] = None
+
+
+def _start_worker(url: str) -> None:
+    global _worker_service  # pylint: disable=global-statement
+    # A fresh engine: connections inherited from the parent process must not be reused.
+    engine = create_warehouse_engine(url)
+    session = sessionmaker(bind=engine)()
+    _worker_service = WarehouseService(SqlAlchemyProductRepository(session),
+                                       SqlAlchemyOrderRepository(session),
+                                       SqlAlchemyUnitOfWork(session))
+
+
+def create_order_with_retry(service: WarehouseService, order: OrderRecord,
+                            stats: WorkerStats) -> None:
+    for attempt in range(MAX_BUSY_RETRIES + 1):
+        try:
+            service.create_order(order.product_ids, order.address)
+            return
+        except OperationalError as error:
+            service.uow.rollback()
+            if not _is_busy(error) or attempt == MAX_BUSY_RETRIES:
+                raise
+            stats.busy_retries += 1
+            # Exponential backoff with jitter so that blocked workers do not retry in step.
+            time.sleep(BUSY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def ingest_chunk(orders: List[OrderRecord],
+                 service: Optional[WarehouseService] = None) -> WorkerStats:
+    service = service or _worker_service
+    stats = WorkerStats(worker=os.getpid())
+    started = time.perf_counter()
+    for order in orders:
+        try:
+            create_order_with_retry(service, order, stats)
+            stats.orders += 1
+        except (ProductNotFoundError, OutOfStockError, OperationalError):
+            stats.failures += 1
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Any other bad order fails on its own instead of losing the rest of the chunk.
+            service.uow.rollback()
+            stats.failures += 1
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def ingest_orders(url: str, orders: Iterable[OrderRecord], workers: int = 4,
+                  chunk_size: int = 500) -> Dict[int, WorkerStats]:
+    per_worker: Dict[int, WorkerStats] = {}
+
+    def collect(done) -> None:
+        for future in done:
+            stats = future.result()
+            per_worker.setdefault(stats.worker, WorkerStats(worker=stats.worker)).merge(stats)
+
+    # Only a few chunks per worker are submitted at a time, so a large import is read
+    # from its source as the workers need it rather than queued in memory up front.
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                             initargs=(url,)) as executor:
+        pending = set()
+        for chunk in chunked(orders, chunk_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(ingest_chunk, chunk))
+        collect(wait(pending).done)
+    return per_worker
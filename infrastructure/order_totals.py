@@ -0,0 +1,74 @@
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from .batching import IN_CLAUSE_CHUNK_SIZE, chunked
+from .database import immediate_transaction
+from .orm import OrderORM, ProductORM, order_product_associations
+
+# Float sums built up line by line differ from a fresh sum in the last bits.
+TOTAL_TOLERANCE = 1e-6
+
+_orders = OrderORM.__table__
+_lines = order_product_associations
+_products = ProductORM.__table__
+# Same amount per line as the triggers compute.
+_LINE_AMOUNT = _lines.c.quantity * func.coalesce(_lines.c.unit_price, _products.c.price, 0)
+
+
+class OrderTotalsCheck(NamedTuple):
+    checked: int
+    # Orders whose stored totals did not match their lines.
+    mismatched: List[int]
+    rebuilt: bool
+
+
+def _line_totals():
+    return (
+        select(_lines.c.order_id.label("order_id"),
+               func.sum(_LINE_AMOUNT).label("total_amount"),
+               func.count().label("line_count"))
+        .select_from(_lines.outerjoin(_products, _products.c.id == _lines.c.product_id))
+        .group_by(_lines.c.order_id)
+    )
+
+
+def _mismatched_ids(connection: Connection) -> List[int]:
+    totals = _line_totals().subquery()
+    return list(connection.scalars(
+        select(_orders.c.id)
+        .outerjoin(totals, totals.c.order_id == _orders.c.id)
+        .where((_orders.c.line_count != func.coalesce(totals.c.line_count, 0))
+               | (func.abs(_orders.c.total_amount - func.coalesce(totals.c.total_amount, 0))
+                  > TOTAL_TOLERANCE))
+        .order_by(_orders.c.id)
+    ))
+
+
+def rebuild_order_totals(connection: Connection,
+                         order_ids: Optional[Iterable[int]] = None) -> None:
+    """Recompute the stored totals from the lines, of all orders or of the given ones."""
+    for_order = _lines.c.order_id == _orders.c.id
+    statement = update(_orders).values(
+        total_amount=select(func.coalesce(func.sum(_LINE_AMOUNT), 0.0))
+        .select_from(_lines.outerjoin(_products, _products.c.id == _lines.c.product_id))
+        .where(for_order).scalar_subquery(),
+        line_count=select(func.count()).where(for_order).scalar_subquery(),
+        # A corrected total is not a change of the order, change feeds do not see it again.
+        update_datetime=_orders.c.update_datetime,
+    )
+    if order_ids is None:
+        connection.execute(statement)
+        return
+    for chunk in chunked(order_ids, IN_CLAUSE_CHUNK_SIZE):
+        connection.execute(statement.where(_orders.c.id.in_(chunk)))
+
+
+def verify_order_totals(engine: Engine, rebuild: bool = False) -> OrderTotalsCheck:
+    with immediate_transaction(engine) as connection:
+        checked = connection.scalar(select(func.count()).select_from(_orders))
+        mismatched = _mismatched_ids(connection)
+        if rebuild and mismatched:
+            rebuild_order_totals(connection, mismatched)
+    return OrderTotalsCheck(checked, mismatched, rebuild and bool(mismatched))
@@ -1,10 +1,20 @@
-from sqlalchemy import Column, Integer, String, Float, Table, ForeignKey, DateTime, Boolean
+from sqlalchemy import (DDL, Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Index,
+                        column, event, table, text)
+from sqlalchemy.dialects.sqlite import DATETIME
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
 
 Base = declarative_base()
 
+# Same text layout as SQLite's CURRENT_TIMESTAMP, which fills these columns server side. With
+# the default layout bound datetimes get microseconds and no longer compare equal to them.
+Timestamp = DateTime().with_variant(
+    DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d "
+                            "%(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
 class ProductORM(Base):
     __tablename__ = 'products'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -12,22 +22,100 @@ class ProductORM(Base):
     quantity=Column(Integer)
     price=Column(Float)
     is_active = Column(Boolean, default=True)
-    update_datetime = Column(DateTime,  server_default=func.now(), onupdate=func.now())
+    update_datetime = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('ix_products_active_id', 'id', sqlite_where=text('is_active = 1')),
+        Index('ix_products_update_datetime_id', 'update_datetime', 'id'),
+    )
 
 class OrderORM(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    create_datetime = Column(DateTime, server_default=func.now())
-    update_datetime = Column(DateTime,  server_default=func.now(), onupdate=func.now())
+    create_datetime = Column(Timestamp, server_default=func.now())
+    update_datetime = Column(Timestamp, server_default=func.now(), onupdate=func.now())
     id_product = Column(Integer, ForeignKey('products.id'))
-    is_deleted = Column(Boolean)
+    is_deleted = Column(Boolean, default=False)
     address = Column(String)
+    # Kept up to date by the ORDER_TOTALS_DDL triggers on every write to the lines.
+    total_amount = Column(Float, nullable=False, default=0.0, server_default='0')
+    line_count = Column(Integer, nullable=False, default=0, server_default='0')
 
+    __table_args__ = (
+        Index('ix_orders_live_id', 'id', sqlite_where=text('is_deleted = 0')),
+        Index('ix_orders_update_datetime_id', 'update_datetime', 'id'),
+    )
 
-order_product_associations = Table(
-    'order_product_associations', Base.metadata,
-    Column('order_id', ForeignKey('orders.id')),
-    Column('product_id', ForeignKey('products.id'))
-)
 
-OrderORM.products = relationship("ProductORM", secondary=order_product_associations)
+class OrderLineORM(Base):
+    __tablename__ = 'order_product_associations'
+    order_id = Column(ForeignKey('orders.id'), primary_key=True)
+    product_id = Column(ForeignKey('products.id'), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=1, server_default='1')
+    unit_price = Column(Float)
+
+    __table_args__ = (
+        Index('ix_order_product_associations_product_id', 'product_id'),
+    )
+
+
+class SyncWatermarkORM(Base):
+    # Position of a change feed consumer: the last (update_datetime, id) it has processed.
+    __tablename__ = 'sync_watermarks'
+    consumer = Column(String, primary_key=True)
+    feed = Column(String, primary_key=True)
+    changed_at = Column(Timestamp)
+    last_id = Column(Integer, nullable=False, default=0)
+
+
+order_product_associations = OrderLineORM.__table__
+
+OrderLineORM.product = relationship(ProductORM, overlaps="products")
+OrderORM.lines = relationship(OrderLineORM, cascade="all, delete-orphan", overlaps="products")
+OrderORM.products = relationship("ProductORM", secondary=order_product_associations,
+                                 overlaps="lines,product")
+
+
+# Full-text index over product names. An external-content FTS5 table stores only the index,
+# the triggers keep it in step with every insert, rename and delete on "products".
+PRODUCT_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE products_fts USING fts5("
+    "name, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "END",
+    "CREATE TRIGGER products_fts_update AFTER UPDATE OF name ON products BEGIN "
+    "INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO products_fts (rowid, name) VALUES (new.id, new.name); END",
+]
+
+for _statement in PRODUCT_SEARCH_DDL:
+    event.listen(ProductORM.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+
+# Denormalized order totals: each insert, update and delete of a line adds its difference to
+# total_amount and line_count of the order, whichever code path wrote the line.
+_LINE_AMOUNT = ("{row}.quantity * coalesce({row}.unit_price, "
+                "(SELECT price FROM products WHERE id = {row}.product_id), 0)")
+_ADD_LINE = ("UPDATE orders SET total_amount = total_amount + " + _LINE_AMOUNT.format(row="new")
+             + ", line_count = line_count + 1 WHERE id = new.order_id;")
+_REMOVE_LINE = ("UPDATE orders SET total_amount = total_amount - "
+                + _LINE_AMOUNT.format(row="old")
+                + ", line_count = line_count - 1 WHERE id = old.order_id;")
+ORDER_TOTALS_DDL = [
+    f"CREATE TRIGGER order_totals_insert AFTER INSERT ON order_product_associations "
+    f"BEGIN {_ADD_LINE} END",
+    f"CREATE TRIGGER order_totals_delete AFTER DELETE ON order_product_associations "
+    f"BEGIN {_REMOVE_LINE} END",
+    f"CREATE TRIGGER order_totals_update AFTER UPDATE OF order_id, product_id, quantity, "
+    f"unit_price ON order_product_associations BEGIN {_REMOVE_LINE} {_ADD_LINE} END",
+]
+
+for _statement in ORDER_TOTALS_DDL:
+    event.listen(order_product_associations, "after_create",
+                 DDL(_statement).execute_if(dialect="sqlite"))
+
+products_fts = table("products_fts", column("rowid"), column("rank"), column("products_fts"))
@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import case, event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from domain.exceptions import ProductNotFoundError
+from domain.models import Order, OrderLine, Product
+from .batching import IN_CLAUSE_CHUNK_SIZE, chunked
+from .orm import OrderLineORM, OrderORM, ProductORM
+
+# Statements and mappings shared by the sync and async SQLAlchemy repositories.
+
+# The identity map only holds weak references, so rows loaded by one repository are
+# pinned here until the transaction ends and can be reused by the others.
+LOADED_PRODUCTS = "loaded_products"
+
+# A reservation binds every product id three times (IN list and two CASE branches).
+RESERVE_CHUNK_SIZE = IN_CLAUSE_CHUNK_SIZE // 3
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_loaded_products(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(LOADED_PRODUCTS, None)
+
+
+def load_product_orms(session: Session, product_ids: Iterable[int]) -> Dict[int, ProductORM]:
+    # Async repositories call this through AsyncSession.run_sync.
+    loaded = session.info.setdefault(LOADED_PRODUCTS, {})
+    found = {}
+    pending = []
+    for product_id in dict.fromkeys(product_ids):
+        product_orm = loaded.get(product_id)
+        if product_orm is not None and inspect(product_orm).persistent \
+                and not inspect(product_orm).expired:
+            found[product_id] = product_orm
+        else:
+            pending.append(product_id)
+
+    for chunk in chunked(pending, IN_CLAUSE_CHUNK_SIZE):
+        for product_orm in session.scalars(select(ProductORM).where(ProductORM.id.in_(chunk))):
+            found[product_orm.id] = product_orm
+    loaded.update(found)
+
+    missing = [product_id for product_id in pending if product_id not in found]
+    if missing:
+        raise ProductNotFoundError(missing)
+    return found
+
+
+def reserve_stock_statements(quantities: Dict[int, int]) -> Iterator:
+    # Checks and decrements stock in the database itself, so concurrent orders can never
+    # both take the last units. The returned ids are the products that had enough stock.
+    for chunk in chunked(quantities.items(), RESERVE_CHUNK_SIZE):
+        requested = case(dict(chunk), value=ProductORM.id)
+        yield (
+            update(ProductORM)
+            .where(ProductORM.id.in_([product_id for product_id, _ in chunk]),
+                   ProductORM.quantity >= requested)
+            .values(quantity=ProductORM.quantity - requested)
+            .returning(ProductORM.id)
+            .execution_options(synchronize_session="fetch")
+        )
+
+
+def release_stock_statements(quantities: Dict[int, int]) -> Iterator:
+    # Units given back by orders, added in the database like reservations are taken.
+    for chunk in chunked(quantities.items(), RESERVE_CHUNK_SIZE):
+        released = case(dict(chunk), value=ProductORM.id)
+        yield (
+            update(ProductORM)
+            .where(ProductORM.id.in_([product_id for product_id, _ in chunk]))
+            .values(quantity=ProductORM.quantity + released)
+            .execution_options(synchronize_session="fetch")
+        )
+
+
+def product_to_domain(product_orm: ProductORM) -> Product:
+    return Product(id=product_orm.id, name=product_orm.name, quantity=product_orm.quantity,
+                   price=product_orm.price, is_active=product_orm.is_active)
+
+
+def order_to_domain(order_orm: OrderORM) -> Order:
+    order = Order(
+        id=order_orm.id,
+        create_datetime=order_orm.create_datetime,
+        update_datetime=order_orm.update_datetime,
+        address=order_orm.address
+    )
+    for line_orm in order_orm.lines:
+        if line_orm.product is None:
+            # Products are deleted for good, the line still knows its price.
+            product = Product(id=line_orm.product_id, name=None, quantity=0,
+                              price=line_orm.unit_price, is_active=False)
+        else:
+            product = product_to_domain(line_orm.product)
+        unit_price = product.price if line_orm.unit_price is None else line_orm.unit_price
+        order.lines[product.id] = OrderLine(product=product, quantity=line_orm.quantity,
+                                            unit_price=unit_price)
+    return order
+
+
+def lines_option(loader):
+    return loader(OrderORM.lines).joinedload(OrderLineORM.product)
+
+
+def sync_lines(order_orm: OrderORM, order: Order, products_orm: Dict[int, ProductORM]) -> None:
+    existing = {line_orm.product_id: line_orm for line_orm in order_orm.lines}
+    lines_orm = []
+    for product_id, line in order.lines.items():
+        line_orm = existing.get(product_id)
+        if line_orm is None:
+            line_orm = OrderLineORM(product=products_orm[product_id])
+        line_orm.quantity = line.quantity
+        line_orm.unit_price = line.unit_price
+        lines_orm.append(line_orm)
+    order_orm.lines = lines_orm
+
+
+def new_product_ids(order_orm: OrderORM, order: Order) -> List[int]:
+    existing = {line_orm.product_id for line_orm in order_orm.lines}
+    return [product_id for product_id in order.lines if product_id not in existing]
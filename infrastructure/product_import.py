@@ -0,0 +1,71 @@
+import csv
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+
+from domain.models import Product, ProductAdjustment
+
+TRUE_VALUES = {"1", "true", "yes", "y"}
+
+
+def _to_product(record: dict, line_number: int) -> Product:
+    try:
+        is_active = record.get("is_active", True)
+        if isinstance(is_active, str):
+            is_active = is_active.strip().lower() in TRUE_VALUES if is_active.strip() else True
+        return Product(
+            id=None,
+            name=str(record["name"]),
+            quantity=int(record["quantity"]),
+            price=float(record["price"]),
+            is_active=bool(is_active)
+        )
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"Invalid product record on line {line_number}: {error}") from error
+
+
+def read_csv_products(path: Path) -> Iterator[Product]:
+    with open(path, newline="", encoding="utf-8") as file:
+        for line_number, record in enumerate(csv.DictReader(file), start=2):
+            yield _to_product(record, line_number)
+
+
+def read_jsonl_products(path: Path) -> Iterator[Product]:
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                yield _to_product(json.loads(line), line_number)
+
+
+def read_products(path) -> Iterator[Product]:
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return read_csv_products(path)
+    if path.suffix.lower() in (".jsonl", ".ndjson"):
+        return read_jsonl_products(path)
+    raise ValueError(f"Unsupported product file format: {path.suffix}")
+
+
+def _to_adjustment(record: dict, line_number: int) -> tuple:
+    try:
+        return int(record["product_id"]), ProductAdjustment(
+            price_percent=float(record.get("price_percent") or 0),
+            price_amount=float(record.get("price_amount") or 0),
+            quantity_delta=int(record.get("quantity_delta") or 0),
+        )
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"Invalid adjustment record on line {line_number}: {error}") from error
+
+
+def read_adjustments(path) -> Dict[int, ProductAdjustment]:
+    # product_id plus any of price_percent, price_amount and quantity_delta per row.
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.suffix.lower() == ".csv":
+            records: Iterable = enumerate(csv.DictReader(file), start=2)
+        elif path.suffix.lower() in (".jsonl", ".ndjson"):
+            records = ((number, json.loads(line))
+                       for number, line in enumerate(file, start=1) if line.strip())
+        else:
+            raise ValueError(f"Unsupported adjustment file format: {path.suffix}")
+        return dict(_to_adjustment(record, number) for number, record in records)
@@ -0,0 +1,156 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import sessionmaker
+
+from domain.models import (ChangeWatermark, Order, OrderChange, OrderSummary, Product,
+                           ProductAdjustment, ProductBatch, ProductChange, ProductSelection)
+from domain.repositories import OrderRepository, ProductRepository
+from .database import DATABASE_URL, create_warehouse_engine
+from .repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from .unit_of_work import READ_ONLY_SESSION
+
+# Pure reads run on their own pool of query_only connections, one short session per call:
+# nothing is autoflushed, snapshotted for the unit of work or kept in an identity map, and
+# under WAL they never wait for the connection that writes orders.
+
+
+class ReadOnlyRepositoryError(RuntimeError):
+    pass
+
+
+def create_read_only_engine(url: str = DATABASE_URL, profile: str = "production",
+                            **engine_kwargs) -> Engine:
+    if make_url(url).database in (None, "", ":memory:"):
+        raise ValueError("An in-memory database cannot be opened by a second engine")
+    engine = create_warehouse_engine(url, profile, **engine_kwargs)
+
+    @event.listens_for(engine, "connect")
+    def _set_query_only(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only = 1")
+        cursor.close()
+    return engine
+
+
+def read_only_session_factory(engine: Engine) -> sessionmaker:
+    return sessionmaker(bind=engine, autoflush=False, expire_on_commit=False,
+                        info={READ_ONLY_SESSION: True})
+
+
+def _read_only():
+    raise ReadOnlyRepositoryError("Writes are not allowed through a read-only repository")
+
+
+class ReadOnlyProductRepository(ProductRepository):
+    def __init__(self, session_factory: sessionmaker):
+        self.session_factory = session_factory
+
+    def _run(self, method: str, *args):
+        with self.session_factory() as session:
+            return getattr(SqlAlchemyProductRepository(session), method)(*args)
+
+    def _stream(self, method: str, *args) -> Iterator:
+        # The session stays open for as long as the caller iterates.
+        with self.session_factory() as session:
+            yield from getattr(SqlAlchemyProductRepository(session), method)(*args)
+
+    def get(self, product_id: int) -> Product:
+        return self._run("get", product_id)
+
+    def get_many(self, product_ids: List[int]) -> List[Product]:
+        return self._run("get_many", product_ids)
+
+    def list(self) -> List[Product]:
+        return self._run("list")
+
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Product]:
+        return self._run("list_page", after_id, limit)
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> List[Product]:
+        return self._run("search", query, offset, limit)
+
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[ProductChange]]:
+        return self._stream("changes_since", watermark, batch_size)
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Product]:
+        return self._stream("iter_all", batch_size)
+
+    def iter_batches(self, batch_size: int = 10000,
+                     selection: Optional[ProductSelection] = None) -> Iterator[ProductBatch]:
+        return self._stream("iter_batches", batch_size, selection)
+
+    def add(self, product: Product) -> None:
+        _read_only()
+
+    def add_many(self, products: Iterable[Product], batch_size: int = 1000,
+                 upsert_by_name: bool = False) -> int:
+        _read_only()
+
+    def update(self, product: Product) -> None:
+        _read_only()
+
+    def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        _read_only()
+
+    def release_stock(self, quantities: Dict[int, int]) -> None:
+        _read_only()
+
+    def adjust_many(self, selection: ProductSelection, adjustment: ProductAdjustment) -> int:
+        _read_only()
+
+    def adjust_each(self, adjustments: Dict[int, ProductAdjustment]) -> int:
+        _read_only()
+
+    def delete(self, product_id: int) -> None:
+        _read_only()
+
+
+class ReadOnlyOrderRepository(OrderRepository):
+    def __init__(self, session_factory: sessionmaker):
+        self.session_factory = session_factory
+
+    def _run(self, method: str, *args):
+        with self.session_factory() as session:
+            return getattr(SqlAlchemyOrderRepository(session), method)(*args)
+
+    def _stream(self, method: str, *args) -> Iterator:
+        with self.session_factory() as session:
+            yield from getattr(SqlAlchemyOrderRepository(session), method)(*args)
+
+    def get(self, order_id: int) -> Optional[Order]:
+        return self._run("get", order_id)
+
+    def list(self) -> List[Order]:
+        return self._run("list")
+
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        return self._run("list_page", after_id, limit)
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Order]:
+        return self._stream("iter_all", batch_size)
+
+    def list_summaries(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[OrderSummary]:
+        return self._run("list_summaries", after_id, limit)
+
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[OrderChange]]:
+        return self._stream("changes_since", watermark, batch_size)
+
+    def add(self, order: Order) -> None:
+        _read_only()
+
+    def update(self, order: Order) -> None:
+        _read_only()
+
+    def delete(self, order_id: int) -> None:
+        _read_only()
+
+    def delete_product(self, order: Order, product: Product) -> Order:
+        _read_only()
+
+    def delete_one_quantity_product(self, order: Order, product: Product) -> Order:
+        _read_only()
@@ -1,11 +1,96 @@
-import logging
-from typing import List
+import re
+from functools import wraps
+from typing import Dict, Iterable, Iterator, List, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Integer, bindparam, case, func, insert, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload, selectinload
 
-from domain.models import Order, Product
-from domain.repositories import ProductRepository, OrderRepository
-from .orm import ProductORM, OrderORM
+from domain.exceptions import OutOfStockError
+from domain.models import (AddressOrderValueRow, ChangeWatermark, InventoryTotals, Order,
+                           OrderChange, OrderSummary, Product, ProductAdjustment, ProductBatch,
+                           ProductChange, ProductSelection, StockRow)
+from domain.repositories import (OrderRepository, ProductRepository, ReportRepository,
+                                 WatermarkRepository)
+from .batching import IN_CLAUSE_CHUNK_SIZE, chunked
+from .orm import OrderLineORM, OrderORM, ProductORM, SyncWatermarkORM, Timestamp, products_fts
+from .orm_mapping import (lines_option, load_product_orms, order_to_domain, product_to_domain,
+                          release_stock_statements, reserve_stock_statements)
+from .unit_of_work import flush_changes, get_change_tracker
+
+# update_datetime only has second resolution: rows stamped in the current second may still
+# be joined by others from transactions that have not committed yet, so feeds stop short.
+CHANGE_FEED_SETTLE_SECONDS = 1
+
+
+# Rows passed to one executemany of per-product adjustments.
+ADJUST_CHUNK_SIZE = 1000
+
+
+def _selected(statement, selection: Optional[ProductSelection]) -> Iterator:
+    # Applies a selection to a SELECT or UPDATE of products: a single statement, or one
+    # per chunk of explicit ids.
+    selection = selection or ProductSelection()
+    if not selection.include_inactive:
+        statement = statement.filter_by(is_active=True)
+    if selection.name_prefix is not None:
+        statement = statement.where(ProductORM.name.startswith(selection.name_prefix,
+                                                               autoescape=True))
+    if selection.min_price is not None:
+        statement = statement.where(ProductORM.price >= selection.min_price)
+    if selection.max_price is not None:
+        statement = statement.where(ProductORM.price <= selection.max_price)
+    if selection.ids is None:
+        yield statement
+        return
+    for chunk in chunked(sorted(set(selection.ids)), IN_CLAUSE_CHUNK_SIZE):
+        yield statement.where(ProductORM.id.in_(chunk))
+
+
+def _not_negative(expression):
+    return case((expression < 0, 0), else_=expression)
+
+
+def _reads_changes(method):
+    # Changes waiting in the unit of work are written before reading, like ORM autoflush.
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        flush_changes(self.session)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _search_expression(query: str) -> str:
+    # Every word of the query must match the start of a word in the name. Words are quoted
+    # so that user input is never parsed as FTS5 operators.
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+
+def _changed_rows(session: Session, entity, watermark: ChangeWatermark, batch_size: int,
+                  options=()) -> Iterator[List]:
+    settled = session.scalar(
+        select(func.datetime("now", f"-{CHANGE_FEED_SETTLE_SECONDS} seconds", type_=Timestamp)))
+    query = (
+        select(entity)
+        .where(entity.update_datetime < settled)
+        .options(*options)
+        .order_by(entity.update_datetime, entity.id)
+        .limit(batch_size)
+    )
+    while True:
+        batch_query = query
+        if watermark.changed_at is not None:
+            batch_query = query.where(
+                tuple_(entity.update_datetime, entity.id) >
+                tuple_(watermark.changed_at, watermark.id, types=[Timestamp, Integer]))
+        rows = session.scalars(batch_query).all()
+        if not rows:
+            return
+        # Read before yielding, the consumer may commit and expire the rows.
+        watermark = ChangeWatermark(rows[-1].update_datetime, rows[-1].id)
+        yield rows
+        if len(rows) < batch_size:
+            return
 
 
 class SqlAlchemyProductRepository(ProductRepository):
@@ -13,26 +98,82 @@ class SqlAlchemyProductRepository(ProductRepository):
         self.session = session
 
     def add(self, product: Product):
-        product_orm = ProductORM(
-            name=product.name,
-            quantity=product.quantity,
-            price=product.price,
-            is_active=True
-        )
-        self.session.add(product_orm)
-        self.session.flush()
-        product.id = product_orm.id
+        product.id = self.session.execute(
+            insert(ProductORM.__table__)
+            .values(name=product.name, quantity=product.quantity, price=product.price,
+                    is_active=product.is_active)
+            .returning(ProductORM.id)
+        ).scalar_one()
+        get_change_tracker(self.session).track_product(product)
+
+    @_reads_changes
+    def add_many(self, products: Iterable[Product], batch_size: int = 1000,
+                 upsert_by_name: bool = False) -> int:
+        count = 0
+        updated = False
+        for batch in chunked(products, batch_size):
+            rows = [
+                {"name": p.name, "quantity": p.quantity, "price": p.price,
+                 "is_active": p.is_active}
+                for p in batch
+            ]
+            if upsert_by_name:
+                rows = list({row["name"]: row for row in rows}.values())
+                rows, updated_rows = self._update_by_name(rows)
+                updated = updated or updated_rows
+            if rows:
+                self.session.execute(insert(ProductORM.__table__), rows)
+            count += len(batch)
+        if updated:
+            self.session.expire_all()
+        return count
+
+    def _update_by_name(self, rows: List[dict]) -> tuple:
+        ids_by_name = {}
+        for chunk in chunked([row["name"] for row in rows], IN_CLAUSE_CHUNK_SIZE):
+            for product_id, name in self.session.execute(
+                    select(ProductORM.id, ProductORM.name).where(ProductORM.name.in_(chunk))):
+                ids_by_name.setdefault(name, []).append(product_id)
+
+        updates = [
+            {"b_id": product_id, "b_quantity": row["quantity"], "b_price": row["price"],
+             "b_is_active": row["is_active"]}
+            for row in rows
+            for product_id in ids_by_name.get(row["name"], [])
+        ]
+        if updates:
+            self.session.execute(
+                update(ProductORM.__table__)
+                .where(ProductORM.__table__.c.id == bindparam("b_id"))
+                .values(quantity=bindparam("b_quantity"), price=bindparam("b_price"),
+                        is_active=bindparam("b_is_active")),
+                updates
+            )
+        return [row for row in rows if row["name"] not in ids_by_name], len(updates)
 
+    @_reads_changes
     def get(self, product_id: int) -> Product:
         product_orm = self.session.query(ProductORM).filter_by(id=product_id).one()
-        return Product(
+        product = Product(
             id=product_orm.id,
             name=product_orm.name,
             quantity=product_orm.quantity,
             price=product_orm.price,
             is_active=product_orm.is_active
         )
+        get_change_tracker(self.session).track_product(product)
+        return product
 
+    @_reads_changes
+    def get_many(self, product_ids: List[int]) -> List[Product]:
+        products_orm = load_product_orms(self.session, product_ids)
+        return [
+            Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price,
+                    is_active=p.is_active)
+            for p in (products_orm[product_id] for product_id in product_ids)
+        ]
+
+    @_reads_changes
     def list(self) -> List[Product]:
         products_orm = self.session.query(ProductORM).filter_by(is_active=True).all()
         return [
@@ -40,107 +181,285 @@ class SqlAlchemyProductRepository(ProductRepository):
             for p in products_orm
         ]
 
+    @_reads_changes
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Product]:
+        query = select(ProductORM).filter_by(is_active=True)
+        if after_id is not None:
+            query = query.where(ProductORM.id > after_id)
+        products_orm = self.session.scalars(query.order_by(ProductORM.id).limit(limit))
+        return [
+            Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price)
+            for p in products_orm
+        ]
+
+    @_reads_changes
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> List[Product]:
+        expression = _search_expression(query)
+        if not expression:
+            return []
+        # Inactive products are filtered before ranking and the page is cut in SQL, so a
+        # page is never short because of matches that do not count.
+        products_orm = self.session.scalars(
+            select(ProductORM)
+            .join(products_fts, products_fts.c.rowid == ProductORM.id)
+            .where(products_fts.c.products_fts.op("MATCH")(expression),
+                   ProductORM.is_active.is_(True))
+            .order_by(products_fts.c.rank, ProductORM.id)
+            .offset(offset)
+            .limit(limit)
+        )
+        return [
+            Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price)
+            for p in products_orm
+        ]
+
+    @_reads_changes
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[ProductChange]]:
+        for rows in _changed_rows(self.session, ProductORM, watermark, batch_size):
+            yield [ProductChange(product_to_domain(p), p.update_datetime) for p in rows]
+
+    @_reads_changes
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Product]:
+        products_orm = self.session.scalars(
+            select(ProductORM)
+            .filter_by(is_active=True)
+            .order_by(ProductORM.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for p in products_orm:
+            yield Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price)
+
+    @_reads_changes
+    def iter_batches(self, batch_size: int = 10000,
+                     selection: Optional[ProductSelection] = None) -> Iterator[ProductBatch]:
+        query = select(ProductORM.id, func.coalesce(ProductORM.quantity, 0),
+                       func.coalesce(ProductORM.price, 0.0))
+        for statement in _selected(query, selection):
+            result = self.session.execute(
+                statement
+                .order_by(ProductORM.id)
+                .execution_options(yield_per=batch_size)
+            )
+            for rows in result.partitions():
+                yield ProductBatch.from_rows(rows)
+
+    @_reads_changes
+    def adjust_many(self, selection: ProductSelection, adjustment: ProductAdjustment) -> int:
+        # One set-based UPDATE, the rows never leave the database.
+        values = {}
+        if adjustment.changes_price:
+            values["price"] = _not_negative(
+                ProductORM.price * adjustment.price_factor + adjustment.price_amount)
+        if adjustment.quantity_delta:
+            values["quantity"] = _not_negative(ProductORM.quantity + adjustment.quantity_delta)
+        if not values:
+            return 0
+        statement = update(ProductORM).values(values) \
+            .execution_options(synchronize_session=False)
+        count = sum(self.session.execute(selected).rowcount
+                    for selected in _selected(statement, selection))
+        self.session.expire_all()
+        return count
+
+    @_reads_changes
+    def adjust_each(self, adjustments: Dict[int, ProductAdjustment]) -> int:
+        products = ProductORM.__table__
+        statement = (
+            update(products)
+            .where(products.c.id == bindparam("b_id"))
+            .values(price=_not_negative(products.c.price * bindparam("b_factor")
+                                        + bindparam("b_amount")),
+                    quantity=_not_negative(products.c.quantity + bindparam("b_delta")))
+        )
+        count = 0
+        for chunk in chunked(adjustments.items(), ADJUST_CHUNK_SIZE):
+            count += self.session.execute(statement, [
+                {"b_id": product_id, "b_factor": adjustment.price_factor,
+                 "b_amount": adjustment.price_amount, "b_delta": adjustment.quantity_delta}
+                for product_id, adjustment in chunk
+            ]).rowcount
+        self.session.expire_all()
+        return count
+
     def update(self, product: Product) -> None:
-        product_orm = self.session.query(ProductORM).get(product.id)
-        if product_orm:
-            product_orm.name = product.name
-            product_orm.quantity = product.quantity
-            product_orm.price = product.price
-            product_orm.is_active = product.is_active
-            self.session.add(product_orm)
+        get_change_tracker(self.session).mark_product(product)
+
+    @_reads_changes
+    def reserve_stock(self, quantities: Dict[int, int]) -> None:
+        reserved = set()
+        for statement in reserve_stock_statements(quantities):
+            reserved.update(self.session.scalars(statement))
+        if len(reserved) < len(quantities):
+            raise OutOfStockError(set(quantities) - reserved)
+
+    @_reads_changes
+    def release_stock(self, quantities: Dict[int, int]) -> None:
+        for statement in release_stock_statements(quantities):
+            self.session.execute(statement)
 
     def delete(self, product_id: int) -> None:
-        product_orm = self.session.query(ProductORM).get(product_id)
-        if product_orm:
-            self.session.delete(product_orm)
+        get_change_tracker(self.session).delete_product(product_id)
 
 
 class SqlAlchemyOrderRepository(OrderRepository):
+    # A single order is fetched together with its lines in one JOIN, while lists
+    # load all lines with one extra "IN" query instead of one query per order.
+    get_lines_loader = staticmethod(joinedload)
+    list_lines_loader = staticmethod(selectinload)
+
     def __init__(self, session: Session):
         self.session = session
 
     def add(self, order: Order) -> None:
-        order_orm = OrderORM(
-            address=order.address
-        )
-        order_orm.products = [
-            self.session.query(ProductORM).get(p.id)
-            for p in order.products
-        ]
-
-        order.create_datetime = order_orm.create_datetime
-        order.update_datetime = order_orm.update_datetime
-        self.session.add(order_orm)
-        self.session.flush()
-        order.id = order_orm.id
-
+        order_table = OrderORM.__table__
+        order.id, order.create_datetime, order.update_datetime = self.session.execute(
+            insert(order_table)
+            .values(address=order.address, is_deleted=False)
+            .returning(order_table.c.id, order_table.c.create_datetime,
+                       order_table.c.update_datetime)
+        ).one()
+        # The lines are written together with the other changes when the unit of work commits.
+        get_change_tracker(self.session).track_order(order, lines_stored=False)
 
+    @_reads_changes
     def get(self, order_id: int) -> Order:
-        order_orm = self.session.query(OrderORM).get(order_id)
-        if order_orm is None:
+        order_orm = self.session.get(OrderORM, order_id,
+                                     options=[lines_option(self.get_lines_loader)])
+        if order_orm is None or order_orm.is_deleted:
             return None
-        products = [
-            Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price, is_active=p.is_active)
-            for p in order_orm.products
-        ]
-        return Order(
-            id=order_orm.id,
-            products=products,
-            create_datetime=order_orm.create_datetime,
-            update_datetime=order_orm.update_datetime,
-            address=order_orm.address
-        )
+        order = order_to_domain(order_orm)
+        get_change_tracker(self.session).track_order(order)
+        return order
 
+    @_reads_changes
     def list(self) -> List[Order]:
-        orders_orm = self.session.query(OrderORM).filter_by(is_deleted=False).all()
-        orders = []
+        orders_orm = self.session.scalars(
+            select(OrderORM)
+            .filter_by(is_deleted=False)
+            .options(lines_option(self.list_lines_loader))
+        )
+        return [order_to_domain(order_orm) for order_orm in orders_orm]
+
+    @_reads_changes
+    def list_page(self, after_id: Optional[int] = None, limit: int = 100) -> List[Order]:
+        query = select(OrderORM).filter_by(is_deleted=False)
+        if after_id is not None:
+            query = query.where(OrderORM.id > after_id)
+        orders_orm = self.session.scalars(
+            query
+            .order_by(OrderORM.id)
+            .limit(limit)
+            .options(lines_option(self.list_lines_loader))
+        )
+        return [order_to_domain(order_orm) for order_orm in orders_orm]
+
+    @_reads_changes
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Order]:
+        orders_orm = self.session.scalars(
+            select(OrderORM)
+            .filter_by(is_deleted=False)
+            .order_by(OrderORM.id)
+            # Joined eager loading cannot be combined with yield_per, even for the products.
+            .options(selectinload(OrderORM.lines).selectinload(OrderLineORM.product))
+            .execution_options(yield_per=batch_size)
+        )
         for order_orm in orders_orm:
-            products = [
-                Product(id=p.id, name=p.name, quantity=p.quantity, price=p.price)
-                for p in order_orm.products
-            ]
-            orders.append(Order(id=order_orm.id, products=products,
-                                create_datetime=order_orm.create_datetime,
-                                update_datetime=order_orm.update_datetime,
-                                address=order_orm.address))
-        return orders
+            yield order_to_domain(order_orm)
+
+    @_reads_changes
+    def list_summaries(self, after_id: Optional[int] = None, limit: int = 100) \
+            -> List[OrderSummary]:
+        orders = OrderORM.__table__
+        query = select(orders.c.id, orders.c.address, orders.c.create_datetime,
+                       orders.c.update_datetime, orders.c.total_amount,
+                       orders.c.line_count).where(orders.c.is_deleted.is_(False))
+        if after_id is not None:
+            query = query.where(orders.c.id > after_id)
+        rows = self.session.execute(query.order_by(orders.c.id).limit(limit))
+        return [OrderSummary._make(row) for row in rows]
+
+    @_reads_changes
+    def changes_since(self, watermark: ChangeWatermark, batch_size: int = 1000) \
+            -> Iterator[List[OrderChange]]:
+        options = [selectinload(OrderORM.lines).selectinload(OrderLineORM.product)]
+        for rows in _changed_rows(self.session, OrderORM, watermark, batch_size, options):
+            yield [OrderChange(order_id=o.id, changed_at=o.update_datetime, is_deleted=o.is_deleted,
+                               order=None if o.is_deleted else order_to_domain(o))
+                   for o in rows]
 
     def delete_product(self, order: Order, product: Product) -> Order:
-        if product not in order.products:
-            raise ValueError(f"Product {product.id} with "
-                             f"{product.name} not found in order # {order.id}")
-        for p in order.products:
-            if p.id == product.id:
-                self.session.delete(product)
-        return Order(id=order.id, products=order.products, create_datetime=order.create_datetime,
-                     update_datetime=order.update_datetime,
-                     address=order.address)
+        order.remove_product(product.id)
+        self.update(order)
+        return order
 
     def delete_one_quantity_product(self, order: Order, product: Product) -> Order:
-        if product not in order.products:
-            raise ValueError(f"Product {product.id} with "
-                             f"{product.name} not found in order # {order.id}")
-        for p in order.products:
-            if p.id == p.id:
-                if p.quantity < 1:
-                    logging.info(f"Nothing to delete from order")
-                else:
-                    p.quantity -= p.quantity
-        return Order(id=order.id, products=order.products, create_datetime=order.create_datetime,
-                     update_datetime=order.update_datetime,
-                     address=order.address)
+        order.remove_product(product.id, quantity=1)
+        self.update(order)
+        return order
 
     def update(self, order: Order) -> None:
-        order_orm = self.session.query(OrderORM).get(order.id)
-        if order_orm:
-            order_orm.products = [
-                self.session.query(ProductORM).get(p.id)
-                for p in order.products
-            ]
-            self.session.add(order_orm)
+        get_change_tracker(self.session).mark_order(order)
 
     def delete(self, order_id: int) -> None:
-        order_orm = self.session.query(OrderORM).get(order_id)
-        if order_orm:
-            order_orm.is_deleted = True
-            self.session.commit()
+        get_change_tracker(self.session).delete_order(order_id)
+
+
+class SqlAlchemyReportRepository(ReportRepository):
+    def __init__(self, session: Session):
+        self.session = session
+
+    @_reads_changes
+    def inventory_totals(self) -> InventoryTotals:
+        row = self.session.execute(
+            select(
+                func.count(ProductORM.id),
+                func.coalesce(func.sum(ProductORM.quantity), 0),
+                func.coalesce(func.sum(ProductORM.quantity * ProductORM.price), 0.0)
+            ).filter_by(is_active=True)
+        ).one()
+        return InventoryTotals._make(row)
+
+    @_reads_changes
+    def stock_on_hand(self, batch_size: int = 1000) -> Iterator[StockRow]:
+        rows = self.session.execute(
+            select(ProductORM.id, ProductORM.name, ProductORM.quantity,
+                   ProductORM.quantity * ProductORM.price)
+            .filter_by(is_active=True)
+            .order_by(ProductORM.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for row in rows:
+            yield StockRow._make(row)
+
+    @_reads_changes
+    def order_value_by_address(self) -> List[AddressOrderValueRow]:
+        rows = self.session.execute(
+            select(OrderORM.address, func.count(OrderORM.id),
+                   func.coalesce(func.sum(OrderORM.total_amount), 0.0))
+            .filter_by(is_deleted=False)
+            .group_by(OrderORM.address)
+            .order_by(OrderORM.address)
+        )
+        return [AddressOrderValueRow._make(row) for row in rows]
+
+
+class SqlAlchemyWatermarkRepository(WatermarkRepository):
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get(self, consumer: str, feed: str) -> ChangeWatermark:
+        row = self.session.execute(
+            select(SyncWatermarkORM.changed_at, SyncWatermarkORM.last_id)
+            .filter_by(consumer=consumer, feed=feed)
+        ).first()
+        return ChangeWatermark() if row is None else ChangeWatermark(*row)
+
+    def save(self, consumer: str, feed: str, watermark: ChangeWatermark) -> None:
+        statement = sqlite_insert(SyncWatermarkORM).values(
+            consumer=consumer, feed=feed, changed_at=watermark.changed_at, last_id=watermark.id)
+        self.session.execute(statement.on_conflict_do_update(
+            index_elements=[SyncWatermarkORM.consumer, SyncWatermarkORM.feed],
+            set_={"changed_at": statement.excluded.changed_at,
+                  "last_id": statement.excluded.last_id}
+        ))
@@ -1,6 +1,221 @@
 import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, event, func, insert, update
+from sqlalchemy.orm import Session
+
+from domain.models import Order, Product
+from domain.unit_of_work import AsyncUnitOfWork, UnitOfWork
+from .batching import IN_CLAUSE_CHUNK_SIZE, chunked
+from .orm import OrderORM, ProductORM, order_product_associations
+
+products_table = ProductORM.__table__
+orders_table = OrderORM.__table__
+PRODUCT_COLUMNS = ("name", "quantity", "price", "is_active")
+
+_CHANGE_TRACKER = "change_tracker"
+# Set in Session.info of sessions that only read: loaded objects are not snapshotted.
+READ_ONLY_SESSION = "read_only"
+
+
+class ChangeTracker:  # pylint: disable=too-many-instance-attributes
+    # Remembers the state of the domain objects loaded in the current transaction and
+    # writes only what differs from it, one executemany per table and kind of change.
+    # Objects that were never loaded (no snapshot) are written in full. Only objects passed
+    # to mark_* (or added) since the last flush are compared with their snapshot.
+
+    def __init__(self, session: Session):
+        self.session = session
+        self._products: Dict[int, list] = {}
+        self._orders: Dict[int, list] = {}
+        self._dirty_products = set()
+        self._dirty_orders = set()
+        self._deleted_products = set()
+        self._deleted_orders = set()
+        self._flushing = False
+        self._read_only = session.info.get(READ_ONLY_SESSION, False)
+
+    @staticmethod
+    def _product_state(product: Product) -> Tuple:
+        return product.name, product.quantity, product.price, product.is_active
+
+    @staticmethod
+    def _order_state(order: Order) -> Tuple:
+        return order.address, {product_id: (line.quantity, line.unit_price)
+                               for product_id, line in order.lines.items()}
+
+    def track_product(self, product: Product) -> None:
+        if not self._read_only and product.id not in self._products:
+            self._products[product.id] = [product, self._product_state(product)]
+
+    def track_order(self, order: Order, lines_stored: bool = True) -> None:
+        if not self._read_only and order.id not in self._orders:
+            address, lines = self._order_state(order)
+            self._orders[order.id] = [order, (address, lines if lines_stored else {})]
+            if not lines_stored:
+                self._dirty_orders.add(order.id)
+
+    def mark_product(self, product: Product) -> None:
+        entry = self._products.setdefault(product.id, [product, None])
+        entry[0] = product
+        self._dirty_products.add(product.id)
+
+    def mark_order(self, order: Order) -> None:
+        entry = self._orders.setdefault(order.id, [order, None])
+        entry[0] = order
+        self._dirty_orders.add(order.id)
+
+    def delete_product(self, product_id: int) -> None:
+        self._products.pop(product_id, None)
+        self._dirty_products.discard(product_id)
+        self._deleted_products.add(product_id)
+
+    def delete_order(self, order_id: int) -> None:
+        self._deleted_orders.add(order_id)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self._dirty_products or self._dirty_orders
+                    or self._deleted_products or self._deleted_orders)
+
+    def flush(self) -> None:
+        if self._flushing:
+            return
+        self._flushing = True
+        try:
+            written = self._flush_products()
+            written = self._flush_orders() or written
+        finally:
+            self._flushing = False
+        if written:
+            # ORM instances loaded earlier in the transaction are stale now.
+            self.session.expire_all()
+
+    def _flush_products(self) -> bool:
+        updates = defaultdict(list)
+        for product_id in sorted(self._dirty_products):
+            entry = self._products[product_id]
+            product, snapshot = entry
+            state = self._product_state(product)
+            if state == snapshot:
+                continue
+            changed = tuple(column for i, column in enumerate(PRODUCT_COLUMNS)
+                            if snapshot is None or state[i] != snapshot[i])
+            params = {f"b_{column}": state[PRODUCT_COLUMNS.index(column)] for column in changed}
+            updates[changed].append({"b_id": product_id, **params})
+            entry[1] = state
+        self._dirty_products.clear()
+
+        for columns, params in updates.items():
+            self.session.execute(
+                update(products_table)
+                .where(products_table.c.id == bindparam("b_id"))
+                .values({column: bindparam(f"b_{column}") for column in columns}),
+                params
+            )
+        deleted = sorted(self._deleted_products)
+        for chunk in chunked(deleted, IN_CLAUSE_CHUNK_SIZE):
+            self.session.execute(delete(products_table).where(products_table.c.id.in_(chunk)))
+        self._deleted_products.clear()
+        return bool(updates or deleted)
+
+    def _collect_order_changes(self) -> Dict[str, List]:
+        changes = defaultdict(list)
+        for order_id in sorted(self._dirty_orders):
+            entry = self._orders[order_id]
+            order, snapshot = entry
+            state = self._order_state(order)
+            if state == snapshot:
+                continue
+            address, order_lines = state
+            old_address, old_lines = snapshot if snapshot is not None else (None, None)
+            if address != old_address:
+                changes["addresses"].append({"b_id": order_id, "b_address": address})
+            else:
+                changes["touched"].append(order_id)
+            if old_lines is None:
+                changes["replaced"].append(order_id)
+                old_lines = {}
+            for product_id, line in order_lines.items():
+                params = {"b_order_id": order_id, "b_product_id": product_id,
+                          "b_quantity": line[0], "b_unit_price": line[1]}
+                if product_id not in old_lines:
+                    changes["line_inserts"].append(params)
+                elif old_lines[product_id] != line:
+                    changes["line_updates"].append(params)
+            changes["line_deletes"].extend(
+                {"b_order_id": order_id, "b_product_id": product_id}
+                for product_id in old_lines.keys() - order_lines.keys()
+            )
+            entry[1] = state
+        self._dirty_orders.clear()
+        return changes
+
+    def _flush_orders(self) -> bool:
+        lines = order_product_associations
+        changes = self._collect_order_changes()
+        line_key = (lines.c.order_id == bindparam("b_order_id")) & \
+                   (lines.c.product_id == bindparam("b_product_id"))
+
+        for chunk in chunked(changes["replaced"], IN_CLAUSE_CHUNK_SIZE):
+            self.session.execute(delete(lines).where(lines.c.order_id.in_(chunk)))
+        if changes["line_deletes"]:
+            self.session.execute(delete(lines).where(line_key), changes["line_deletes"])
+        if changes["line_updates"]:
+            self.session.execute(
+                update(lines).where(line_key)
+                .values(quantity=bindparam("b_quantity"), unit_price=bindparam("b_unit_price")),
+                changes["line_updates"]
+            )
+        if changes["line_inserts"]:
+            self.session.execute(
+                insert(lines).values(order_id=bindparam("b_order_id"),
+                                     product_id=bindparam("b_product_id"),
+                                     quantity=bindparam("b_quantity"),
+                                     unit_price=bindparam("b_unit_price")),
+                changes["line_inserts"]
+            )
+        if changes["addresses"]:
+            self.session.execute(
+                update(orders_table).where(orders_table.c.id == bindparam("b_id"))
+                .values(address=bindparam("b_address")),
+                changes["addresses"]
+            )
+        for chunk in chunked(changes["touched"], IN_CLAUSE_CHUNK_SIZE):
+            self.session.execute(update(orders_table).where(orders_table.c.id.in_(chunk))
+                                 .values(update_datetime=func.now()))
+        deleted = sorted(self._deleted_orders)
+        for chunk in chunked(deleted, IN_CLAUSE_CHUNK_SIZE):
+            self.session.execute(update(orders_table).where(orders_table.c.id.in_(chunk))
+                                 .values(is_deleted=True))
+        self._deleted_orders.clear()
+        return bool(changes["addresses"] or changes["touched"] or deleted)
+
+
+def get_change_tracker(session: Session) -> ChangeTracker:
+    tracker = session.info.get(_CHANGE_TRACKER)
+    if tracker is None:
+        tracker = session.info[_CHANGE_TRACKER] = ChangeTracker(session)
+    return tracker
+
+
+def flush_changes(session: Session) -> None:
+    tracker: Optional[ChangeTracker] = session.info.get(_CHANGE_TRACKER)
+    if tracker is not None and tracker.has_changes:
+        tracker.flush()
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_before_commit(session):
+    flush_changes(session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CHANGE_TRACKER, None)
 
-from domain.unit_of_work import UnitOfWork
 
 class SqlAlchemyUnitOfWork(UnitOfWork):
 
@@ -21,8 +236,37 @@ class SqlAlchemyUnitOfWork(UnitOfWork):
             self.commit()
 
     def commit(self):
+        get_change_tracker(self.session).flush()
         self.session.commit()
         self.committed = True
 
     def rollback(self):
+        # Changes may be tracked before any transaction has begun.
+        self.session.info.pop(_CHANGE_TRACKER, None)
         self.session.rollback()
+
+
+class AsyncSqlAlchemyUnitOfWork(AsyncUnitOfWork):
+
+    def __init__(self, session):
+        self.session = session
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        if exception_type is not None:
+            await self.rollback()
+            logging.info(f"Unexpected exception: {exception_type},\n"
+                         f"Value exception:{exception_value},\n"
+                         f" with traceback:{traceback}")
+        else:
+            await self.commit()
+
+    async def commit(self):
+        await self.session.commit()
+        self.committed = True
+
+    async def rollback(self):
+        await self.session.rollback()
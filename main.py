@@ -1,18 +1,28 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from domain.services import WarehouseService
-from infrastructure.orm import Base
-from infrastructure.repositories import SqlAlchemyProductRepository, SqlAlchemyOrderRepository
-from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
-from infrastructure.database import DATABASE_URL
+# Imports of SQLAlchemy and the infrastructure package are deferred to the commands
+# that need them, so that "--help" and argument errors do not pay for them.
+# pylint: disable=import-outside-toplevel
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 
-engine = create_engine(DATABASE_URL)
-SessionFactory = sessionmaker(bind=engine)
-Base.metadata.create_all(engine)
+from domain.exceptions import OutOfStockError, ProductNotFoundError
+
+if TYPE_CHECKING:
+    from domain.models import Order
+    from domain.services import ReportingService, WarehouseService
+
+ORDERS_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 20
 
 
 class WarehouseConsoleUI:
-    def __init__(self, warehouse_service: WarehouseService):
+    def __init__(self, warehouse_service: "WarehouseService"):
         self.service = warehouse_service
 
     def show_menu(self):
@@ -25,6 +35,7 @@ class WarehouseConsoleUI:
             print("5. Edit Order (add/remove products)")
             print("6. Delete Order")
             print("7. Delete Product")
+            print("8. Search Products")
             print("0. Exit")
 
             choice = input("Enter your choice: ")
@@ -43,6 +54,8 @@ class WarehouseConsoleUI:
                 self._delete_order()
             elif choice == "7":
                 self._delete_product()
+            elif choice == "8":
+                self._search_products()
             elif choice == "0":
                 print("Exiting...")
                 break
@@ -61,10 +74,20 @@ class WarehouseConsoleUI:
 
     def _list_products(self):
         print("\n--- Product List ---")
-        products = self.service._list_products()
-        for p in products:
-         print(f"ID: {p.id}, Name: {p.name}, Quantity: {p.quantity}, Price: {p.price}")
+        for p in self.service.iter_products():
+            print(f"ID: {p.id}, Name: {p.name}, Quantity: {p.quantity}, Price: {p.price}")
 
+    def _search_products(self):
+        print("\n--- Search Products ---")
+        query = input("Name or name prefix: ")
+        offset = 0
+        while True:
+            products = self.service.search_products(query, offset, SEARCH_PAGE_SIZE)
+            for p in products:
+                print(f"ID: {p.id}, Name: {p.name}, Quantity: {p.quantity}, Price: {p.price}")
+            if len(products) < SEARCH_PAGE_SIZE or input("More? (y/n): ").lower() != 'y':
+                break
+            offset += SEARCH_PAGE_SIZE
 
     def _create_order(self):
         print("\n--- Create New Order ---")
@@ -85,18 +108,25 @@ class WarehouseConsoleUI:
 
         address = input("Delivery address: ").strip()
 
-        order = self.service.create_order(product_ids, address)
+        try:
+            order = self.service.create_order(product_ids, address)
+        except (OutOfStockError, ProductNotFoundError) as error:
+            print(error)
+            return
         print(f"Order created: ID {order.id}")
 
 
     def _list_orders(self):
         print("\n--- Order List ---")
-        orders = self.service.list_orders()
-        for o in orders:
-            print(f"\nOrder ID: {o.id}")
-            print("Products:")
-            for p in o.products:
-                print(f"  - {p.name} (ID: {p.id}, Qty: {p.quantity}, Price: {p.price})")
+        orders = self.service.list_orders_page(limit=ORDERS_PAGE_SIZE)
+        while orders:
+            for o in orders:
+                print(f"\nOrder ID: {o.id}")
+                print("Products:")
+                for line in o.lines.values():
+                    print(f"  - {line.product.name} (ID: {line.product_id}, "
+                          f"Qty: {line.quantity}, Price: {line.unit_price})")
+            orders = self.service.list_orders_page(after_id=orders[-1].id, limit=ORDERS_PAGE_SIZE)
 
 
     def _edit_order(self):
@@ -110,8 +140,8 @@ class WarehouseConsoleUI:
                 return
 
             print("\nCurrent order products:")
-            for p in order.products:
-                print(f"ID: {p.id}, Name: {p.name}")
+            for line in order.lines.values():
+                print(f"ID: {line.product_id}, Name: {line.product.name}, Qty: {line.quantity}")
 
             print("\n1. Add product to order")
             print("2. Remove product from order")
@@ -120,14 +150,19 @@ class WarehouseConsoleUI:
             if sub_choice == "1":
                 self._list_products()
                 product_id = int(input("Enter product ID to add: "))
-                updated_order = self.service.add_product_to_order(order_id, product_id)
+                quantity = int(input("Quantity: ") or 1)
+                self.service.add_product_to_order(order_id, product_id, quantity)
                 print("Product added to order")
             elif sub_choice == "2":
                 product_id = int(input("Enter product ID to remove: "))
-                updated_order = self.service.remove_product_from_order(order_id, product_id)
+                quantity = input("Quantity (empty to remove all): ")
+                self.service.remove_product_from_order(order_id, product_id,
+                                                       int(quantity) if quantity else None)
                 print("Product removed from order")
             else:
                 print("Invalid choice")
+        except (OutOfStockError, ProductNotFoundError) as error:
+            print(error)
         except ValueError:
             print("Please enter a valid number")
 
@@ -154,17 +189,501 @@ class WarehouseConsoleUI:
             print("Please enter a valid number")
 
 
-def main():
-    session = SessionFactory()
+@lru_cache(maxsize=None)
+def get_engine(url: Optional[str] = None, archive: Optional[str] = None):
+    # The engine is only created, and the schema migrated, once a command needs the database.
+    from infrastructure.database import DATABASE_URL, create_warehouse_engine
+    from infrastructure.migrations import migrate
+
+    engine = create_warehouse_engine(url or DATABASE_URL)
+    if archive:
+        from infrastructure.archive import attach_archive
+
+        attach_archive(engine, archive)
+    migrate(engine)
+    return engine
+
+
+def import_products(service: "WarehouseService", path: str, batch_size: int, upsert: bool):
+    from infrastructure.product_import import read_products
+
+    started = time.perf_counter()
+    count = service.import_products(read_products(path), batch_size, upsert)
+    elapsed = time.perf_counter() - started
+    print(f"Imported {count} products in {elapsed:.2f}s "
+          f"({count / elapsed if elapsed else count:.0f} rows/sec)")
+
+
+def run_order_ingest(url: str, path: str, workers: int, chunk_size: int):
+    from infrastructure.order_import import read_orders
+    from infrastructure.order_ingest import ingest_orders
+
+    started = time.perf_counter()
+    per_worker = ingest_orders(url, read_orders(path), workers, chunk_size)
+    elapsed = time.perf_counter() - started
+    for stats in per_worker.values():
+        print(f"Worker {stats.worker}: {stats.orders} orders, {stats.failures} failed, "
+              f"{stats.busy_retries} busy retries, {stats.orders_per_second:.0f} orders/sec")
+    orders = sum(stats.orders for stats in per_worker.values())
+    failures = sum(stats.failures for stats in per_worker.values())
+    print(f"Created {orders} orders ({failures} failed) in {elapsed:.2f}s "
+          f"({orders / elapsed if elapsed else orders:.0f} orders/sec)")
+
+
+def run_archive(engine, args):
+    from infrastructure.archive import archive_orders
+
+    # update_datetime is filled by SQLite's CURRENT_TIMESTAMP, which is in UTC.
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    inactive_before = None
+    if args.older_than_days is not None:
+        inactive_before = now - datetime.timedelta(days=args.older_than_days)
+    started = time.perf_counter()
+    moved = archive_orders(engine, now - datetime.timedelta(days=args.deleted_grace_days),
+                           inactive_before, args.batch_size)
+    print(f"Archived {moved} orders in {time.perf_counter() - started:.2f}s")
+
+
+def run_order_totals_check(engine, rebuild: bool) -> None:
+    from infrastructure.order_totals import verify_order_totals
+
+    started = time.perf_counter()
+    check = verify_order_totals(engine, rebuild)
+    print(json.dumps({**check._asdict(), "seconds": round(time.perf_counter() - started, 3)}))
+
+
+def run_export(engine, args) -> None:
+    from infrastructure.export import export_tables
+
+    started = time.perf_counter()
+    file_format, exports = export_tables(engine, args.directory, args.format, args.incremental,
+                                         args.batch_size)
+    elapsed = time.perf_counter() - started
+    rows = sum(export.rows for export in exports)
+    print(json.dumps({
+        "format": file_format,
+        "tables": [{**export._asdict(), "seconds": round(export.seconds, 3),
+                    "rows_per_second": round(export.rows / export.seconds)
+                    if export.seconds else export.rows}
+                   for export in exports],
+        "rows": rows, "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else rows,
+    }))
+
+
+def print_report(reporting: "ReportingService", report: str):
+    if report == "inventory":
+        totals = reporting.inventory_totals()
+        print(f"Products: {totals.products_count}, Units: {totals.units}, "
+              f"Value: {totals.value:.2f}")
+    elif report == "stock":
+        for row in reporting.stock_on_hand():
+            print(f"ID: {row.product_id}, Name: {row.name}, Quantity: {row.quantity}, "
+                  f"Value: {row.value:.2f}")
+    elif report == "orders-by-address":
+        for row in reporting.order_value_by_address():
+            print(f"Address: {row.address}, Orders: {row.orders_count}, Value: {row.value:.2f}")
+
+
+def order_to_dict(order: "Order") -> dict:
+    return {
+        "id": order.id,
+        "address": order.address,
+        "create_datetime": order.create_datetime.isoformat(),
+        "update_datetime": order.update_datetime.isoformat(),
+        "lines": [{"product_id": line.product_id, "name": line.product.name,
+                   "quantity": line.quantity, "unit_price": line.unit_price}
+                  for line in order.lines.values()],
+    }
+
+
+def change_to_dict(change) -> dict:
+    from domain.models import ProductChange
+
+    if isinstance(change, ProductChange):
+        return {**dataclasses.asdict(change.product), "changed_at": change.changed_at.isoformat()}
+    if change.is_deleted:
+        return {"id": change.order_id, "is_deleted": True,
+                "changed_at": change.changed_at.isoformat()}
+    return {**order_to_dict(change.order), "is_deleted": False,
+            "changed_at": change.changed_at.isoformat()}
+
+
+def run_change_feed(args, session):
+    from domain.services import ChangeFeedService
+    from infrastructure.repositories import (SqlAlchemyOrderRepository,
+                                             SqlAlchemyProductRepository,
+                                             SqlAlchemyWatermarkRepository)
+    from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+    def write(batch):
+        for change in batch:
+            print(json.dumps(change_to_dict(change)))
+        sys.stdout.flush()
+
+    feed = ChangeFeedService(SqlAlchemyProductRepository(session),
+                             SqlAlchemyOrderRepository(session),
+                             SqlAlchemyWatermarkRepository(session),
+                             SqlAlchemyUnitOfWork(session))
+    count = feed.sync(args.consumer, args.feed, write, args.batch_size)
+    print(f"{count} changes", file=sys.stderr)
+
+
+def _get_order(service: "WarehouseService", order_id: int,
+               include_archived: bool = False) -> "Order":
+    order = service.get_order(order_id, include_archived)
+    if order is None:
+        raise ValueError(f"Order {order_id} not found")
+    return order
+
+
+def run_product_command(service: "WarehouseService", args):
+    if args.action == "add":
+        product = service.create_product(args.name, args.quantity, args.price,
+                                         not args.inactive)
+        return dataclasses.asdict(product)
+    if args.action == "get":
+        [product] = service.get_products([args.product_id])
+        return dataclasses.asdict(product)
+    if args.action == "list":
+        return [dataclasses.asdict(product)
+                for product in service.list_products_page(args.after_id, args.limit)]
+    if args.action == "search":
+        return [dataclasses.asdict(product)
+                for product in service.search_products(args.query, args.offset, args.limit)]
+    if args.action == "adjust":
+        return run_product_adjustment(service, args)
+    service.delete_product(args.product_id)
+    return {"deleted": args.product_id}
+
+
+def run_product_adjustment(service: "WarehouseService", args) -> dict:
+    from domain.models import ProductAdjustment, ProductSelection
+
+    started = time.perf_counter()
+    if args.file:
+        from infrastructure.product_import import read_adjustments
+
+        adjustments = read_adjustments(args.file)
+        preview, adjust = service.preview_product_adjustments_by_id, service.adjust_products_by_id
+        arguments: tuple = (adjustments,)
+    else:
+        selection = ProductSelection(ids=args.ids, name_prefix=args.name_prefix,
+                                     min_price=args.min_price, max_price=args.max_price,
+                                     include_inactive=args.include_inactive)
+        preview, adjust = service.preview_product_adjustment, service.adjust_products
+        arguments = (selection, ProductAdjustment(args.percent, args.amount, args.stock_delta))
+    if not args.dry_run:
+        updated = adjust(*arguments)
+        return {"updated": updated, "seconds": round(time.perf_counter() - started, 3)}
+    result = preview(*arguments)
+    return {"products": result.count, "seconds": round(time.perf_counter() - started, 3),
+            "units_before": result.units_before(), "units_after": result.units_after(),
+            "value_before": round(result.value_before(), 2),
+            "value_after": round(result.value_after(), 2)}
+
+
+def run_order_command(service: "WarehouseService", args):
+    # pylint: disable=too-many-return-statements
+    if args.action == "create":
+        return order_to_dict(service.create_order(args.product_ids, args.address))
+    if args.action == "get":
+        return order_to_dict(_get_order(service, args.order_id, args.include_archived))
+    if args.action == "list":
+        return [order_to_dict(order)
+                for order in service.list_orders_page(args.after_id, args.limit,
+                                                      args.include_archived)]
+    if args.action == "summaries":
+        return [{**summary._asdict(), "create_datetime": summary.create_datetime.isoformat(),
+                 "update_datetime": summary.update_datetime.isoformat()}
+                for summary in service.list_order_summaries(args.after_id, args.limit)]
+    if args.action == "add-product":
+        _get_order(service, args.order_id)
+        return order_to_dict(service.add_product_to_order(args.order_id, args.product_id,
+                                                          args.quantity))
+    if args.action == "remove-product":
+        _get_order(service, args.order_id)
+        return order_to_dict(service.remove_product_from_order(args.order_id, args.product_id,
+                                                               args.quantity))
+    _get_order(service, args.order_id)
+    service.delete_order(args.order_id)
+    return {"deleted": args.order_id}
+
+
+def _add_page_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--after-id", type=int, help="list entries with a larger id")
+    parser.add_argument("--limit", type=int, default=100)
+
+
+def _add_product_parser(subparsers):
+    product_parser = subparsers.add_parser("product", help="manage products, JSON output")
+    actions = product_parser.add_subparsers(dest="action", required=True)
+    add_parser = actions.add_parser("add")
+    add_parser.add_argument("name")
+    add_parser.add_argument("quantity", type=int)
+    add_parser.add_argument("price", type=float)
+    add_parser.add_argument("--inactive", action="store_true")
+    actions.add_parser("get").add_argument("product_id", type=int)
+    _add_page_arguments(actions.add_parser("list"))
+    search_parser = actions.add_parser("search", help="ranked search by name words or prefixes")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--offset", type=int, default=0)
+    search_parser.add_argument("--limit", type=int, default=20)
+    actions.add_parser("delete").add_argument("product_id", type=int)
+
+    adjust_parser = actions.add_parser(
+        "adjust", help="reprice and restock the selected products in one statement: "
+                       "price * (1 + percent / 100) + amount, quantity + stock delta")
+    adjust_parser.add_argument("--ids", type=int, nargs="+", help="only these products")
+    adjust_parser.add_argument("--name-prefix")
+    adjust_parser.add_argument("--min-price", type=float)
+    adjust_parser.add_argument("--max-price", type=float)
+    adjust_parser.add_argument("--include-inactive", action="store_true")
+    adjust_parser.add_argument("--percent", type=float, default=0.0)
+    adjust_parser.add_argument("--amount", type=float, default=0.0)
+    adjust_parser.add_argument("--stock-delta", type=int, default=0)
+    adjust_parser.add_argument("--file", help="CSV or JSONL with product_id and per product "
+                                              "price_percent, price_amount, quantity_delta; "
+                                              "replaces the options above")
+    adjust_parser.add_argument("--dry-run", action="store_true",
+                               help="only report the resulting totals, write nothing")
+
+
+def _add_order_parser(subparsers):
+    order_parser = subparsers.add_parser("order", help="manage orders, JSON output")
+    actions = order_parser.add_subparsers(dest="action", required=True)
+    create_parser = actions.add_parser("create")
+    create_parser.add_argument("product_ids", type=int, nargs="+",
+                               help="repeat an id to order more than one unit")
+    create_parser.add_argument("--address", required=True)
+    get_parser = actions.add_parser("get")
+    get_parser.add_argument("order_id", type=int)
+    list_parser = actions.add_parser("list")
+    _add_page_arguments(list_parser)
+    for read_parser in (get_parser, list_parser):
+        read_parser.add_argument("--include-archived", action="store_true",
+                                 help="also look in the archive given with --archive")
+    _add_page_arguments(actions.add_parser(
+        "summaries", help="list orders with their stored totals, without the lines"))
+    for action, default_quantity in (("add-product", 1), ("remove-product", None)):
+        line_parser = actions.add_parser(action)
+        line_parser.add_argument("order_id", type=int)
+        line_parser.add_argument("product_id", type=int)
+        line_parser.add_argument("--quantity", type=int, default=default_quantity)
+    actions.add_parser("delete").add_argument("order_id", type=int)
+
+
+def parse_args(argv=None):
+    from benchmarks.scales import add_arguments as add_bench_arguments
+
+    parser = argparse.ArgumentParser(description="Warehouse Management System")
+    parser.add_argument("--database", help="SQLAlchemy database URL (default: warehouse.db)")
+    parser.add_argument("--archive",
+                        help="SQLite file that holds archived orders, created if missing")
+    parser.add_argument("--product-cache-size", type=int, default=1024,
+                        help="number of products kept in the read cache, 0 disables it")
+    parser.add_argument("--product-cache-ttl", type=float, default=60.0,
+                        help="seconds a cached product stays valid")
+    parser.add_argument("--profile-sql", action="store_true",
+                        help="count and time SQL statements per service call, "
+                             "print a summary on exit")
+    parser.add_argument("--slow-ms", type=float, default=100.0,
+                        help="with --profile-sql, log service calls slower than this")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("menu", help="interactive console menu (the default)")
+    _add_product_parser(subparsers)
+    _add_order_parser(subparsers)
+
+    import_parser = subparsers.add_parser("import-products",
+                                          help="bulk load products from a CSV or JSONL file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.add_argument("--upsert", action="store_true",
+                               help="update products with the same name instead of adding them")
+
+    ingest_parser = subparsers.add_parser(
+        "ingest-orders", help="create orders from a CSV/JSONL file or a spool directory")
+    ingest_parser.add_argument("path")
+    ingest_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ingest_parser.add_argument("--chunk-size", type=int, default=500,
+                               help="orders handed to a worker at a time")
+
+    changes_parser = subparsers.add_parser(
+        "changes", help="print products or orders changed since the consumer's last run "
+                        "as JSON lines, deleted orders included")
+    changes_parser.add_argument("feed", choices=["products", "orders"])
+    changes_parser.add_argument("--consumer", required=True,
+                                help="name under which the last position is stored")
+    changes_parser.add_argument("--batch-size", type=int, default=1000)
+
+    archive_parser = subparsers.add_parser(
+        "archive-orders", help="move deleted and inactive orders to the --archive database")
+    archive_parser.add_argument("--deleted-grace-days", type=float, default=7.0,
+                                help="deleted orders stay this long, so that change feed "
+                                     "consumers still see the deletion")
+    archive_parser.add_argument("--older-than-days", type=float,
+                                help="also archive orders not updated for this long")
+    archive_parser.add_argument("--batch-size", type=int, default=1000,
+                                help="orders moved per write transaction")
+
+    totals_parser = subparsers.add_parser(
+        "check-order-totals", help="compare the stored order totals with the order lines, "
+                                   "JSON output")
+    totals_parser.add_argument("--rebuild", action="store_true",
+                               help="recompute the totals of the orders that do not match")
+
+    export_parser = subparsers.add_parser(
+        "export", help="write products, orders and order lines to columnar files for "
+                       "analytics, JSON output with rows/sec")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--format", choices=["parquet", "arrow", "npy"],
+                               help="parquet and arrow need pyarrow, npy files can be "
+                                    "memory-mapped with NumPy (default: the format already "
+                                    "in the directory, else parquet if pyarrow is installed)")
+    export_parser.add_argument("--incremental", action="store_true",
+                               help="only add what changed since the last export to the "
+                                    "directory")
+    export_parser.add_argument("--batch-size", type=int, default=10000,
+                               help="rows read and written at a time")
+
+    report_parser = subparsers.add_parser("report", help="print stock and order value totals")
+    report_parser.add_argument("report", choices=["inventory", "stock", "orders-by-address"])
+
+    bench_parser = subparsers.add_parser(
+        "bench", help="time service operations on seeded temporary databases, JSON output")
+    add_bench_arguments(bench_parser)
+    args = parser.parse_args(argv)
+    if args.command == "archive-orders" and not args.archive:
+        parser.error("archive-orders requires --archive")
+    return args
+
+
+def _profiled(service: "WarehouseService", engines, slow_ms: float):
+    import atexit
+    from infrastructure.instrumentation import ProfiledService, QueryProfiler
+
+    profiler = QueryProfiler(slow_ms)
+    for engine in engines:
+        profiler.attach(engine)
+    atexit.register(lambda: print(profiler.summary(), file=sys.stderr))
+    return ProfiledService(service, profiler)
+
+
+@lru_cache(maxsize=None)
+def get_read_only_engine(url: str):
+    from infrastructure.read_only import create_read_only_engine
+
+    return create_read_only_engine(url)
+
+
+def _readers(read_engine) -> dict:
+    if read_engine is None:
+        return {}
+    from infrastructure.read_only import (ReadOnlyOrderRepository, ReadOnlyProductRepository,
+                                          read_only_session_factory)
+
+    factory = read_only_session_factory(read_engine)
+    return {"product_reader": ReadOnlyProductRepository(factory),
+            "order_reader": ReadOnlyOrderRepository(factory)}
+
+
+def build_service(args, session) -> "WarehouseService":
+    from domain.services import WarehouseService
+    from infrastructure.cache import CachedProductRepository
+    from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+    from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+    readers = {}
+    if args.archive:
+        from infrastructure.archive import SqlAlchemyArchivedOrderRepository
+
+        readers["order_archive"] = SqlAlchemyArchivedOrderRepository(session)
     product_repo = SqlAlchemyProductRepository(session)
-    order_repo = SqlAlchemyOrderRepository(session)
+    if args.product_cache_size > 0:
+        product_repo = CachedProductRepository(product_repo, args.product_cache_size,
+                                               args.product_cache_ttl)
+    # Pure reads use their own query_only connections, except for an in-memory database
+    # that only exists on the one connection.
+    url = session.get_bind().url
+    read_engine = None
+    if url.database not in (None, "", ":memory:"):
+        read_engine = get_read_only_engine(url.render_as_string(hide_password=False))
+    readers.update(_readers(read_engine))
+    service = WarehouseService(product_repo, SqlAlchemyOrderRepository(session),
+                               SqlAlchemyUnitOfWork(session), **readers)
+    if args.profile_sql:
+        engines = [session.get_bind()] + ([read_engine] if read_engine else [])
+        service = _profiled(service, engines, args.slow_ms)
+    return service
+
+
+def run_command(args, session):
+    if args.command == "changes":
+        run_change_feed(args, session)
+        return
+    if args.command == "report":
+        from domain.services import ReportingService
+        from infrastructure.repositories import SqlAlchemyReportRepository
 
-    uow = SqlAlchemyUnitOfWork(session)
-    with uow:
-        service = WarehouseService(product_repo, order_repo)
-        ui = WarehouseConsoleUI(service)
-        ui.show_menu()
+        print_report(ReportingService(SqlAlchemyReportRepository(session)), args.report)
+        return
+    service = build_service(args, session)
+    with service.uow:
+        if args.command == "import-products":
+            import_products(service, args.file, args.batch_size, args.upsert)
+        elif args.command == "product":
+            print(json.dumps(run_product_command(service, args)))
+        elif args.command == "order":
+            print(json.dumps(run_order_command(service, args)))
+        else:
+            WarehouseConsoleUI(service).show_menu()
+
+
+# Commands that work on the database as a whole rather than through a session.
+ENGINE_COMMANDS = ("archive-orders", "export", "check-order-totals", "ingest-orders")
+
+
+def run_engine_command(engine, args) -> int:
+    try:
+        if args.command == "archive-orders":
+            run_archive(engine, args)
+        elif args.command == "export":
+            run_export(engine, args)
+        elif args.command == "check-order-totals":
+            run_order_totals_check(engine, args.rebuild)
+        else:
+            run_order_ingest(engine.url.render_as_string(hide_password=False), args.path,
+                             args.workers, args.chunk_size)
+    except ValueError as error:
+        print(json.dumps({"error": str(error)}), file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "bench":
+        from benchmarks import suite as benchmark_suite
+
+        benchmark_suite.run(args)
+        return 0
+
+    engine = get_engine(args.database, args.archive)
+    if args.command in ENGINE_COMMANDS:
+        return run_engine_command(engine, args)
+
+    from sqlalchemy.orm import Session
+
+    with Session(engine) as session:
+        try:
+            run_command(args, session)
+        except ValueError as error:
+            # Domain errors (missing products, out of stock) are ValueErrors.
+            print(json.dumps({"error": str(error)}), file=sys.stderr)
+            return 1
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
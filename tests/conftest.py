@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from domain.services import WarehouseService
+from infrastructure.database import create_warehouse_engine
+from infrastructure.migrations import migrate
+from infrastructure.orm import Base
+from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+
+@pytest.fixture
+def test_session():
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    yield session
+    session.rollback()
+    session.close()
+
+
+@pytest.fixture
+def statements(test_session):
+    executed = []
+    event.listen(test_session.get_bind(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: executed.append(statement))
+    return executed
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'warehouse.db'}"
+
+
+@pytest.fixture
+def engine(database_url):
+    engine = create_warehouse_engine(database_url)
+    migrate(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = Session(engine)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def service(session):
+    return WarehouseService(SqlAlchemyProductRepository(session),
+                            SqlAlchemyOrderRepository(session),
+                            SqlAlchemyUnitOfWork(session))
@@ -0,0 +1,21 @@
+import json
+
+from benchmarks import suite
+from main import main
+
+
+def test_bench_writes_json_report(tmp_path, monkeypatch):
+    monkeypatch.setitem(suite.SCALES, "small", (50, 200))
+    output = tmp_path / "bench.json"
+
+    main(["bench", "--runs", "3", "--output", str(output)])
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    [scale] = report["scales"]
+    assert (scale["scale"], scale["products"], scale["orders"]) == ("small", 50, 200)
+    results = {result["name"]: result for result in scale["results"]}
+    assert {"create_product", "create_order", "list_orders", "add_product_to_order",
+            "iter_products"} <= results.keys()
+    assert results["create_product"]["runs"] == 3
+    assert results["get_order"]["queries_per_run"] == 1
+    assert results["list_orders_page"]["queries_per_run"] == 2
@@ -1,8 +1,10 @@
 import pytest
 from unittest.mock import Mock
-from domain.services import WarehouseService
-from domain.models import Product, Order
-from domain.repositories import ProductRepository, OrderRepository
+from domain.exceptions import OutOfStockError, ProductNotFoundError
+from domain.services import ChangeFeedService, WarehouseService
+from domain.models import ChangeWatermark, Product, ProductChange, Order
+from domain.repositories import (ArchivedOrderRepository, ProductRepository, OrderRepository,
+                                 WatermarkRepository)
 from domain.unit_of_work import UnitOfWork
 
 
@@ -35,7 +37,7 @@ def test_create_order(mock_repos):
 
     p1 = Product(id=1, name="P1", quantity=1, price=10, is_active=True)
     p2 = Product(id=2, name="P2", quantity=2, price=20, is_active=True)
-    product_repo.get.side_effect = [p1, p2]
+    product_repo.get_many.return_value = [p1, p2]
 
 
     service = WarehouseService(product_repo, order_repo, uow)
@@ -44,5 +46,128 @@ def test_create_order(mock_repos):
 
     assert len(result.products) == 2
     assert result.address == "Test Address"
+    product_repo.reserve_stock.assert_called_once_with({1: 1, 2: 1})
     order_repo.add.assert_called_once()
-    uow.commit.assert_called_once()
\ No newline at end of file
+    uow.commit.assert_called_once()
+
+
+def test_create_order_loads_products_in_one_call(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    product_repo.get_many.side_effect = ProductNotFoundError([3, 5])
+
+    service = WarehouseService(product_repo, order_repo, uow)
+
+    with pytest.raises(ProductNotFoundError) as error:
+        service.create_order([1, 3, 5], "Test Address")
+
+    assert error.value.product_ids == [3, 5]
+    product_repo.get_many.assert_called_once_with([1, 3, 5])
+    product_repo.get.assert_not_called()
+    order_repo.add.assert_not_called()
+
+
+def test_import_products(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    product_repo.add_many.return_value = 2
+    products = [Product(id=None, name="P1", quantity=1, price=10),
+                Product(id=None, name="P2", quantity=2, price=20)]
+
+    service = WarehouseService(product_repo, order_repo, uow)
+
+    assert service.import_products(products, batch_size=500, upsert_by_name=True) == 2
+    product_repo.add_many.assert_called_once_with(products, 500, True)
+    uow.commit.assert_called_once()
+
+
+def test_create_order_out_of_stock_rolls_back(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    product = Product(id=1, name="P1", quantity=1, price=10)
+    product_repo.get_many.return_value = [product, product]
+    product_repo.reserve_stock.side_effect = OutOfStockError([1])
+
+    service = WarehouseService(product_repo, order_repo, uow)
+
+    with pytest.raises(OutOfStockError):
+        service.create_order([1, 1], "Test Address")
+
+    product_repo.reserve_stock.assert_called_once_with({1: 2})
+    uow.rollback.assert_called_once()
+    order_repo.add.assert_not_called()
+    uow.commit.assert_not_called()
+
+
+def test_add_and_remove_product_quantities(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    p1 = Product(id=1, name="P1", quantity=10, price=10)
+    order_repo.get.return_value = Order(id=1, address="Test Address", products=[p1])
+    product_repo.get.return_value = p1
+
+    service = WarehouseService(product_repo, order_repo, uow)
+
+    order = service.add_product_to_order(1, 1, quantity=4)
+    assert order.lines[1].quantity == 5
+
+    order = service.remove_product_from_order(1, 1, quantity=2)
+    assert order.lines[1].quantity == 3
+
+    order = service.remove_product_from_order(1, 1)
+    assert order.lines == {}
+    assert order_repo.update.call_count == 3
+
+
+def test_change_feed_sync_saves_watermark_after_each_batch(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    watermark_repo = Mock(spec=WatermarkRepository)
+    watermark_repo.get.return_value = ChangeWatermark()
+    batches = [[ProductChange(Product(id=i, name="P", quantity=1, price=1), f"t{i}")
+                for i in ids] for ids in ([1, 2], [3])]
+    product_repo.changes_since.return_value = iter(batches)
+    handled = []
+
+    service = ChangeFeedService(product_repo, order_repo, watermark_repo, uow)
+
+    assert service.sync("bi", "products", handled.append, batch_size=2) == 3
+    assert handled == batches
+    product_repo.changes_since.assert_called_once_with(ChangeWatermark(), 2)
+    assert [call.args for call in watermark_repo.save.call_args_list] == \
+           [("bi", "products", ChangeWatermark("t2", 2)),
+            ("bi", "products", ChangeWatermark("t3", 3))]
+    assert uow.commit.call_count == 2
+    with pytest.raises(ValueError):
+        service.sync("bi", "customers", handled.append)
+
+
+def test_reads_use_readers_when_given(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    product_reader = Mock(spec=ProductRepository)
+    order_reader = Mock(spec=OrderRepository)
+
+    service = WarehouseService(product_repo, order_repo, uow,
+                               product_reader=product_reader, order_reader=order_reader)
+    service.get_product(1)
+    service.list_orders_page(after_id=5, limit=10)
+
+    product_reader.get.assert_called_once_with(1)
+    order_reader.list_page.assert_called_once_with(5, 10)
+    product_repo.get.assert_not_called()
+    order_repo.list_page.assert_not_called()
+
+
+def test_archived_orders_are_read_only_on_request(mock_repos):
+    product_repo, order_repo, uow = mock_repos
+    order_archive = Mock(spec=ArchivedOrderRepository)
+    order_repo.get.return_value = None
+    order_repo.list_page.return_value = [Order(id=2, address="live"), Order(id=5, address="live")]
+    order_archive.list_page.return_value = [Order(id=1, address="old"),
+                                            Order(id=2, address="old"),
+                                            Order(id=3, address="old")]
+
+    service = WarehouseService(product_repo, order_repo, uow, order_archive=order_archive)
+    assert service.get_order(1) is None
+    order_archive.get.assert_not_called()
+    assert service.get_order(1, include_archived=True) is order_archive.get.return_value
+
+    assert [o.id for o in service.list_orders_page(limit=10)] == [2, 5]
+    page = service.list_orders_page(limit=3, include_archived=True)
+    assert [(o.id, o.address) for o in page] == [(1, "old"), (2, "live"), (3, "old")]
+    order_archive.list_page.assert_called_once_with(None, 3)
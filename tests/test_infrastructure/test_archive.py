@@ -0,0 +1,117 @@
+import datetime
+
+import pytest
+from sqlalchemy import func, select, text
+from infrastructure import archive
+from infrastructure.archive import (SqlAlchemyArchivedOrderRepository, archive_orders,
+                                    archived_order_lines, archived_orders, attach_archive)
+from infrastructure.orm import OrderORM, order_product_associations
+
+LATER = datetime.datetime(2100, 1, 1)
+
+
+@pytest.fixture
+def engine(engine, tmp_path):
+    # The archive is attached to new connections, those the migrations opened go first.
+    engine.dispose()
+    attach_archive(engine, str(tmp_path / "archive.db"))
+    return engine
+
+
+@pytest.fixture
+def service(service, session):
+    service.order_archive = SqlAlchemyArchivedOrderRepository(session)
+    return service
+
+
+def _count(engine, table) -> int:
+    with engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(table))
+
+
+def _create_orders(service, count):
+    product = service.create_product("Bolt", 100, 2.5)
+    return [service.create_order([product.id, product.id], f"Street {i}").id
+            for i in range(count)]
+
+
+def test_deleted_orders_move_to_archive_in_batches(engine, service):
+    order_ids = _create_orders(service, 6)
+    for order_id in order_ids[:4]:
+        service.delete_order(order_id)
+    service.uow.rollback()
+
+    assert archive_orders(engine, deleted_before=LATER, batch_size=3) == 4
+    assert _count(engine, OrderORM.__table__) == 2
+    assert _count(engine, order_product_associations) == 2
+    assert _count(engine, archived_orders) == 4
+    assert _count(engine, archived_order_lines) == 4
+    # Deleted orders are kept in the archive, but not returned.
+    assert service.get_order(order_ids[0], include_archived=True) is None
+    assert archive_orders(engine, deleted_before=LATER) == 0
+
+
+def test_grace_period_keeps_recent_deletions(engine, service):
+    order_ids = _create_orders(service, 3)
+    service.delete_order(order_ids[0])
+
+    assert archive_orders(engine, deleted_before=datetime.datetime(2000, 1, 1)) == 0
+    with pytest.raises(ValueError):
+        archive_orders(engine)
+
+
+def test_inactive_orders_stay_readable(engine, service):
+    order_ids = _create_orders(service, 3)
+    service.remove_product_from_order(order_ids[1], 1, 1)
+    service.uow.rollback()
+
+    # The newest order always stays, its id must not be handed out again.
+    assert archive_orders(engine, inactive_before=LATER) == 2
+    assert service.get_order(order_ids[0]) is None
+    order = service.get_order(order_ids[1], include_archived=True)
+    assert (order.address, order.lines[1].quantity, order.lines[1].unit_price) == \
+           ("Street 1", 1, 2.5)
+    assert [o.id for o in service.list_orders_page(limit=10)] == [order_ids[2]]
+    assert [o.id for o in service.list_orders_page(limit=10, include_archived=True)] == order_ids
+    assert [o.id for o in service.list_orders_page(after_id=order_ids[0], limit=1,
+                                                   include_archived=True)] == [order_ids[1]]
+
+
+def test_archived_lines_survive_product_deletion(engine, service):
+    order_ids = _create_orders(service, 2)
+    service.delete_order(order_ids[1])
+    archive_orders(engine, inactive_before=LATER)
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM products"))
+
+    [line] = service.get_order(order_ids[0], include_archived=True).lines.values()
+    assert (line.product.name, line.quantity, line.unit_price) == (None, 2, 2.5)
+
+
+def test_interrupted_archiving_keeps_orders_live(engine, service, monkeypatch):
+    order_ids = _create_orders(service, 3)
+    delete_archived = archive._delete_archived
+
+    def crash(connection, order_ids):
+        raise RuntimeError("Interrupted")
+
+    monkeypatch.setattr(archive, "_delete_archived", crash)
+    with pytest.raises(RuntimeError):
+        archive_orders(engine, inactive_before=LATER)
+    assert (_count(engine, OrderORM.__table__), _count(engine, archived_orders)) == (3, 2)
+
+    def change_first(connection, order_ids):
+        connection.execute(text("UPDATE orders SET address = 'Moved', "
+                                "update_datetime = datetime(update_datetime, '+1 second') "
+                                "WHERE id = :id"), {"id": order_ids[0]})
+        return delete_archived(connection, order_ids)
+
+    monkeypatch.setattr(archive, "_delete_archived", change_first)
+    assert archive_orders(engine, inactive_before=LATER, batch_size=10) == 1
+    assert service.get_order(order_ids[0]).address == "Moved"
+    assert service.get_order(order_ids[1]) is None
+
+    monkeypatch.setattr(archive, "_delete_archived", delete_archived)
+    assert archive_orders(engine, inactive_before=LATER) == 1
+    assert service.get_order(order_ids[0], include_archived=True).address == "Moved"
+    assert _count(engine, order_product_associations) == 1
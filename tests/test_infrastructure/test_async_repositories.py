@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from domain.exceptions import ProductNotFoundError
+from domain.services import AsyncWarehouseService
+from infrastructure.async_repositories import (AsyncSqlAlchemyOrderRepository,
+                                               AsyncSqlAlchemyProductRepository)
+from infrastructure.database import create_async_warehouse_engine
+from infrastructure.orm import Base
+from infrastructure.unit_of_work import AsyncSqlAlchemyUnitOfWork
+
+
+async def _run_with_service(scenario):
+    engine = create_async_warehouse_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        async with session_factory() as session:
+            service = AsyncWarehouseService(AsyncSqlAlchemyProductRepository(session),
+                                            AsyncSqlAlchemyOrderRepository(session),
+                                            AsyncSqlAlchemyUnitOfWork(session))
+            return await scenario(service)
+    finally:
+        await engine.dispose()
+
+
+def test_async_warehouse_service_orders():
+    async def scenario(service):
+        p1 = await service.create_product("P1", 1, 10)
+        p2 = await service.create_product("P2", 2, 20)
+        order = await service.create_order([p1.id, p2.id], "Test Address")
+        await service.remove_product_from_order(order.id, p1.id)
+        return order, await service.get_order(order.id), await service.list_orders_page()
+
+    order, retrieved, orders = asyncio.run(_run_with_service(scenario))
+
+    assert order.id is not None
+    assert [p.name for p in retrieved.products] == ["P2"]
+    assert [o.id for o in orders] == [order.id]
+
+
+def test_async_warehouse_service_reports_missing_products():
+    async def scenario(service):
+        product = await service.create_product("P1", 1, 10)
+        await service.create_order([product.id, 100], "Test Address")
+
+    with pytest.raises(ProductNotFoundError) as error:
+        asyncio.run(_run_with_service(scenario))
+    assert error.value.product_ids == [100]
@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import Mock
+from domain.models import Product
+from domain.repositories import ProductRepository
+from infrastructure.cache import CachedProductRepository
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def inner_repo():
+    repo = Mock(spec=ProductRepository)
+    repo.get.side_effect = lambda product_id: Product(id=product_id, name=f"P{product_id}",
+                                                      quantity=1, price=10)
+    repo.get_many.side_effect = lambda ids: [Product(id=i, name=f"P{i}", quantity=1, price=10)
+                                             for i in ids]
+    return repo
+
+
+def test_cached_product_repository_hits_and_misses(inner_repo):
+    repo = CachedProductRepository(inner_repo)
+
+    first = repo.get(1)
+    first.name = "changed"
+    second = repo.get(1)
+
+    assert second.name == "P1"
+    assert (repo.hits, repo.misses) == (1, 1)
+    inner_repo.get.assert_called_once_with(1)
+
+
+def test_cached_product_repository_get_many_loads_only_misses(inner_repo):
+    repo = CachedProductRepository(inner_repo)
+    repo.get(1)
+
+    products = repo.get_many([2, 1, 3, 2])
+
+    assert [p.id for p in products] == [2, 1, 3, 2]
+    inner_repo.get_many.assert_called_once_with([2, 3])
+
+
+def test_cached_product_repository_ttl_and_lru_eviction(inner_repo):
+    clock = FakeClock()
+    repo = CachedProductRepository(inner_repo, max_size=2, ttl=10, clock=clock)
+    repo.get(1)
+    repo.get(2)
+    repo.get(1)
+    repo.get(3)
+
+    repo.get(2)
+    assert inner_repo.get.call_count == 4
+
+    clock.now = 11
+    repo.get(3)
+    assert inner_repo.get.call_count == 5
+
+
+def test_cached_product_repository_invalidates_on_write(inner_repo):
+    repo = CachedProductRepository(inner_repo)
+    product = repo.get(1)
+
+    repo.update(product)
+    repo.get(1)
+    repo.delete(1)
+    repo.get(1)
+
+    assert inner_repo.get.call_count == 3
+    inner_repo.update.assert_called_once_with(product)
+    inner_repo.delete.assert_called_once_with(1)
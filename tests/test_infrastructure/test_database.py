@@ -0,0 +1,30 @@
+from sqlalchemy import text
+from infrastructure.database import create_warehouse_engine
+
+
+def test_production_profile_sets_pragmas(tmp_path):
+    engine = create_warehouse_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA temp_store")).scalar() == 2
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    engine.dispose()
+
+
+def test_default_profile_keeps_sqlite_defaults(tmp_path):
+    engine = create_warehouse_engine(f"sqlite:///{tmp_path / 'warehouse.db'}", "default")
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    engine.dispose()
+
+
+def test_memory_database_is_shared_between_connections():
+    engine = create_warehouse_engine("sqlite://")
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (id INTEGER)"))
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM t")).scalar() == 0
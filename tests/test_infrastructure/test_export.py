@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+from infrastructure.export import MANIFEST_FILE, export_tables, read_npy_part
+
+
+def _settle(engine, hours):
+    # Exports skip the current second, like the change feeds: what was just written is
+    # made "hours" older.
+    with engine.begin() as connection:
+        for table in ("products", "orders"):
+            connection.execute(text(f"UPDATE {table} SET update_datetime = "
+                                    f"datetime(update_datetime, '-{hours} hours') "
+                                    f"WHERE update_datetime > datetime('now', '-1 minute')"))
+
+
+def test_npy_export_is_incremental(engine, service, tmp_path):
+    directory = tmp_path / "export"
+    bolt = service.create_product("Bolt", 10, 2.5)
+    service.create_product("Écrou", 5, 0.5)
+    service.create_product("", 1, 1.0)
+    order = service.create_order([bolt.id, bolt.id, 2], "Main st")
+    _settle(engine, 2)
+
+    file_format, exports = export_tables(engine, directory, "npy", batch_size=2)
+    assert file_format == "npy"
+    assert [(e.table, e.rows) for e in exports] == \
+           [("products", 3), ("orders", 1), ("order_lines", 2)]
+    products = read_npy_part(directory / "products" / "part-00001")
+    assert list(products["name"]) == ["Bolt", "Écrou", ""]
+    assert products["quantity"].tolist() == [8, 4, 1]
+    assert products["price"].dtype == np.float64
+    assert isinstance(read_npy_part(directory / "orders" / "part-00001")["id"], np.memmap)
+
+    with pytest.raises(ValueError):
+        export_tables(engine, directory, "npy")
+    service.add_product_to_order(order.id, 3)
+    service.update_product(2, price=0.75)
+    _settle(engine, 1)
+
+    _, exports = export_tables(engine, directory, incremental=True)
+    assert [(e.table, e.rows) for e in exports] == \
+           [("products", 2), ("orders", 1), ("order_lines", 3)]
+    lines = read_npy_part(directory / "order_lines" / "part-00002")
+    assert lines["product_id"].tolist() == [1, 2, 3]
+    assert read_npy_part(directory / "orders" / "part-00002")["total_amount"].tolist() == [6.5]
+    assert [e.path for e in export_tables(engine, directory, incremental=True)[1]] == \
+           [None, None, None]
+    manifest = json.loads((directory / MANIFEST_FILE).read_text())
+    assert manifest["tables"]["orders"]["parts"] == 2
+
+
+def test_parquet_export(engine, service, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    service.create_product("Bolt", 10, 2.5)
+    service.create_order([1], "Main st")
+    _settle(engine, 1)
+
+    _, exports = export_tables(engine, tmp_path / "export", "parquet")
+    table = parquet.read_table(exports[1].path)
+    assert table.column("address").to_pylist() == ["Main st"]
+    assert table.column("line_count").to_pylist() == [1]
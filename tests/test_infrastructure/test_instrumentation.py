@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from domain.services import WarehouseService
+from infrastructure.instrumentation import ProfiledService, QueryProfiler
+from infrastructure.orm import Base
+from infrastructure.repositories import SqlAlchemyProductRepository, SqlAlchemyOrderRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def profiler(engine):
+    profiler = QueryProfiler(slow_ms=10_000, repeat_threshold=5)
+    profiler.attach(engine)
+    return profiler
+
+
+@pytest.fixture
+def service(engine, profiler):
+    session = sessionmaker(bind=engine)()
+    yield ProfiledService(WarehouseService(SqlAlchemyProductRepository(session),
+                                           SqlAlchemyOrderRepository(session),
+                                           SqlAlchemyUnitOfWork(session)), profiler)
+    session.close()
+
+
+def test_statements_are_attributed_to_service_calls(service, profiler):
+    product = service.create_product("P1", 10, 2.0)
+    service.create_order([product.id], "Address")
+    service.get_order(1)
+    assert list(service.iter_orders()) != []
+
+    operations = profiler.operations
+    assert operations["WarehouseService.create_product"].calls == 1
+    assert operations["WarehouseService.create_product"].statements == 1
+    assert operations["WarehouseService.get_order"].statements == 1
+    assert operations["WarehouseService.iter_orders"].calls == 1
+    assert operations["WarehouseService.iter_orders"].statements >= 1
+    assert sum(stats.count for stats in profiler.statements.values()) == \
+           sum(stats.statements for stats in operations.values())
+
+
+def test_repeated_statements_are_reported(engine, profiler):
+    with profiler.operation("loop"), engine.connect() as connection:
+        for i in range(6):
+            connection.execute(text("SELECT :i"), {"i": i})
+
+    [(name, statement, count)] = profiler.repeated_statements()
+    assert (name, statement, count) == ("loop", "SELECT ?", 6)
+    assert "Possible N+1 queries" in profiler.summary()
+
+
+def test_slow_operations_are_logged(engine, profiler, caplog):
+    profiler.slow_ms = 0
+    with caplog.at_level(logging.WARNING), profiler.operation("slow"), \
+            engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert "Slow operation slow" in caplog.text
+
+
+def test_detached_profiler_records_nothing(engine, profiler):
+    profiler.detach(engine)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert not profiler.statements
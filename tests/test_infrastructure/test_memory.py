@@ -0,0 +1,88 @@
+import pytest
+from domain.exceptions import OutOfStockError
+from domain.services import WarehouseService
+from infrastructure import memory
+from infrastructure.memory import (MemoryOrderRepository, MemoryProductRepository, MemoryStore,
+                                   MemoryStoreBusyError, MemoryUnitOfWork)
+
+
+def _service(store):
+    session = store.session()
+    return WarehouseService(MemoryProductRepository(session), MemoryOrderRepository(session),
+                            MemoryUnitOfWork(session))
+
+
+def _state(store):
+    return store.products, store.orders, store.next_product_id, store.next_order_id
+
+
+def test_snapshot_and_journal_are_replayed(tmp_path):
+    store = MemoryStore(str(tmp_path), snapshot_every=3)
+    service = _service(store)
+    bolt = service.create_product("Bolt", 10, 2.5)
+    nut = service.create_product("Nut", 10, 0.5)
+    order = service.create_order([bolt.id, nut.id, nut.id], "Main st")
+    # The third commit wrote a snapshot, these two only go to the journal.
+    service.add_product_to_order(order.id, bolt.id)
+    service.delete_product(nut.id)
+    expected = _state(store)
+
+    # Reopened without close(), as after a crash, and with a commit cut short.
+    with open(tmp_path / memory.JOURNAL_FILE, "a", encoding="utf-8") as journal:
+        journal.write('{"products": [[3, "Wash')
+    reopened = MemoryStore(str(tmp_path))
+    assert _state(reopened) == expected
+    assert [o.id for o in MemoryOrderRepository(reopened.session()).list_by_product(bolt.id)] == \
+           [order.id]
+
+    reopened.close()
+    assert (tmp_path / memory.JOURNAL_FILE).read_text() == ""
+    assert _state(MemoryStore(str(tmp_path))) == expected
+
+
+def test_commits_after_a_torn_journal_entry_survive(tmp_path):
+    store = MemoryStore(str(tmp_path))
+    _service(store).create_product("A", 1, 1.0)
+    with open(tmp_path / memory.JOURNAL_FILE, "a", encoding="utf-8") as journal:
+        journal.write('{"products": [[2, "Wash')
+
+    # Reopened twice without close(), as after two crashes.
+    recovered = MemoryStore(str(tmp_path))
+    service = _service(recovered)
+    service.create_product("B", 1, 1.0)
+    service.create_product("C", 1, 1.0)
+    assert [p.name for p in service.list_products_page()] == ["A", "B", "C"]
+    assert [p.name for p in _service(MemoryStore(str(tmp_path))).list_products_page()] == \
+           ["A", "B", "C"]
+
+
+def test_uncommitted_changes_are_private(monkeypatch):
+    monkeypatch.setattr(memory, "WRITER_TIMEOUT_SECONDS", 0.01)
+    store = MemoryStore()
+    writer, reader = _service(store), _service(store)
+    product = writer.create_product("Bolt", 10, 2.5)
+
+    product.quantity = 3
+    assert reader.get_product(product.id).quantity == 10
+    writer.product_repo.update(product)
+    assert writer.get_product(product.id).quantity == 3
+    assert reader.get_product(product.id).quantity == 10
+    with pytest.raises(MemoryStoreBusyError):
+        reader.create_product("Nut", 1, 1.0)
+
+    writer.uow.commit()
+    assert reader.get_product(product.id).quantity == 3
+
+
+def test_failed_order_releases_the_writer():
+    store = MemoryStore()
+    service = _service(store)
+    product = service.create_product("Bolt", 1, 2.5)
+
+    with pytest.raises(OutOfStockError):
+        service.create_order([product.id, product.id], "Main st")
+
+    order = _service(store).create_order([product.id], "Main st")
+    assert (order.id, store.next_order_id) == (1, 2)
+    assert store.products[product.id].quantity == 0
+    assert [o.id for o in service.order_repo.list_by_product(product.id)] == [order.id]
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from infrastructure.migrations import LATEST_VERSION, get_version, migrate
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE products (id INTEGER NOT NULL, name VARCHAR, quantity INTEGER, price FLOAT, "
+    "is_active BOOLEAN, update_datetime DATETIME DEFAULT (CURRENT_TIMESTAMP), PRIMARY KEY (id))",
+    "CREATE TABLE orders (id INTEGER NOT NULL, create_datetime DATETIME DEFAULT "
+    "(CURRENT_TIMESTAMP), update_datetime DATETIME DEFAULT (CURRENT_TIMESTAMP), "
+    "id_product INTEGER, is_deleted BOOLEAN, address VARCHAR, PRIMARY KEY (id), "
+    "FOREIGN KEY(id_product) REFERENCES products (id))",
+    "CREATE TABLE order_product_associations (order_id INTEGER, product_id INTEGER, "
+    "FOREIGN KEY(order_id) REFERENCES orders (id), "
+    "FOREIGN KEY(product_id) REFERENCES products (id))",
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_migrate_creates_new_database(engine):
+    assert migrate(engine) == LATEST_VERSION
+
+    with engine.connect() as connection:
+        assert get_version(connection) == LATEST_VERSION
+    assert {"products", "orders", "order_product_associations"} <= \
+           set(inspect(engine).get_table_names())
+
+
+def test_migrate_upgrades_legacy_database(engine):
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO products (name, quantity, price, is_active) "
+                                "VALUES ('P1', 1, 10, 1)"))
+        connection.execute(text("INSERT INTO orders (address) VALUES ('Test Address')"))
+        connection.execute(text("INSERT INTO order_product_associations VALUES (1, 1), (1, 1)"))
+
+    assert migrate(engine) == LATEST_VERSION
+    assert migrate(engine) == LATEST_VERSION
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT is_deleted FROM orders")).scalar() == 0
+        assert connection.execute(
+            text("SELECT order_id, product_id, quantity, unit_price "
+                 "FROM order_product_associations")).all() == [(1, 1, 2, 10.0)]
+    inspector = inspect(engine)
+    assert inspector.get_pk_constraint("order_product_associations")["constrained_columns"] == \
+           ["order_id", "product_id"]
+    assert {"ix_orders_live_id", "ix_orders_update_datetime_id"} <= \
+           {index["name"] for index in inspector.get_indexes("orders")}
+    assert "sync_watermarks" in inspector.get_table_names()
+    assert _search_rowids(engine, "p1") == [1]
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT total_amount, line_count FROM orders")).one() == \
+               (20.0, 1)
+        connection.execute(text("UPDATE order_product_associations SET quantity = 3"))
+        assert connection.execute(text("SELECT total_amount FROM orders")).scalar() == 30.0
+
+
+def test_migrate_adds_quantities_to_version_1_lines(engine):
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA[:2]:
+            connection.execute(text(statement))
+        connection.execute(text("CREATE TABLE order_product_associations ("
+                                "order_id INTEGER NOT NULL, product_id INTEGER NOT NULL, "
+                                "PRIMARY KEY (order_id, product_id))"))
+        connection.execute(text("INSERT INTO products (name, quantity, price, is_active) "
+                                "VALUES ('P1', 1, 10, 1)"))
+        connection.execute(text("INSERT INTO orders (address, is_deleted) VALUES ('A', 0)"))
+        connection.execute(text("INSERT INTO order_product_associations VALUES (1, 1)"))
+        connection.execute(text("PRAGMA user_version = 1"))
+
+    assert migrate(engine) == LATEST_VERSION
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT quantity, unit_price "
+                                       "FROM order_product_associations")).all() == [(1, 10.0)]
+
+
+def _search_rowids(engine, query):
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT rowid FROM products_fts WHERE products_fts MATCH "
+                                       ":query"), {"query": query}).scalars().all()
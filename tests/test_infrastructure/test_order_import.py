@@ -0,0 +1,27 @@
+import pytest
+from infrastructure.order_import import OrderRecord, read_orders
+
+
+def test_read_csv_orders(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_text("address,product_ids\nMain st,1;2 2\n", encoding="utf-8")
+
+    assert list(read_orders(path)) == [OrderRecord("Main st", [1, 2, 2])]
+
+
+def test_read_spool_directory(tmp_path):
+    (tmp_path / "b.jsonl").write_text('{"address": "B", "product_ids": [2]}\n', encoding="utf-8")
+    (tmp_path / "a.jsonl").write_text('{"address": "A", "product_ids": [1, 1]}\n\n',
+                                      encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("ignored", encoding="utf-8")
+
+    assert list(read_orders(tmp_path)) == [OrderRecord("A", [1, 1]), OrderRecord("B", [2])]
+
+
+def test_invalid_order_reports_line(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_text('{"address": "A", "product_ids": [1]}\n{"address": "B", "product_ids": []}\n',
+                    encoding="utf-8")
+
+    with pytest.raises(ValueError, match="line 2"):
+        list(read_orders(path))
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from domain.exceptions import OutOfStockError
+from domain.services import WarehouseService
+from infrastructure import order_ingest
+from infrastructure.database import create_warehouse_engine
+from infrastructure.migrations import migrate
+from infrastructure.order_import import OrderRecord
+from infrastructure.order_ingest import WorkerStats, ingest_chunk, ingest_orders
+from infrastructure.orm import OrderORM, ProductORM
+
+
+def _busy():
+    return OperationalError("INSERT", {}, Exception("database is locked"))
+
+
+def test_busy_database_is_retried(monkeypatch):
+    monkeypatch.setattr(order_ingest.time, "sleep", Mock())
+    service = Mock(spec=WarehouseService)
+    service.uow = Mock()
+    service.create_order.side_effect = [_busy(), _busy(), None, OutOfStockError([1])]
+
+    stats = ingest_chunk([OrderRecord("A", [1]), OrderRecord("B", [1])], service)
+
+    assert (stats.orders, stats.failures, stats.busy_retries) == (1, 1, 2)
+    assert service.uow.rollback.call_count == 2
+
+
+def test_unexpected_errors_fail_only_their_order():
+    service = Mock(spec=WarehouseService)
+    service.uow = Mock()
+    service.create_order.side_effect = [None, KeyError("address"), None]
+
+    stats = ingest_chunk([OrderRecord("A", [1]), OrderRecord("B", [1]), OrderRecord("C", [1])],
+                         service)
+
+    assert (stats.orders, stats.failures) == (2, 1)
+    assert service.uow.rollback.call_count == 1
+
+
+def test_ingest_orders_bounds_the_chunks_in_flight(monkeypatch):
+    read = []
+    in_flight = []
+    release = threading.Event()
+    wait = order_ingest.wait
+
+    def orders():
+        for i in range(100):
+            read.append(i)
+            yield OrderRecord(f"Address {i}", [1])
+
+    def ingest_chunk_stub(chunk):
+        release.wait(5)
+        return WorkerStats(worker=1, orders=len(chunk))
+
+    def wait_for_a_worker(*args, **kwargs):
+        # No chunk has finished yet, so every order read so far is still in flight.
+        in_flight.append(len(read))
+        release.set()
+        return wait(*args, **kwargs)
+
+    monkeypatch.setattr(order_ingest, "ProcessPoolExecutor",
+                        lambda max_workers, **_: ThreadPoolExecutor(max_workers))
+    monkeypatch.setattr(order_ingest, "ingest_chunk", ingest_chunk_stub)
+    monkeypatch.setattr(order_ingest, "wait", wait_for_a_worker)
+
+    per_worker = ingest_orders("sqlite://", orders(), workers=2, chunk_size=5)
+
+    assert per_worker[1].orders == 100
+    # Two chunks per worker plus the one waiting for a free slot.
+    assert in_flight[0] == (2 * 2 + 1) * 5
+
+
+def test_ingest_orders_in_worker_processes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'warehouse.db'}"
+    engine = create_warehouse_engine(url)
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(ProductORM.__table__.insert(),
+                           [{"name": "P1", "quantity": 30, "price": 1.0}])
+    engine.dispose()
+
+    orders = [OrderRecord(f"Address {i}", [1]) for i in range(40)]
+    per_worker = ingest_orders(url, orders, workers=2, chunk_size=5)
+
+    assert sum(stats.orders for stats in per_worker.values()) == 30
+    assert sum(stats.failures for stats in per_worker.values()) == 10
+    with create_engine(url).connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(OrderORM)) == 30
+        assert connection.scalar(select(ProductORM.quantity)) == 0
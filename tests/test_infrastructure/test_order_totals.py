@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import text
+from infrastructure.order_totals import verify_order_totals
+
+
+def _totals(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT id, total_amount, line_count, update_datetime "
+                                       "FROM orders ORDER BY id")).all()
+
+
+def test_totals_follow_the_service_and_are_rebuilt(engine, service):
+    bolt = service.create_product("Bolt", 100, 2.5)
+    nut = service.create_product("Nut", 100, 0.1)
+    first = service.create_order([bolt.id, nut.id, nut.id], "Main st")
+    second = service.create_order([bolt.id], "Side st")
+    service.add_product_to_order(second.id, nut.id, 3)
+    service.remove_product_from_order(first.id, bolt.id)
+    service.update_order(second.id, [bolt.id, bolt.id])
+    service.update_product(bolt.id, price=9.0)
+
+    expected = _totals(engine)
+    assert [row[1:3] for row in expected] == [(pytest.approx(0.2), 1), (5.0, 1)]
+    assert verify_order_totals(engine) == (2, [], False)
+
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE orders SET total_amount = 7, line_count = 0 WHERE id = 2"))
+    assert verify_order_totals(engine) == (2, [2], False)
+    assert verify_order_totals(engine, rebuild=True) == (2, [2], True)
+    assert _totals(engine) == expected
@@ -0,0 +1,24 @@
+import pytest
+from infrastructure.product_import import read_products
+
+
+def test_read_csv_products(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("name,quantity,price,is_active\nP1,5,10.5,y\nP2,1,3,no\n", encoding="utf-8")
+
+    products = list(read_products(path))
+
+    assert [(p.name, p.quantity, p.price, p.is_active) for p in products] == \
+           [("P1", 5, 10.5, True), ("P2", 1, 3.0, False)]
+
+
+def test_read_jsonl_products(tmp_path):
+    path = tmp_path / "products.jsonl"
+    path.write_text('{"name": "P1", "quantity": 5, "price": 10.5}\n\n'
+                    '{"name": "P2", "quantity": "x", "price": 1}\n', encoding="utf-8")
+
+    products = read_products(path)
+
+    assert next(products).name == "P1"
+    with pytest.raises(ValueError, match="line 3"):
+        next(products)
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from domain.models import Product
+from infrastructure.read_only import (ReadOnlyOrderRepository, ReadOnlyProductRepository,
+                                      ReadOnlyRepositoryError, create_read_only_engine,
+                                      read_only_session_factory)
+
+
+@pytest.fixture
+def read_factory(engine, database_url):
+    read_engine = create_read_only_engine(database_url)
+    yield read_only_session_factory(read_engine)
+    read_engine.dispose()
+
+
+@pytest.fixture
+def service(service, read_factory):
+    service.product_reader = ReadOnlyProductRepository(read_factory)
+    service.order_reader = ReadOnlyOrderRepository(read_factory)
+    return service
+
+
+def test_reads_go_through_read_only_repositories(service):
+    product = service.create_product("Widget", 5, 2.5)
+    order = service.create_order([product.id, product.id], "Address")
+
+    assert service.get_product(product.id) == Product(product.id, "Widget", 3, 2.5)
+    assert service.get_products([product.id]) == [Product(product.id, "Widget", 3, 2.5)]
+    assert service.get_order(order.id).lines[product.id].quantity == 2
+    assert [o.id for o in service.list_orders_page()] == [order.id]
+    assert [p.name for p in service.iter_products()] == ["Widget"]
+    assert [p.id for p in service.search_products("wid")] == [product.id]
+
+    service.add_product_to_order(order.id, product.id)
+    assert service.get_order(order.id).lines[product.id].quantity == 3
+
+
+def test_read_only_sessions_cannot_write(read_factory):
+    with read_factory() as session, pytest.raises(OperationalError, match="readonly"):
+        session.execute(text("INSERT INTO products (name) VALUES ('P1')"))
+
+    with pytest.raises(ReadOnlyRepositoryError):
+        ReadOnlyProductRepository(read_factory).add(Product(None, "P1", 1, 1.0))
+    with pytest.raises(ReadOnlyRepositoryError):
+        ReadOnlyOrderRepository(read_factory).delete(1)
+
+
+def test_read_only_engine_needs_a_database_file():
+    with pytest.raises(ValueError):
+        create_read_only_engine("sqlite:///:memory:")
@@ -1,23 +1,14 @@
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from infrastructure.orm import Base
-from infrastructure.repositories import SqlAlchemyProductRepository, SqlAlchemyOrderRepository
-from domain.models import Product, Order
+from sqlalchemy import text
+from domain.exceptions import OutOfStockError, ProductNotFoundError
+from infrastructure.orm import order_product_associations
+from infrastructure import orm_mapping, repositories
+from infrastructure.repositories import (SqlAlchemyProductRepository, SqlAlchemyOrderRepository,
+                                         SqlAlchemyWatermarkRepository)
+from domain.models import ChangeWatermark, Product, Order
 from datetime import datetime
 
 
-@pytest.fixture
-def test_session():
-    engine = create_engine('sqlite:///:memory:')
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    yield session
-    session.rollback()
-    session.close()
-
-
 def test_product_repository(test_session):
     repo = SqlAlchemyProductRepository(test_session)
 
@@ -71,4 +62,293 @@ def test_order_repository(test_session):
     retrieved = order_repo.get(order.id)
     assert retrieved.address == "Test Address"
     assert len(retrieved.products) == 2
-    assert retrieved.products[0].name == "P1"
\ No newline at end of file
+    assert retrieved.products[0].name == "P1"
+
+
+def test_product_repository_get_many(test_session, monkeypatch):
+    monkeypatch.setattr(orm_mapping, "IN_CLAUSE_CHUNK_SIZE", 2)
+    repo = SqlAlchemyProductRepository(test_session)
+    products = [Product(id=None, name=f"P{i}", quantity=i, price=i, is_active=True)
+                for i in range(5)]
+    for product in products:
+        repo.add(product)
+    test_session.commit()
+
+    ids = [products[3].id, products[0].id, products[4].id, products[0].id]
+    retrieved = repo.get_many(ids)
+    assert [p.id for p in retrieved] == ids
+
+    with pytest.raises(ProductNotFoundError) as error:
+        repo.get_many([products[1].id, 1000, 1001])
+    assert error.value.product_ids == [1000, 1001]
+
+
+def test_order_repository_reuses_loaded_products(test_session, statements):
+    product_repo = SqlAlchemyProductRepository(test_session)
+    products = [Product(id=None, name=f"P{i}", quantity=1, price=10, is_active=True)
+                for i in range(20)]
+    for product in products:
+        product_repo.add(product)
+    test_session.commit()
+
+    statements.clear()
+    loaded = product_repo.get_many([p.id for p in products])
+    order_repo = SqlAlchemyOrderRepository(test_session)
+    order_repo.add(Order(id=None, products=loaded, address="Test Address"))
+
+    product_selects = [s for s in statements if s.startswith("SELECT") and "FROM products" in s]
+    assert len(product_selects) == 1
+
+
+def _seed_orders(session, orders_count):
+    product_repo = SqlAlchemyProductRepository(session)
+    order_repo = SqlAlchemyOrderRepository(session)
+    products = [Product(id=None, name=f"P{i}", quantity=1, price=10, is_active=True)
+                for i in range(3)]
+    for product in products:
+        product_repo.add(product)
+    orders = [Order(id=None, products=products, address="Test Address")
+              for _ in range(orders_count)]
+    for order in orders:
+        order_repo.add(order)
+    session.commit()
+    session.expunge_all()
+    return orders
+
+
+@pytest.mark.parametrize("orders_count", [1, 10, 100])
+def test_order_repository_list_statement_count_is_constant(test_session, statements,
+                                                           orders_count):
+    _seed_orders(test_session, orders_count)
+
+    statements.clear()
+    orders = SqlAlchemyOrderRepository(test_session).list()
+
+    assert len(orders) == orders_count
+    assert all(len(order.products) == 3 for order in orders)
+    assert len(statements) == 2
+
+
+def test_order_repository_get_uses_single_statement(test_session, statements):
+    order = _seed_orders(test_session, 1)[0]
+
+    statements.clear()
+    retrieved = SqlAlchemyOrderRepository(test_session).get(order.id)
+
+    assert len(retrieved.products) == 3
+    assert len(statements) == 1
+
+
+def test_product_repository_pagination(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    products = [Product(id=None, name=f"P{i}", quantity=i, price=i, is_active=True)
+                for i in range(7)]
+    for product in products:
+        repo.add(product)
+    test_session.commit()
+
+    first_page = repo.list_page(limit=3)
+    second_page = repo.list_page(after_id=first_page[-1].id, limit=3)
+    last_page = repo.list_page(after_id=second_page[-1].id, limit=3)
+
+    assert [p.id for p in first_page + second_page + last_page] == [p.id for p in products]
+    assert repo.list_page(after_id=last_page[-1].id, limit=3) == []
+    assert [p.id for p in repo.iter_all(batch_size=2)] == [p.id for p in products]
+
+
+def test_order_repository_pagination(test_session):
+    orders = _seed_orders(test_session, 5)
+    repo = SqlAlchemyOrderRepository(test_session)
+
+    first_page = repo.list_page(limit=2)
+    rest = repo.list_page(after_id=first_page[-1].id, limit=10)
+
+    assert [o.id for o in first_page + rest] == [o.id for o in orders]
+    streamed = list(repo.iter_all(batch_size=2))
+    assert [o.id for o in streamed] == [o.id for o in orders]
+    assert all(len(o.products) == 3 for o in streamed)
+
+
+def test_product_repository_add_many(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    products = (Product(id=None, name=f"P{i}", quantity=i, price=i, is_active=True)
+                for i in range(5))
+
+    assert repo.add_many(products, batch_size=2) == 5
+    test_session.commit()
+
+    assert [p.name for p in repo.list()] == [f"P{i}" for i in range(5)]
+
+
+def test_product_repository_add_many_upsert_by_name(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    repo.add_many([Product(id=None, name="P1", quantity=1, price=10)])
+    test_session.commit()
+
+    repo.add_many([Product(id=None, name="P1", quantity=7, price=12),
+                   Product(id=None, name="P2", quantity=3, price=5)], upsert_by_name=True)
+    test_session.commit()
+
+    products = {p.name: p for p in repo.list()}
+    assert len(products) == 2
+    assert (products["P1"].quantity, products["P1"].price) == (7, 12)
+
+
+def test_report_repository(test_session):
+    product_repo = SqlAlchemyProductRepository(test_session)
+    order_repo = SqlAlchemyOrderRepository(test_session)
+    p1 = Product(id=None, name="P1", quantity=2, price=10, is_active=True)
+    p2 = Product(id=None, name="P2", quantity=3, price=5, is_active=True)
+    product_repo.add(p1)
+    product_repo.add(p2)
+    order_repo.add(Order(id=None, products=[p1, p2], address="A"))
+    order_repo.add(Order(id=None, products=[p2], address="A"))
+    order_repo.add(Order(id=None, products=[p1], address="B"))
+    test_session.commit()
+
+    repo = repositories.SqlAlchemyReportRepository(test_session)
+
+    assert repo.inventory_totals() == (2, 5, 35.0)
+    assert list(repo.stock_on_hand()) == [(p1.id, "P1", 2, 20.0), (p2.id, "P2", 3, 15.0)]
+    assert repo.order_value_by_address() == [("A", 2, 20.0), ("B", 1, 10.0)]
+
+
+def test_product_repository_reserve_stock(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    p1 = Product(id=None, name="P1", quantity=5, price=10, is_active=True)
+    p2 = Product(id=None, name="P2", quantity=1, price=10, is_active=True)
+    repo.add(p1)
+    repo.add(p2)
+    test_session.commit()
+
+    repo.reserve_stock({p1.id: 3, p2.id: 1})
+    test_session.commit()
+    assert (repo.get(p1.id).quantity, repo.get(p2.id).quantity) == (2, 0)
+
+    with pytest.raises(OutOfStockError) as error:
+        repo.reserve_stock({p1.id: 2, p2.id: 1, 1000: 1})
+    test_session.rollback()
+    assert error.value.product_ids == [p2.id, 1000]
+    assert repo.get(p1.id).quantity == 2
+
+
+def test_order_repository_lines(test_session):
+    product_repo = SqlAlchemyProductRepository(test_session)
+    order_repo = SqlAlchemyOrderRepository(test_session)
+    p1 = Product(id=None, name="P1", quantity=1000, price=10, is_active=True)
+    p2 = Product(id=None, name="P2", quantity=1000, price=20, is_active=True)
+    product_repo.add(p1)
+    product_repo.add(p2)
+    order = Order(id=None, address="Test Address", products=[p1] * 500)
+    order_repo.add(order)
+    test_session.commit()
+
+    p1.price = 15
+    product_repo.update(p1)
+    order.add_product(p2, 3)
+    order.remove_product(p1.id, 100)
+    order_repo.update(order)
+    test_session.commit()
+
+    rows = test_session.execute(
+        order_product_associations.select().order_by("product_id")).all()
+    assert [(r.product_id, r.quantity, r.unit_price) for r in rows] == \
+           [(p1.id, 400, 10.0), (p2.id, 3, 20.0)]
+    retrieved = order_repo.get(order.id)
+    assert {pid: line.quantity for pid, line in retrieved.lines.items()} == {p1.id: 400, p2.id: 3}
+    assert retrieved.lines[p1.id].unit_price == 10.0
+    assert retrieved.lines[p1.id].product.price == 15.0
+
+
+def test_product_repository_iter_batches(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    repo.add_many(Product(id=None, name=f"P{i}", quantity=i, price=0.5, is_active=True)
+                  for i in range(5))
+    test_session.commit()
+
+    batches = list(repo.iter_batches(batch_size=2))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [list(batch.quantities) for batch in batches] == [[0, 1], [2, 3], [4]]
+    assert sum(batch.value() for batch in batches) == 5.0
+
+
+def test_product_repository_search(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    repo.add_many(Product(id=None, name=name, quantity=1, price=1.0, is_active=is_active)
+                  for name, is_active in [("Blue Widget", True), ("Widget", True),
+                                          ("Crème brûlée", True), ("Widget spare", False),
+                                          ("Gadget", True)])
+    test_session.commit()
+
+    assert [p.name for p in repo.search("wid")] == ["Widget", "Blue Widget"]
+    assert [p.name for p in repo.search("wid", offset=1, limit=1)] == ["Blue Widget"]
+    assert [p.name for p in repo.search('blue "wi')] == ["Blue Widget"]
+    assert [p.name for p in repo.search("creme")] == ["Crème brûlée"]
+    assert repo.search("  ") == []
+
+    gadget = repo.get(5)
+    gadget.name = "Widget gadget"
+    repo.update(gadget)
+    repo.delete(2)
+    test_session.commit()
+
+    assert [p.name for p in repo.search("widget")] == ["Blue Widget", "Widget gadget"]
+    assert repo.search("gadget")[0].id == 5
+
+
+def _backdate_changes(session, hours=1):
+    # Feeds skip the current second, move everything written so far out of it.
+    for table in ("products", "orders"):
+        session.execute(text(f"UPDATE {table} SET update_datetime = "
+                             f"datetime(update_datetime, '-{hours} hours')"))
+    session.commit()
+
+
+def test_change_feeds(test_session):
+    product_repo = SqlAlchemyProductRepository(test_session)
+    order_repo = SqlAlchemyOrderRepository(test_session)
+    products = [Product(id=None, name=f"P{i}", quantity=10, price=1.0) for i in range(3)]
+    for product in products:
+        product_repo.add(product)
+    order = Order(id=None, address="Address", products=products[:1])
+    order_repo.add(order)
+    test_session.commit()
+    _backdate_changes(test_session, hours=2)
+
+    batches = list(product_repo.changes_since(ChangeWatermark(), batch_size=2))
+    assert [[change.product.id for change in batch] for batch in batches] == [[1, 2], [3]]
+    watermark = batches[-1][-1].watermark
+    assert list(product_repo.changes_since(watermark)) == []
+
+    products[1].price = 2.0
+    product_repo.update(products[1])
+    order_repo.delete(order.id)
+    test_session.commit()
+    _backdate_changes(test_session)
+
+    [[change]] = product_repo.changes_since(watermark)
+    assert (change.product.id, change.product.price) == (2, 2.0)
+    [[tombstone]] = order_repo.changes_since(ChangeWatermark())
+    assert (tombstone.order_id, tombstone.is_deleted, tombstone.order) == (order.id, True, None)
+
+
+def test_change_feed_skips_the_current_second(test_session):
+    product_repo = SqlAlchemyProductRepository(test_session)
+    product_repo.add(Product(id=None, name="P1", quantity=1, price=1.0))
+    test_session.commit()
+
+    assert list(product_repo.changes_since(ChangeWatermark())) == []
+
+
+def test_watermark_repository(test_session):
+    repo = SqlAlchemyWatermarkRepository(test_session)
+    assert repo.get("bi", "orders") == ChangeWatermark()
+
+    watermark = ChangeWatermark(datetime(2024, 5, 1, 12, 30), 7)
+    repo.save("bi", "orders", watermark)
+    repo.save("bi", "orders", watermark._replace(id=8))
+    test_session.commit()
+
+    assert repo.get("bi", "orders") == watermark._replace(id=8)
+    assert repo.get("bi", "products") == ChangeWatermark()
@@ -0,0 +1,430 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from domain.exceptions import OutOfStockError, ProductNotFoundError
+from domain.models import (ChangeWatermark, Order, Product, ProductAdjustment,
+                           ProductSelection)
+from domain.repositories import OrderRepository, ProductRepository
+from domain.services import WarehouseService
+from domain.unit_of_work import UnitOfWork
+from infrastructure.memory import (MemoryOrderRepository, MemoryProductRepository, MemoryStore,
+                                   MemoryUnitOfWork)
+from infrastructure.orm import Base
+from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+from .test_async_repositories import _run_with_service
+
+# Every repository implementation has to pass these.
+
+
+class Backend(NamedTuple):
+    products: ProductRepository
+    orders: OrderRepository
+    uow: UnitOfWork
+    # Makes everything committed so far look "hours" older.
+    pass_time: Callable[[int], None]
+
+
+def _sqlalchemy_backend():
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    def pass_time(hours):
+        for table in ("products", "orders"):
+            session.execute(text(f"UPDATE {table} SET update_datetime = "
+                                 f"datetime(update_datetime, '-{hours} hours')"))
+        session.commit()
+
+    return Backend(SqlAlchemyProductRepository(session), SqlAlchemyOrderRepository(session),
+                   SqlAlchemyUnitOfWork(session), pass_time), session.close
+
+
+def _memory_backend():
+    now = [datetime(2024, 5, 1, 12, 0)]
+    store = MemoryStore(clock=lambda: now[0])
+    session = store.session()
+
+    def pass_time(hours):
+        now[0] += timedelta(hours=hours)
+
+    return Backend(MemoryProductRepository(session), MemoryOrderRepository(session),
+                   MemoryUnitOfWork(session), pass_time), session.rollback
+
+
+@pytest.fixture(params=["sqlalchemy", "memory"])
+def backend(request):
+    backend, close = {"sqlalchemy": _sqlalchemy_backend, "memory": _memory_backend}[request.param]()
+    yield backend
+    close()
+
+
+def _add_products(backend, *quantities, price=10.0):
+    products = [Product(id=None, name=f"P{i}", quantity=quantity, price=price)
+                for i, quantity in enumerate(quantities, 1)]
+    for product in products:
+        backend.products.add(product)
+    backend.uow.commit()
+    return products
+
+
+def test_product_add_get_list(backend):
+    p1, p2 = _add_products(backend, 5, 1)
+    inactive = Product(id=None, name="Old", quantity=1, price=1.0, is_active=False)
+    backend.products.add(inactive)
+    backend.uow.commit()
+
+    assert backend.products.get(p1.id) == Product(p1.id, "P1", 5, 10.0)
+    assert [p.id for p in backend.products.list()] == [p1.id, p2.id]
+    assert [p.id for p in backend.products.get_many([p2.id, inactive.id, p2.id])] == \
+           [p2.id, inactive.id, p2.id]
+    with pytest.raises(ProductNotFoundError) as error:
+        backend.products.get_many([p1.id, 1000, 1001])
+    assert error.value.product_ids == [1000, 1001]
+
+    backend.products.delete(p1.id)
+    backend.uow.commit()
+    assert [p.id for p in backend.products.list()] == [p2.id]
+
+
+def test_product_pagination(backend):
+    products = _add_products(backend, *range(7))
+
+    first_page = backend.products.list_page(limit=3)
+    second_page = backend.products.list_page(after_id=first_page[-1].id, limit=3)
+    last_page = backend.products.list_page(after_id=second_page[-1].id, limit=3)
+
+    assert [p.id for p in first_page + second_page + last_page] == [p.id for p in products]
+    assert backend.products.list_page(after_id=last_page[-1].id, limit=3) == []
+    assert [p.id for p in backend.products.iter_all(batch_size=2)] == [p.id for p in products]
+    batches = list(backend.products.iter_batches(batch_size=3))
+    assert [list(batch.quantities) for batch in batches] == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_product_add_many_upsert_by_name(backend):
+    assert backend.products.add_many(
+        (Product(id=None, name=f"P{i}", quantity=1, price=10) for i in range(3)),
+        batch_size=2) == 3
+    backend.uow.commit()
+
+    backend.products.add_many([Product(id=None, name="P1", quantity=7, price=12),
+                               Product(id=None, name="P9", quantity=3, price=5)],
+                              upsert_by_name=True)
+    backend.uow.commit()
+
+    products = {p.name: p for p in backend.products.list()}
+    assert sorted(products) == ["P0", "P1", "P2", "P9"]
+    assert (products["P1"].quantity, products["P1"].price) == (7, 12)
+
+
+def test_reserve_stock(backend):
+    p1, p2 = _add_products(backend, 5, 1)
+
+    backend.products.reserve_stock({p1.id: 3, p2.id: 1})
+    backend.uow.commit()
+    assert (backend.products.get(p1.id).quantity, backend.products.get(p2.id).quantity) == (2, 0)
+
+    with pytest.raises(OutOfStockError) as error:
+        backend.products.reserve_stock({p1.id: 2, p2.id: 1, 1000: 1})
+    backend.uow.rollback()
+    assert error.value.product_ids == [p2.id, 1000]
+    assert backend.products.get(p1.id).quantity == 2
+
+
+def _stock(products, *ids):
+    return [product.quantity for product in products.get_many(list(ids))]
+
+
+def test_adding_to_an_order_reserves_stock(backend):
+    p1, p2 = _add_products(backend, 2, 3)
+    service = WarehouseService(backend.products, backend.orders, backend.uow)
+    order = service.create_order([p1.id], "Main st")
+
+    with pytest.raises(OutOfStockError) as error:
+        service.add_product_to_order(order.id, p1.id, 500)
+    assert error.value.product_ids == [p1.id]
+    assert _stock(backend.products, p1.id) == [1]
+    assert [line.quantity for line in backend.orders.get(order.id).lines.values()] == [1]
+
+    service.add_product_to_order(order.id, p1.id)
+    service.add_product_to_order(order.id, p2.id, 2)
+    assert _stock(backend.products, p1.id, p2.id) == [0, 1]
+
+
+def test_updating_an_order_reserves_and_returns_stock(backend):
+    p1, p2 = _add_products(backend, 5, 1)
+    service = WarehouseService(backend.products, backend.orders, backend.uow)
+    order = service.create_order([p1.id, p1.id, p1.id], "Main st")
+
+    with pytest.raises(OutOfStockError):
+        service.update_order(order.id, [p1.id, p2.id, p2.id])
+    assert _stock(backend.products, p1.id, p2.id) == [2, 1]
+
+    service.update_order(order.id, [p1.id, p2.id])
+    assert _stock(backend.products, p1.id, p2.id) == [4, 0]
+    assert {pid: line.quantity for pid, line in backend.orders.get(order.id).lines.items()} == \
+           {p1.id: 1, p2.id: 1}
+
+
+def test_updating_an_order_keeps_the_price_of_kept_lines(backend):
+    p1, p2, p3 = _add_products(backend, 5, 5, 5)
+    service = WarehouseService(backend.products, backend.orders, backend.uow)
+    order = service.create_order([p1.id, p2.id, p2.id], "Main st")
+    service.update_product(p1.id, price=99.0)
+    service.update_product(p2.id, price=99.0)
+    service.update_product(p3.id, price=50.0)
+
+    service.update_order(order.id, [p1.id, p2.id, p3.id])
+    lines = backend.orders.get(order.id).lines
+    assert {pid: (line.quantity, line.unit_price) for pid, line in lines.items()} == \
+           {p1.id: (1, 10.0), p2.id: (1, 10.0), p3.id: (1, 50.0)}
+    assert backend.orders.get(order.id).total_amount == 70.0
+    assert _stock(backend.products, p1.id, p2.id, p3.id) == [4, 4, 4]
+
+
+def test_removing_from_an_order_returns_stock(backend):
+    p1, p2 = _add_products(backend, 5, 1)
+    service = WarehouseService(backend.products, backend.orders, backend.uow)
+    order = service.create_order([p1.id, p1.id, p1.id, p2.id], "Main st")
+
+    service.remove_product_from_order(order.id, p1.id, 2)
+    assert _stock(backend.products, p1.id, p2.id) == [4, 0]
+    service.remove_product_from_order(order.id, p2.id)
+    assert _stock(backend.products, p1.id, p2.id) == [4, 1]
+
+
+def test_deleting_an_order_returns_stock(backend):
+    p1, p2 = _add_products(backend, 5, 1)
+    service = WarehouseService(backend.products, backend.orders, backend.uow)
+    order = service.create_order([p1.id, p1.id, p2.id], "Main st")
+
+    service.delete_order(order.id)
+    assert _stock(backend.products, p1.id, p2.id) == [5, 1]
+    assert backend.orders.get(order.id) is None
+    service.delete_order(order.id)
+    assert _stock(backend.products, p1.id, p2.id) == [5, 1]
+
+
+async def _async_stock(service, *ids):
+    return [product.quantity for product in await service.product_repo.get_many(list(ids))]
+
+
+def test_async_order_edits_reserve_and_return_stock():
+    async def scenario(service):
+        p1 = await service.create_product("P1", 2, 10)
+        p2 = await service.create_product("P2", 3, 20)
+        order = await service.create_order([p1.id], "Main st")
+        with pytest.raises(OutOfStockError):
+            await service.add_product_to_order(order.id, p1.id, 500)
+        stock = [await _async_stock(service, p1.id, p2.id)]
+
+        await service.add_product_to_order(order.id, p2.id, 2)
+        stock.append(await _async_stock(service, p1.id, p2.id))
+        with pytest.raises(OutOfStockError):
+            await service.update_order(order.id, [p1.id, p1.id, p2.id, p2.id, p2.id, p2.id])
+        await service.update_order(order.id, [p1.id, p1.id, p2.id])
+        stock.append(await _async_stock(service, p1.id, p2.id))
+        await service.remove_product_from_order(order.id, p1.id, 1)
+        stock.append(await _async_stock(service, p1.id, p2.id))
+        await service.delete_order(order.id)
+        stock.append(await _async_stock(service, p1.id, p2.id))
+        return stock
+
+    assert asyncio.run(_run_with_service(scenario)) == \
+           [[1, 3], [1, 1], [0, 2], [1, 2], [2, 3]]
+
+
+def test_bulk_adjustments_match_their_preview(backend):
+    bolts = [Product(id=None, name=f"Bolt {i}", quantity=10 * i, price=1.1 * i)
+             for i in range(1, 6)]
+    backend.products.add_many([*bolts, Product(id=None, name="Nut", quantity=3, price=0.3),
+                               Product(id=None, name="Bolt old", quantity=1, price=9.0,
+                                       is_active=False)])
+    backend.uow.commit()
+    service = WarehouseService(backend.products, backend.orders, backend.uow)
+
+    selection = ProductSelection(name_prefix="bolt", min_price=2.0)
+    adjustment = ProductAdjustment(price_percent=7.5, price_amount=-0.25, quantity_delta=-15)
+    preview = service.preview_product_adjustment(selection, adjustment)
+    assert list(preview.ids) == [2, 3, 4, 5]
+    assert service.adjust_products(selection, adjustment) == 4
+    adjusted = backend.products.get_many([1, 2, 3, 4, 5])
+    assert [p.price for p in adjusted] == [1.1, *preview.new_prices]
+    assert [p.quantity for p in adjusted] == [10, 5, 15, 25, 35] == [10, *preview.new_quantities]
+
+    adjustments = {1: ProductAdjustment(quantity_delta=-100),
+                   6: ProductAdjustment(price_percent=-50),
+                   7: ProductAdjustment(price_amount=1.0)}
+    preview = service.preview_product_adjustments_by_id(adjustments)
+    assert (list(preview.ids), list(preview.new_quantities)) == ([1, 6, 7], [0, 3, 1])
+    assert service.adjust_products_by_id({**adjustments, 1000: ProductAdjustment(1.0)}) == 3
+    assert [(p.quantity, p.price) for p in backend.products.get_many([1, 6, 7])] == \
+           [(0, 1.1), (3, 0.15), (1, 10.0)] == list(zip(preview.new_quantities,
+                                                      preview.new_prices))
+
+
+def test_rollback_discards_changes(backend):
+    [product] = _add_products(backend, 5)
+
+    product.quantity = 1
+    backend.products.update(product)
+    backend.products.add(Product(id=None, name="New", quantity=1, price=1.0))
+    backend.uow.rollback()
+
+    assert [(p.id, p.quantity) for p in backend.products.list()] == [(product.id, 5)]
+
+
+def test_order_lines_keep_their_price(backend):
+    p1, p2 = _add_products(backend, 1000, 1000)
+    order = Order(id=None, address="Test Address", products=[p1] * 500)
+    backend.orders.add(order)
+    backend.uow.commit()
+    assert order.id is not None and order.create_datetime is not None
+
+    p1.price = 15
+    backend.products.update(p1)
+    order.add_product(p2, 3)
+    order.remove_product(p1.id, 100)
+    backend.orders.update(order)
+    backend.uow.commit()
+
+    retrieved = backend.orders.get(order.id)
+    assert {pid: line.quantity for pid, line in retrieved.lines.items()} == {p1.id: 400, p2.id: 3}
+    assert retrieved.lines[p1.id].unit_price == 10.0
+    assert retrieved.lines[p1.id].product.price == 15.0
+
+    backend.orders.delete_one_quantity_product(retrieved, p2)
+    backend.orders.delete_product(retrieved, p1)
+    backend.uow.commit()
+    assert {pid: line.quantity for pid, line in backend.orders.get(order.id).lines.items()} == \
+           {p2.id: 2}
+
+
+def test_orders_keep_lines_of_deleted_products(backend):
+    p1, p2 = _add_products(backend, 10, 10)
+    order = Order(id=None, address="Main st", products=[p1, p2, p2])
+    backend.orders.add(order)
+    backend.uow.commit()
+    backend.products.delete(p2.id)
+    backend.uow.commit()
+    backend.pass_time(1)
+
+    [line] = [line for pid, line in backend.orders.get(order.id).lines.items() if pid == p2.id]
+    assert (line.product.name, line.product.is_active, line.quantity, line.unit_price) == \
+           (None, False, 2, 10.0)
+    assert backend.orders.get(order.id).total_amount == 30.0
+    assert [list(o.lines) for o in backend.orders.list_page()] == [[p1.id, p2.id]]
+    assert [o.id for o in backend.orders.iter_all()] == [order.id]
+    [[change]] = backend.orders.changes_since(ChangeWatermark())
+    assert list(change.order.lines) == [p1.id, p2.id]
+
+
+def test_order_pagination_and_delete(backend):
+    products = _add_products(backend, 100, 100, 100)
+    orders = [Order(id=None, products=products, address=f"A{i}") for i in range(5)]
+    for order in orders:
+        backend.orders.add(order)
+    backend.uow.commit()
+
+    first_page = backend.orders.list_page(limit=2)
+    rest = backend.orders.list_page(after_id=first_page[-1].id, limit=10)
+    assert [o.id for o in first_page + rest] == [o.id for o in orders]
+    streamed = list(backend.orders.iter_all(batch_size=2))
+    assert [len(o.products) for o in streamed] == [3] * 5
+
+    backend.orders.delete(orders[1].id)
+    backend.uow.commit()
+    assert backend.orders.get(orders[1].id) is None
+    assert [o.id for o in backend.orders.list()] == [o.id for o in orders if o is not orders[1]]
+
+
+def test_order_summaries_keep_their_totals(backend):
+    p1, p2 = _add_products(backend, 100, 100)
+    orders = [Order(id=None, address=f"A{i}", products=[p1, p1, p2][:i]) for i in range(4)]
+    for order in orders:
+        backend.orders.add(order)
+    backend.uow.commit()
+
+    p1.price = 99.0
+    backend.products.update(p1)
+    orders[3].remove_product(p1.id, 1)
+    backend.orders.update(orders[3])
+    backend.orders.delete(orders[1].id)
+    backend.uow.commit()
+
+    summaries = backend.orders.list_summaries(after_id=orders[0].id, limit=5)
+    assert [(s.id, s.address, s.total_amount, s.line_count) for s in summaries] == \
+           [(orders[2].id, "A2", 20.0, 1), (orders[3].id, "A3", 20.0, 2)]
+    assert [s.total_amount for s in backend.orders.list_summaries(limit=1)] == [0.0]
+    assert backend.orders.get(orders[3].id).total_amount == 20.0
+
+
+def test_product_search(backend):
+    backend.products.add_many(
+        Product(id=None, name=name, quantity=1, price=1.0, is_active=is_active)
+        for name, is_active in [("Blue Widget", True), ("Widget", True), ("Crème brûlée", True),
+                                ("Widget spare", False), ("Gadget", True)])
+    backend.uow.commit()
+
+    assert [p.name for p in backend.products.search("wid")] == ["Widget", "Blue Widget"]
+    assert [p.name for p in backend.products.search("wid", offset=1, limit=1)] == \
+           ["Blue Widget"]
+    assert [p.name for p in backend.products.search('blue "wi')] == ["Blue Widget"]
+    assert [p.name for p in backend.products.search("creme")] == ["Crème brûlée"]
+    assert backend.products.search("  ") == []
+
+    gadget = backend.products.get(5)
+    gadget.name = "Widget gadget"
+    backend.products.update(gadget)
+    backend.products.delete(2)
+    backend.uow.commit()
+
+    assert [p.name for p in backend.products.search("widget")] == \
+           ["Blue Widget", "Widget gadget"]
+
+
+def test_product_search_ranks_all_active_matches(backend):
+    backend.products.add_many(
+        [Product(id=None, name=f"Widget old {i}", quantity=1, price=1.0, is_active=False)
+         for i in range(1000)]
+        + [Product(id=None, name=f"Widget spare {i}", quantity=1, price=1.0) for i in range(1200)]
+        + [Product(id=None, name="Widget", quantity=1, price=1.0)])
+    backend.uow.commit()
+
+    assert [p.name for p in backend.products.search("widget", limit=2)] == \
+           ["Widget", "Widget spare 0"]
+    assert [p.name for p in backend.products.search("widget", offset=1200)] == \
+           ["Widget spare 1199"]
+    assert [p.name for p in backend.products.search("widget old")] == []
+
+
+def test_change_feeds(backend):
+    products = _add_products(backend, 10, 10, 10)
+    order = Order(id=None, address="Address", products=products[:1])
+    backend.orders.add(order)
+    backend.uow.commit()
+    # Feeds skip the current second.
+    assert list(backend.products.changes_since(ChangeWatermark())) == []
+    backend.pass_time(2)
+
+    batches = list(backend.products.changes_since(ChangeWatermark(), batch_size=2))
+    assert [[change.product.id for change in batch] for batch in batches] == [[1, 2], [3]]
+    watermark = batches[-1][-1].watermark
+    assert list(backend.products.changes_since(watermark)) == []
+    [[change]] = backend.orders.changes_since(ChangeWatermark())
+    assert (change.order_id, change.is_deleted, len(change.order.lines)) == (order.id, False, 1)
+
+    products[1].price = 2.0
+    backend.products.update(products[1])
+    backend.orders.delete(order.id)
+    backend.uow.commit()
+    backend.pass_time(1)
+
+    [[change]] = backend.products.changes_since(watermark)
+    assert (change.product.id, change.product.price) == (2, 2.0)
+    [[tombstone]] = backend.orders.changes_since(ChangeWatermark())
+    assert (tombstone.order_id, tombstone.is_deleted, tombstone.order) == (order.id, True, None)
@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import sessionmaker
+from domain.exceptions import OutOfStockError
+from domain.services import WarehouseService
+from infrastructure.database import create_warehouse_engine
+from infrastructure.migrations import migrate
+from infrastructure.repositories import SqlAlchemyOrderRepository, SqlAlchemyProductRepository
+from infrastructure.unit_of_work import SqlAlchemyUnitOfWork
+
+THREADS = 8
+ATTEMPTS = 400
+STOCK = 150
+
+
+def _service(session):
+    return WarehouseService(SqlAlchemyProductRepository(session),
+                            SqlAlchemyOrderRepository(session),
+                            SqlAlchemyUnitOfWork(session))
+
+
+def test_concurrent_orders_never_oversell(tmp_path):
+    engine = create_warehouse_engine(f"sqlite:///{tmp_path / 'warehouse.db'}",
+                                     pool_size=THREADS)
+    migrate(engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as session:
+        scarce = _service(session).create_product("Scarce", STOCK, 10)
+        plenty = _service(session).create_product("Plenty", STOCK * 10, 1)
+
+    def place_order(_):
+        with session_factory() as session:
+            try:
+                _service(session).create_order([scarce.id, plenty.id], "Test Address")
+                return True
+            except OutOfStockError:
+                return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = list(executor.map(place_order, range(ATTEMPTS)))
+    elapsed = time.perf_counter() - started
+
+    with session_factory() as session:
+        service = _service(session)
+        assert results.count(True) == STOCK
+        assert service.get_product(scarce.id).quantity == 0
+        assert service.get_product(plenty.id).quantity == STOCK * 9
+        assert len(service.list_orders()) == STOCK
+    engine.dispose()
+    print(f"\n{ATTEMPTS} order attempts from {THREADS} threads: "
+          f"{ATTEMPTS / elapsed:.0f} orders/sec")
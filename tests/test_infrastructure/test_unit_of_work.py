@@ -0,0 +1,100 @@
+import re
+import pytest
+from domain.models import Product
+from infrastructure.repositories import SqlAlchemyProductRepository
+from infrastructure.unit_of_work import get_change_tracker
+
+
+@pytest.fixture
+def session(test_session):
+    # The service works on the in-memory session the statements are recorded on.
+    return test_session
+
+
+def _writes(statements):
+    return [" ".join(re.match(r"(INSERT|UPDATE|DELETE)(?: INTO| FROM)? (\w+)", s).groups())
+            for s in statements if not s.startswith("SELECT")]
+
+
+def test_update_product_writes_only_changed_columns(service, statements):
+    product = service.create_product("P1", 5, 10)
+
+    statements.clear()
+    service.update_product(product.id, price=12)
+
+    updates = [s for s in statements if s.startswith("UPDATE")]
+    assert len(updates) == 1
+    assert "SET price=?" in updates[0] and "name" not in updates[0]
+    assert service.get_product(product.id).price == 12
+
+
+def test_unchanged_product_is_not_written(service, statements):
+    product = service.create_product("P1", 5, 10)
+
+    statements.clear()
+    service.update_product(product.id, price=10)
+
+    assert not [s for s in statements if s.startswith("UPDATE")]
+
+
+def test_order_changes_are_batched(service, statements):
+    products = [service.create_product(f"P{i}", 100, 10) for i in range(4)]
+    order_id = service.create_order([products[0].id, products[1].id, products[1].id], "Address").id
+    order = service.order_repo.get(order_id)
+
+    statements.clear()
+    order.add_product(products[2], 2)
+    order.add_product(products[3])
+    order.remove_product(products[0].id)
+    order.lines[products[1].id].quantity = 5
+    service.order_repo.update(order)
+    service.uow.commit()
+
+    assert _writes(statements) == ["DELETE order_product_associations",
+                                   "UPDATE order_product_associations",
+                                   "INSERT order_product_associations",
+                                   "UPDATE orders"]
+    retrieved = service.get_order(order.id)
+    assert {pid: line.quantity for pid, line in retrieved.lines.items()} == \
+           {products[1].id: 5, products[2].id: 2, products[3].id: 1}
+
+
+def test_delete_order_waits_for_commit(service):
+    product = service.create_product("P1", 5, 10)
+    order = service.create_order([product.id], "Address")
+
+    service.order_repo.delete(order.id)
+    service.uow.rollback()
+    assert [o.id for o in service.list_orders()] == [order.id]
+
+    service.delete_order(order.id)
+    assert service.list_orders() == []
+
+
+def test_reads_see_pending_changes(test_session):
+    repo = SqlAlchemyProductRepository(test_session)
+    product = Product(id=None, name="P1", quantity=5, price=10)
+    repo.add(product)
+
+    product.quantity = 7
+    repo.update(product)
+
+    assert repo.get(product.id).quantity == 7
+
+
+def test_only_marked_objects_are_pending(test_session, statements):
+    repo = SqlAlchemyProductRepository(test_session)
+    product = Product(id=None, name="P1", quantity=5, price=10)
+    repo.add(product)
+    test_session.commit()
+    product = repo.get(product.id)
+    tracker = get_change_tracker(test_session)
+
+    product.quantity = 7
+    assert not tracker.has_changes
+    repo.update(product)
+    assert tracker.has_changes
+    statements.clear()
+    test_session.commit()
+    assert _writes(statements) == ["UPDATE products"]
+    assert not get_change_tracker(test_session).has_changes
@@ -0,0 +1,154 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+from main import WarehouseConsoleUI, main
+
+
+@pytest.fixture
+def cli(tmp_path, capsys):
+    database = f"sqlite:///{tmp_path / 'warehouse.db'}"
+
+    def run(*argv):
+        code = main(["--database", database, *argv])
+        captured = capsys.readouterr()
+        output = captured.err if code else captured.out
+        lines = [json.loads(line) for line in output.splitlines()]
+        return code, lines[0] if len(lines) == 1 and argv[0] != "changes" else lines
+    run.database = database
+    return run
+
+
+def test_product_and_order_commands(cli):
+    assert cli("product", "add", "P1", "5", "2.5") == \
+           (0, {"id": 1, "name": "P1", "quantity": 5, "price": 2.5, "is_active": True})
+    cli("product", "add", "P2", "1", "10")
+
+    code, order = cli("order", "create", "1", "1", "2", "--address", "Main st")
+    assert code == 0
+    assert [(line["product_id"], line["quantity"]) for line in order["lines"]] == [(1, 2), (2, 1)]
+
+    code, order = cli("order", "remove-product", str(order["id"]), "1", "--quantity", "1")
+    assert [(line["product_id"], line["quantity"]) for line in order["lines"]] == [(1, 1), (2, 1)]
+
+    assert cli("product", "get", "1")[1]["quantity"] == 4
+    assert [o["id"] for o in cli("order", "list")[1]] == [order["id"]]
+    assert cli("order", "delete", str(order["id"])) == (0, {"deleted": order["id"]})
+    assert cli("order", "list") == (0, [])
+
+
+def test_errors_are_reported_as_json(cli):
+    cli("product", "add", "P1", "1", "2.5")
+
+    assert cli("order", "create", "1", "1", "--address", "A") == \
+           (1, {"error": "Not enough stock for products with ids [1]"})
+    assert cli("order", "get", "7") == (1, {"error": "Order 7 not found"})
+
+
+def test_changes_command_resumes_from_saved_position(cli):
+    cli("product", "add", "P1", "5", "2.5")
+    cli("order", "create", "1", "--address", "A")
+    cli("order", "delete", "1")
+    with create_engine(cli.database).begin() as connection:
+        for table in ("products", "orders"):
+            connection.execute(text(f"UPDATE {table} SET update_datetime = "
+                                    f"datetime(update_datetime, '-1 hour')"))
+
+    code, changes = cli("changes", "orders", "--consumer", "bi")
+    assert code == 0
+    assert [(c["id"], c["is_deleted"]) for c in changes] == [(1, True)]
+    assert cli("changes", "orders", "--consumer", "bi") == (0, [])
+    assert [c["id"] for c in cli("changes", "products", "--consumer", "bi")[1]] == [1]
+
+
+def test_product_adjust_command(cli, tmp_path):
+    cli("product", "add", "Bolt", "10", "2")
+    cli("product", "add", "Nut", "4", "1")
+
+    code, preview = cli("product", "adjust", "--name-prefix", "bo", "--percent", "50",
+                        "--stock-delta", "-4", "--dry-run")
+    assert code == 0
+    assert {key: preview[key] for key in ("products", "units_after", "value_after")} == \
+           {"products": 1, "units_after": 6, "value_after": 18.0}
+    assert cli("product", "get", "1")[1]["price"] == 2
+    assert cli("product", "adjust", "--name-prefix", "bo", "--percent", "50")[1]["updated"] == 1
+    assert cli("product", "get", "1")[1]["price"] == 3
+
+    adjustments = tmp_path / "adjustments.csv"
+    adjustments.write_text("product_id,price_amount,quantity_delta\n2,0.5,\n1,,-20\n")
+    assert cli("product", "adjust", "--file", str(adjustments))[1]["updated"] == 2
+    assert [(p["quantity"], p["price"]) for p in cli("product", "list")[1]] == [(0, 3), (4, 1.5)]
+
+
+def test_order_summaries_and_totals_check(cli, capsys):
+    cli("product", "add", "P1", "5", "2.5")
+    cli("order", "create", "1", "1", "--address", "A")
+
+    code, [summary] = cli("order", "summaries")
+    assert code == 0
+    assert (summary["id"], summary["total_amount"], summary["line_count"]) == (1, 5.0, 1)
+    with create_engine(cli.database).begin() as connection:
+        connection.execute(text("UPDATE orders SET total_amount = 0"))
+
+    assert main(["--database", cli.database, "check-order-totals", "--rebuild"]) == 0
+    assert json.loads(capsys.readouterr().out)["mismatched"] == [1]
+    assert cli("order", "summaries")[1][0]["total_amount"] == 5.0
+
+
+def test_archive_orders_command(cli, tmp_path, capsys):
+    archive = ["--archive", str(tmp_path / "archive.db")]
+    cli("product", "add", "P1", "5", "2.5")
+    for _ in range(3):
+        cli("order", "create", "1", "--address", "A")
+    with create_engine(cli.database).begin() as connection:
+        connection.execute(text("UPDATE orders SET update_datetime = "
+                                "datetime(update_datetime, '-2 days')"))
+
+    assert main(["--database", cli.database, *archive, "archive-orders",
+                 "--older-than-days", "1"]) == 0
+    assert capsys.readouterr().out.startswith("Archived 2 orders")
+    assert [o["id"] for o in cli("order", "list")[1]] == [3]
+    assert [o["id"] for o in cli(*archive, "order", "list", "--include-archived")[1]] == [1, 2, 3]
+    assert cli(*archive, "order", "get", "1", "--include-archived")[1]["address"] == "A"
+    assert cli("order", "get", "1") == (1, {"error": "Order 1 not found"})
+
+
+def test_export_command(cli, tmp_path):
+    cli("product", "add", "P1", "5", "2.5")
+    with create_engine(cli.database).begin() as connection:
+        connection.execute(text("UPDATE products SET update_datetime = "
+                                "datetime(update_datetime, '-1 hour')"))
+
+    code, report = cli("export", str(tmp_path / "export"), "--format", "npy")
+    assert code == 0
+    assert (report["format"], report["rows"]) == ("npy", 1)
+    assert report["tables"][0]["rows_per_second"] > 0
+    assert cli("export", str(tmp_path / "export"))[0] == 1
+    assert cli("export", str(tmp_path / "export"), "--incremental")[1]["rows"] == 0
+
+
+def test_import_does_not_load_sqlalchemy():
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, main; print('sqlalchemy' in sys.modules)"],
+        capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "False"
+
+
+def test_console_reports_stock_errors_and_keeps_running(service, monkeypatch, capsys):
+    product = service.create_product("Bolt", 2, 2.5)
+    order = service.create_order([product.id], "Main st")
+    answers = iter(["3", str(product.id), str(product.id), "done", "Side st",
+                    "5", str(order.id), "1", str(product.id), "500",
+                    "3", "7", "done", "Side st",
+                    "0"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+
+    WarehouseConsoleUI(service).show_menu()
+
+    output = capsys.readouterr().out
+    assert output.count(f"Not enough stock for products with ids [{product.id}]") == 2
+    assert "Products with ids [7] not found" in output
+    assert "Please enter a valid number" not in output
+    assert output.rstrip().endswith("Exiting...")